@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+""" benchmarks/bench_compression.py
+
+Reports the write time, file size and readback time of the `ep1` mask for each ADIOS2 compression
+operator supported by the local ADIOS2 build, on the two foil mask of `run.py` over a reduced
+version of the production mesh. The readback reads the complete field in one call, as x3d2 does.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_compression --ratio 2
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src import geometry
+from src import mask
+from src import writer
+
+def size_of(path):
+    """Returns the size in bytes of an ADIOS2 file or directory."""
+
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(path) for f in files)
+
+def foils(mesh_l):
+    """Returns the two NACA 0012 foils placed as in `run.py`."""
+
+    chord = 10.0
+    span = 20.0
+    centre = np.array(mesh_l) / 2
+    offset = np.array([-13.244, 29.2215, 0.0])
+
+    shapes = []
+    for c in [centre - offset / 2, centre + offset / 2]:
+        shapes.append(geometry.Foil("0012", chord, span, c - [chord / 2, 0, span / 2]))
+
+    return geometry.Union(*shapes)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ADIOS2 compression operators")
+    parser.add_argument("--ratio", type=int, default=2, help="coarsening ratio of the mesh")
+    parser.add_argument("--operators", nargs="+",
+                        default=[op for op in writer.OPERATORS if op not in writer.LOSSY],
+                        help="operators to benchmark (the lossy operators leave the mask "
+                        "uncompressed)")
+    parser.add_argument("--dir", default=None, help="directory to write the files in")
+    args = parser.parse_args()
+
+    mesh_n = [int(a / args.ratio) for a in [697, 1878, 429]]
+    mesh_l = [60.11421911, 161.97202797, 37.0]
+    shape = [mesh_n[2], mesh_n[1], mesh_n[0]]
+
+    ibm = geometry.embed(foils(mesh_l), mesh_n, mesh_l, dtype=np.uint8)
+    print(f"Mesh: {mesh_n}, solid points: {np.count_nonzero(ibm == 0)}")
+    print(f"{'operator':>10} {'write (s)':>10} {'size (MiB)':>11} {'ratio':>8} {'read (s)':>9} "
+          f"{'max error':>10}")
+
+    tmp = tempfile.mkdtemp(dir=args.dir)
+    try:
+        raw = None
+        for op in [None] + args.operators:
+            name = "none" if op is None else op
+            if op is not None and not writer.operator_available(op):
+                print(f"{name:>10} {'not available in this ADIOS2 build':>50}")
+                continue
+
+            filename = os.path.join(tmp, f"ibm_{name}.bp")
+            t0 = time.perf_counter()
+            writer.write_mask(filename, mask.chunks(ibm), shape, compression=op)
+            t_write = time.perf_counter() - t0
+
+            size = size_of(filename)
+            raw = size if raw is None else raw
+
+            if writer.adios2_new_api:
+                t0 = time.perf_counter()
+                ep1 = writer.read_mask(filename)
+                t_read = f"{time.perf_counter() - t0:>9.3f}"
+                error = f"{np.abs(ep1 - ibm).max():>10.2e}"
+            else:
+                t_read = f"{'n/a':>9}"
+                error = f"{'n/a':>10}"
+
+            print(f"{name:>10} {t_write:>10.3f} {size / 1024**2:>11.2f} {raw / size:>8.1f} "
+                  f"{t_read} {error}")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+""" benchmarks/bench_embed.py
+
+Compares the vectorized embedding against the original point-by-point loop on a reduced version
+of the production mesh in `run.py`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_embed --ratio 4
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from src import embed_stl
+from tests.helpers import embed_reference, ellipsoid
+
+def timed(f, *args):
+    t0 = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized embedding")
+    parser.add_argument("--ratio", type=int, default=4, help="coarsening ratio of the mesh")
+    parser.add_argument("--resolution", type=int, default=100, help="voxels along z")
+    args = parser.parse_args()
+
+    mesh_n = [int(a / args.ratio) for a in [697, 1878, 429]]
+    mesh_l = [60.11421911, 161.97202797, 37.0]
+
+    # A foil-sized object covering a large fraction of the domain height
+    dims = np.array([20.0, 6.0, 30.0])
+    n = np.ceil(np.flip(dims) / dims[2] * args.resolution).astype(int)
+    vox = ellipsoid(n, np.flip(n) / dims, -dims / 2)
+    centre = np.array(mesh_l) / 2
+
+    print(f"Mesh: {mesh_n}, voxels: {vox.count()}")
+    ref, t_ref = timed(embed_reference, vox, mesh_n, mesh_l, centre)
+    ibm, t_vec = timed(embed_stl.embed, vox, mesh_n, mesh_l, centre)
+
+    assert np.array_equal(ibm, ref)
+    print(f"loop:       {t_ref:10.4f} s")
+    print(f"vectorized: {t_vec:10.4f} s")
+    print(f"speedup:    {t_ref / t_vec:10.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+""" benchmarks/bench_embed_parallel.py
+
+Reports the scaling of the multi-process embedding from 1 up to 16 workers (limited by the number
+of available cores) on a reduced version of the production mesh in `run.py`.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_embed_parallel --ratio 2
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from src import embed_stl
+from tests.helpers import ellipsoid
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the parallel embedding")
+    parser.add_argument("--ratio", type=int, default=2, help="coarsening ratio of the mesh")
+    parser.add_argument("--resolution", type=int, default=200, help="voxels along z")
+    parser.add_argument("--max-workers", type=int, default=16, help="largest pool size")
+    args = parser.parse_args()
+
+    mesh_n = [int(a / args.ratio) for a in [697, 1878, 429]]
+    mesh_l = [60.11421911, 161.97202797, 37.0]
+
+    dims = np.array([20.0, 6.0, 30.0])
+    n = np.ceil(np.flip(dims) / dims[2] * args.resolution).astype(int)
+    vox = ellipsoid(n, np.flip(n) / dims, -dims / 2)
+    centre = np.array(mesh_l) / 2
+
+    ncores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    workers = [w for w in [1, 2, 4, 8, 16] if w <= min(args.max_workers, ncores)]
+
+    print(f"Mesh: {mesh_n}, voxels: {vox.count()}, cores: {ncores}")
+    print(f"{'workers':>8} {'time (s)':>10} {'speedup':>8} {'efficiency':>10}")
+    serial = None
+    t1 = None
+    for w in workers:
+        t0 = time.perf_counter()
+        ibm = embed_stl.embed(vox, mesh_n, mesh_l, centre, workers=w)
+        t = time.perf_counter() - t0
+
+        if serial is None:
+            serial = ibm
+            t1 = t
+        assert ibm.tobytes() == serial.tobytes()
+        print(f"{w:>8} {t:>10.4f} {t1 / t:>8.2f} {t1 / t / w:>10.2f}")
+
+if __name__ == "__main__":
+    main()
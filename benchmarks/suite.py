@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+""" benchmarks/suite.py
+
+Times the hot paths of the mask generation on synthetic geometries at several scales and records
+the peak resident set size of each benchmark. The results are written as JSON so that runs on
+different commits can be compared.
+
+Each benchmark runs in its own forked process so that its peak RSS is not hidden by the memory
+used by earlier benchmarks. The setup of a benchmark (building the fixtures) is not timed, the
+benchmark itself is repeated and the minimum and median times are reported.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --scale small medium --output base.json
+    python -m benchmarks.suite --scale small medium --output new.json --compare base.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from src import convert_stl
+from src import cylinder
+from src import embed_stl
+from src import mask
+from src import writer
+from tests.helpers import ellipsoid, write_stl
+
+# Reduction of the production mesh of `run.py`, the number of voxels along z of the synthetic
+# voxel object and the number of points queried at each scale
+SCALES = {
+    "small": {"ratio": 16, "resolution": 50, "points": 10_000},
+    "medium": {"ratio": 8, "resolution": 100, "points": 100_000},
+    "large": {"ratio": 4, "resolution": 200, "points": 1_000_000},
+}
+
+MESH_N = [697, 1878, 429]
+MESH_L = [60.11421911, 161.97202797, 37.0]
+
+# Size of the synthetic foil-sized objects
+DIMS = np.array([20.0, 6.0, 30.0])
+
+# Registered benchmarks, see `benchmark`
+BENCHMARKS = {}
+
+def benchmark(f):
+    """Registers a benchmark.
+
+    The function takes the scale parameters and a temporary directory, builds its fixtures and
+    returns the function to time together with the number of items it processes.
+    """
+
+    BENCHMARKS[f.__name__] = f
+    return f
+
+def mesh(params):
+    """Returns the reduced production mesh of a scale."""
+
+    return [int(n / params["ratio"]) for n in MESH_N], MESH_L
+
+def voxels(params):
+    """Returns a voxelised ellipsoid with `resolution` voxels along z."""
+
+    n = np.ceil(np.flip(DIMS) / DIMS[2] * params["resolution"]).astype(int)
+    return ellipsoid(n, np.flip(n) / DIMS, -DIMS / 2)
+
+def sphere_triangles(n):
+    """Returns the triangles of a UV sphere of unit radius with `n` rings, scaled to DIMS."""
+
+    theta = np.linspace(0, np.pi, n + 1)
+    phi = np.linspace(0, 2 * np.pi, 2 * n + 1)
+    t, p = np.meshgrid(theta, phi, indexing="ij")
+    points = np.stack([np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)], axis=-1)
+    points = points * DIMS / 2
+
+    a = points[:-1, :-1].reshape(-1, 3)
+    b = points[1:, :-1].reshape(-1, 3)
+    c = points[1:, 1:].reshape(-1, 3)
+    d = points[:-1, 1:].reshape(-1, 3)
+
+    return np.concatenate([np.stack([a, b, c], axis=1), np.stack([a, c, d], axis=1)])
+
+def query_points(vox, count, seed=0):
+    """Returns `count` random [x,y,z] points in the bounding box of the voxels."""
+
+    lo, hi = vox.bounding_box()
+    return np.random.default_rng(seed).uniform(lo, hi, size=(count, 3))
+
+@benchmark
+def convert(params, tmp):
+    stl_file = os.path.join(tmp, "sphere.stl")
+    write_stl(stl_file, sphere_triangles(32))
+    resolution = params["resolution"]
+
+    return lambda: convert_stl.convert(stl_file, resolution, cache=False), resolution**3
+
+@benchmark
+def query(params, tmp):
+    vox = voxels(params)
+    xyz = query_points(vox, params["points"] // 10)
+
+    def run():
+        for p in xyz:
+            vox.query(p)
+
+    return run, len(xyz)
+
+@benchmark
+def query_many(params, tmp):
+    vox = voxels(params)
+    xyz = query_points(vox, params["points"])
+
+    return lambda: vox.query_many(xyz), len(xyz)
+
+@benchmark
+def embed(params, tmp):
+    vox = voxels(params)
+    mesh_n, mesh_l = mesh(params)
+    centre = np.array(mesh_l) / 2
+
+    return (lambda: embed_stl.embed(vox, mesh_n, mesh_l, centre, dtype=np.uint8),
+            int(np.prod(mesh_n)))
+
+@benchmark
+def gencyl(params, tmp):
+    mesh_n, mesh_l = mesh(params)
+    n = list(np.flip(mesh_n))
+    dxyz = [l / (m - 1) for m, l in zip(np.flip(mesh_n), np.flip(mesh_l))]
+    origin = np.flip(mesh_l) / 2
+
+    return (lambda: cylinder.gencyl(dxyz, n, 5.0, origin, [1, 1, 2], dtype=np.uint8),
+            int(np.prod(mesh_n)))
+
+@benchmark
+def write(params, tmp):
+    vox = voxels(params)
+    mesh_n, mesh_l = mesh(params)
+    ibm = embed_stl.embed(vox, mesh_n, mesh_l, np.array(mesh_l) / 2, dtype=np.uint8)
+    filename = os.path.join(tmp, "ibm.bp")
+
+    def run():
+        writer.write_mask(filename, mask.chunks(ibm), ibm.shape)
+        shutil.rmtree(filename, ignore_errors=True)
+
+    return run, ibm.size
+
+def peak_rss():
+    """Returns the peak resident set size of the process in MiB."""
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(name, scale, repeat, conn):
+    """Runs a benchmark in a forked process, sending its results through `conn`."""
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as null:
+        with contextlib.redirect_stdout(null):
+            f, items = BENCHMARKS[name](SCALES[scale], tmp)
+            baseline = peak_rss()
+
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                f()
+                times.append(time.perf_counter() - t0)
+
+    conn.send({"times": times, "items": items, "peak_rss_mib": peak_rss(),
+               "rss_increase_mib": peak_rss() - baseline})
+    conn.close()
+
+def run(names, scales, repeat=3):
+    """Runs the benchmarks at the given scales, returning the list of results."""
+
+    ctx = multiprocessing.get_context("fork")
+
+    results = []
+    for scale in scales:
+        for name in names:
+            recv, send = ctx.Pipe(duplex=False)
+            p = ctx.Process(target=measure, args=(name, scale, repeat, send))
+            p.start()
+            send.close()
+            try:
+                result = recv.recv()
+            except EOFError:
+                result = None
+            p.join()
+
+            if result is None:
+                print(f"{name:>12} {scale:>8} failed with exit code {p.exitcode}")
+                continue
+
+            result.update(name=name, scale=scale, params=SCALES[scale],
+                          min=min(result["times"]), median=float(np.median(result["times"])))
+            print(f"{name:>12} {scale:>8} {result['min']:>10.4f} {result['median']:>10.4f} "
+                  f"{result['peak_rss_mib']:>10.1f} {result['rss_increase_mib']:>10.1f}")
+            results.append(result)
+
+    return results
+
+def environment():
+    """Describes the machine and commit the benchmarks ran on."""
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "adios2_new_api": writer.adios2_new_api,
+    }
+
+def compare(results, baseline, threshold):
+    """Prints the change in time and peak RSS against a baseline run.
+
+    Returns the number of benchmarks whose minimum time grew by more than `threshold`.
+    """
+
+    base = {(r["name"], r["scale"]): r for r in baseline["results"]}
+    print(f"\nCompared to {baseline['environment']['commit']}:")
+
+    regressions = 0
+    for r in results:
+        b = base.get((r["name"], r["scale"]))
+        if b is None:
+            continue
+
+        time_ratio = r["min"] / b["min"]
+        rss_ratio = r["peak_rss_mib"] / b["peak_rss_mib"]
+        flag = ""
+        if time_ratio > threshold:
+            flag = "  slower"
+            regressions += 1
+        print(f"{r['name']:>12} {r['scale']:>8} time x{time_ratio:>6.2f} rss x{rss_ratio:>6.2f}{flag}")
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the performance benchmark suite")
+    parser.add_argument("--scale", nargs="+", choices=list(SCALES), default=["small"],
+                        help="scales to run the benchmarks at")
+    parser.add_argument("--bench", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    parser.add_argument("--compare", default=None, help="JSON file of a baseline run")
+    parser.add_argument("--threshold", type=float, default=1.1,
+                        help="time ratio above which a benchmark is reported as slower")
+    args = parser.parse_args()
+
+    print(f"{'benchmark':>12} {'scale':>8} {'min (s)':>10} {'median (s)':>10} {'peak (MiB)':>10} "
+          f"{'grew (MiB)':>10}")
+    results = run(args.bench, args.scale, args.repeat)
+
+    report = {"environment": environment(), "results": results}
+    if args.output is not None:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        if compare(results, baseline, args.threshold) > 0:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
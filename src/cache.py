@@ -0,0 +1,126 @@
+""" src/cache.py
+
+Module implementing a persistent on-disk cache of voxelised STL files.
+
+Entries are keyed by a hash of the STL file contents, the voxel resolution and the stl-to-voxel
+version, and store the `vol`, `scale` and `shift` arrays as `.npy` files. The voxel volume is
+memory-mapped when loaded. The total size of the cache is capped, the least recently used entries
+are evicted first.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from importlib import metadata
+
+import numpy as np
+
+from . import voxel
+
+# Default location and size cap of the cache, overridden by the PY4X3D2_CACHE_DIR and
+# PY4X3D2_CACHE_SIZE (bytes) environment variables
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "py4x3d2")
+DEFAULT_SIZE = 4 * 1024**3
+
+_FIELDS = ("vol", "scale", "shift")
+
+def cache_dir():
+    """Returns the cache directory."""
+
+    return os.environ.get("PY4X3D2_CACHE_DIR", DEFAULT_DIR)
+
+def cache_size():
+    """Returns the maximum size of the cache in bytes."""
+
+    return int(os.environ.get("PY4X3D2_CACHE_SIZE", DEFAULT_SIZE))
+
+def stltovoxel_version():
+    try:
+        return metadata.version("stl-to-voxel")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+def key(stl_file, resolution):
+    """Computes the cache key of an STL file voxelised at `resolution`."""
+
+    h = hashlib.sha256()
+    with open(stl_file, "rb") as f:
+        for block in iter(lambda: f.read(1024**2), b""):
+            h.update(block)
+    h.update(f"resolution={resolution!r};stl-to-voxel={stltovoxel_version()}".encode())
+
+    return h.hexdigest()
+
+def load(k, directory=None):
+    """Loads the voxels stored under key `k`, returning None if there is no entry.
+
+    The voxel volume is memory-mapped read-only.
+    """
+
+    entry = os.path.join(directory or cache_dir(), k)
+    try:
+        vol, scale, shift = (np.load(os.path.join(entry, f + ".npy"),
+                                     mmap_mode="r" if f == "vol" else None)
+                             for f in _FIELDS)
+        # Mark the entry as recently used
+        os.utime(entry)
+    except (FileNotFoundError, ValueError):
+        # The entry is missing, partial or was evicted by another process
+        return None
+
+    return voxel.Voxels(vol, scale, shift)
+
+def store(k, voxels, directory=None, max_bytes=None):
+    """Stores the voxels under key `k` and evicts old entries to respect the size cap."""
+
+    directory = directory or cache_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    # Write to a temporary directory first so that readers never see a partial entry
+    tmp = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+    try:
+        for f in _FIELDS:
+            np.save(os.path.join(tmp, f + ".npy"), np.asarray(getattr(voxels, f)))
+        os.replace(tmp, os.path.join(directory, k))
+    except OSError:
+        # Another process stored the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    evict(directory, cache_size() if max_bytes is None else max_bytes)
+
+def entries(directory=None):
+    """Lists the cache entries as (key, size in bytes, last use time), most recent first."""
+
+    directory = directory or cache_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    result = []
+    for k in os.listdir(directory):
+        entry = os.path.join(directory, k)
+        if k.startswith(".") or not os.path.isdir(entry):
+            continue
+        size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+        result.append((k, size, os.path.getmtime(entry)))
+
+    return sorted(result, key=lambda e: e[2], reverse=True)
+
+def evict(directory=None, max_bytes=None):
+    """Removes the least recently used entries until the cache fits in `max_bytes`."""
+
+    directory = directory or cache_dir()
+    max_bytes = cache_size() if max_bytes is None else max_bytes
+
+    total = 0
+    for k, size, _ in entries(directory):
+        total += size
+        if total > max_bytes:
+            shutil.rmtree(os.path.join(directory, k), ignore_errors=True)
+
+def clear(directory=None):
+    """Removes all cache entries."""
+
+    directory = directory or cache_dir()
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
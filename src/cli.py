@@ -0,0 +1,545 @@
+""" src/cli.py
+
+The py4x3d2 command line interface, run as `./py4x3d2` or `python -m src.cli`:
+
+    py4x3d2 stl front_foil.stl --mesh-n 697 1878 429 --mesh-l 60.11 161.97 37.0 --ratio 4
+    py4x3d2 cylinder --mesh-n 64 64 64 --spacing 0.1 0.1 0.1 --radius 0.5 --axis 0 0 1
+    py4x3d2 sweep sweep.toml --workers 8
+    py4x3d2 stl --config case.toml --dry-run
+    py4x3d2 inspect ibm.bp
+    py4x3d2 diff old.bp ibm.bp
+
+The settings of the stl and cylinder subcommands are read from the table named after the subcommand
+(or the top level) of a TOML, YAML or JSON `--config` file, using the names of the flags with
+underscores, and the flags given on the command line override them. The sweep subcommand reads its
+settings from the top level of the sweep file, see `src/sweep.py`. `--dry-run` validates and prints
+the resolved settings without generating anything. The inspect and diff subcommands summarise and
+compare existing mask files, see `src/inspect_mask.py`, exiting with status 1 when a mask holds
+values other than 0 and 1 or the masks differ.
+
+Only the standard library is imported until a subcommand runs, numpy, ADIOS2 and the STL libraries
+are imported by the subcommands that need them. This keeps `--help` and `--dry-run` to a fraction
+of a second, which matters when launching many jobs.
+"""
+
+import argparse
+import json
+import sys
+
+from . import config
+
+# Sparse encodings of `writer.ENCODINGS` and the mask types of `mask.ones`
+ENCODINGS = ("dense", "bitmask", "rle")
+DTYPES = ("float64", "uint8", "bool", "packed")
+
+class Option:
+    def __init__(self, name, default=None, type=str, count=None, choices=None, const=None,
+                 positive=False, required=False, positional=False, matrix=False, metavar=None,
+                 help=None):
+        """A setting of a subcommand.
+
+        The setting is given as `name` in a config file or as `--name` (with dashes) on the command
+        line. A list setting has one of the lengths in `count` (e.g. (3,) for [x,y,z]), or any
+        length with "+". Settings whose lengths include 1 also accept a single value. A setting
+        with a `const` may be given as a flag without a value. A `matrix` setting of length 3 also
+        accepts a 3x3 matrix in a config file. Settings of `type` bool are turned on and off with
+        `--name` and `--no-name`.
+        """
+
+        self.name = name
+        self.default = default
+        self.type = type
+        self.count = count
+        self.choices = choices
+        self.const = const
+        self.positive = positive
+        self.required = required
+        self.positional = positional
+        self.matrix = matrix
+        self.metavar = metavar
+        self.help = help
+
+    def add_argument(self, parser):
+        kwargs = {"default": argparse.SUPPRESS, "help": self.help}
+        if self.default not in (None, False) and self.help is not None:
+            kwargs["help"] = f"{self.help} (default {_format(self.default)})"
+
+        if self.type is bool:
+            kwargs["action"] = argparse.BooleanOptionalAction
+        else:
+            kwargs.update(type=self.type, choices=self.choices, metavar=self.metavar)
+            if self.count == "+":
+                kwargs["nargs"] = "+"
+            elif self.count is not None:
+                kwargs["nargs"] = self.count[0] if len(self.count) == 1 else "+"
+            elif self.const is not None or self.positional:
+                kwargs.update(nargs="?", const=self.const)
+
+        if self.positional:
+            parser.add_argument(self.name, **kwargs)
+        else:
+            parser.add_argument(f"--{self.name.replace('_', '-')}", dest=self.name, **kwargs)
+
+    def check(self, value):
+        """Validates and normalises a value of the setting, raising ValueError if it is invalid."""
+
+        if value is None:
+            if self.required or self.default is not None:
+                raise ValueError("a value is required")
+            return None
+
+        if self.count is None:
+            return self._check_one(value)
+
+        if not isinstance(value, (list, tuple)):
+            if self.count != "+" and 1 not in self.count:
+                raise ValueError(f"expected a list of {_lengths(self.count)} values, got {value!r}")
+            return self._check_one(value)
+
+        if self.matrix and len(value) == 3 and all(isinstance(v, (list, tuple)) for v in value):
+            if any(len(row) != 3 for row in value):
+                raise ValueError("expected a 3x3 matrix")
+            return [[self._check_one(v) for v in row] for row in value]
+
+        if self.count != "+" and len(value) not in self.count:
+            raise ValueError(f"expected {_lengths(self.count)} values, got {len(value)}")
+        if self.count != "+" and len(value) == 1:
+            return self._check_one(value[0])
+
+        return [self._check_one(v) for v in value]
+
+    def _check_one(self, value):
+        if self.type is bool:
+            if not isinstance(value, bool):
+                raise ValueError(f"expected true or false, got {value!r}")
+        elif self.type is int:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f"expected an integer, got {value!r}")
+        elif self.type is float:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"expected a number, got {value!r}")
+            value = float(value)
+        elif not isinstance(value, str):
+            raise ValueError(f"expected a string, got {value!r}")
+
+        if self.choices is not None and value not in self.choices:
+            raise ValueError(f"expected one of {', '.join(self.choices)}, got {value!r}")
+        if self.positive and not value > 0:
+            raise ValueError(f"expected a positive value, got {value!r}")
+
+        return value
+
+def _format(value):
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return str(value)
+
+def _lengths(count):
+    return " or ".join(str(c) for c in count)
+
+STL_OPTIONS = [
+    Option("stl", config.STL, positional=True, help="stl file of the foil"),
+    Option("mesh_n", config.MESH_N, int, (3,), positive=True, metavar=("NX", "NY", "NZ"),
+           help="number of points of the x3d2 mesh"),
+    Option("mesh_l", config.MESH_L, float, (3,), positive=True, metavar=("LX", "LY", "LZ"),
+           help="size of the domain"),
+    Option("ratio", 1.0, float, positive=True, help="coarsen the mesh by RATIO"),
+    Option("istret", 0, int, choices=(0, 1, 2, 3),
+           help="stretch the mesh in y as x3d2 does: refined in the centre (1), near both ends (2) "
+           "or near the bottom (3)"),
+    Option("beta", None, float, positive=True, help="stretching parameter of x3d2"),
+    Option("relative_offset", config.RELATIVE_OFFSET, float, (3,), metavar=("DX", "DY", "DZ"),
+           help="offset between the centres of the two foils"),
+    Option("rotation", None, float, (3,), matrix=True, metavar=("AX", "AY", "AZ"),
+           help="rotate both foils about their centres by these Euler angles in degrees"),
+    Option("scale", None, float, (1, 3), positive=True, metavar="S",
+           help="scale both foils about their centres, uniformly or by [x,y,z] factors"),
+    Option("engine", "voxel", choices=("voxel", "raster"),
+           help="voxelise the stl file or rasterize its triangles directly onto the mesh"),
+    Option("voxels_per_cell", 2.0, float, positive=True,
+           help="number of voxels per grid spacing when voxelising"),
+    Option("resolution", None, int, positive=True, metavar="N",
+           help="voxelise the stl file with N voxels along z, overriding --voxels-per-cell (the "
+           "original run.py used 350)"),
+    Option("cache", True, bool, help="use the voxel cache"),
+    Option("clear_cache", False, bool,
+           help="remove all entries from the voxel cache before running"),
+    Option("mpi", False, bool,
+           help="distribute the mask generation over the MPI ranks (requires mpi4py)"),
+    Option("distance", None, int, const=4, positive=True, metavar="BAND",
+           help="also write the signed distance and direction fields within BAND grid spacings of "
+           "the surface (default 4)"),
+    Option("sparse", None, choices=ENCODINGS,
+           help="only write the blocks of the mesh covered by the foils, with the given encoding, "
+           "to ibm_sparse.bp by default. x3d2 cannot load sparse masks directly"),
+    Option("compress", None, str, "+", metavar="OPERATOR",
+           help="compress the fields with the first of these ADIOS2 operators (e.g. blosc bzip2) "
+           "supported by the ADIOS2 build. The lossy zfp and sz only compress the distance fields, "
+           "the mask is then written uncompressed"),
+    Option("fraction", None, int, const=4, positive=True, metavar="SAMPLES",
+           help="write the fluid volume fraction of the cells cut by the surface, sampled with "
+           "SAMPLES sub-points per direction (default 4)"),
+    Option("bricks", None, int, const=16, positive=True, metavar="SIZE",
+           help="store the voxels as bricks of SIZE**3 voxels (default 16), skipping empty bricks "
+           "when embedding"),
+    Option("output", None, metavar="FILE",
+           help="ADIOS2 file to write the mask to (default ibm.bp, test.bp4 with ADIOS2 < 2.10, "
+           "ibm_sparse.bp with --sparse)"),
+    Option("report", None, metavar="FILE",
+           help="write the time and memory used by each stage to FILE as JSON (one FILE.<rank> "
+           "per rank with --mpi)"),
+]
+
+CYLINDER_OPTIONS = [
+    Option("mesh_n", [32, 32, 32], int, (3,), positive=True, metavar=("NX", "NY", "NZ"),
+           help="number of points of the mesh"),
+    Option("spacing", [0.1, 0.1, 0.1], float, (3,), positive=True, metavar=("DX", "DY", "DZ"),
+           help="grid spacing"),
+    Option("istret", 0, int, choices=(0, 1, 2, 3),
+           help="stretch the points along y over the same length as x3d2 does: refined in the "
+           "centre (1), near both ends (2) or near the bottom (3)"),
+    Option("beta", None, float, positive=True, help="stretching parameter of x3d2"),
+    Option("radius", None, float, positive=True, help="radius of the cylinder, none if not given"),
+    Option("origin", None, float, (3,), metavar=("X", "Y", "Z"),
+           help="point on the axis of the cylinder (default the centre of the domain)"),
+    Option("axis", [0.0, 0.0, 1.0], float, (3,), metavar=("AX", "AY", "AZ"),
+           help="direction of the axis of the cylinder"),
+    Option("dtype", "float64", choices=DTYPES, help="in-memory type of the mask"),
+    Option("iibm", 1, int, help="type of IBM"),
+    Option("distance", False, bool, help="also write the signed distance and direction fields"),
+    Option("compress", None, str, "+", metavar="OPERATOR",
+           help="compress the fields with the first available ADIOS2 operator (the masks are "
+           "written uncompressed by the lossy zfp and sz)"),
+    Option("output", "ibm.bp", metavar="FILE", help="ADIOS2 file to write the mask to"),
+    Option("report", None, metavar="FILE",
+           help="write the time and memory used by each stage to FILE as JSON"),
+]
+
+SWEEP_OPTIONS = [
+    Option("workers", 1, int, positive=True, help="number of processes generating masks"),
+    Option("output_dir", ".", metavar="DIR", help="directory to write the masks to"),
+    Option("engine", "voxel", choices=("voxel", "raster"),
+           help="voxelise the stl files or rasterize their triangles directly onto the mesh"),
+    Option("voxels_per_cell", 2.0, float, positive=True,
+           help="number of voxels per grid spacing when voxelising"),
+    Option("cache", True, bool, help="use the voxel cache"),
+    Option("compress", None, str, "+", metavar="OPERATOR",
+           help="compress the masks with the first available ADIOS2 operator (the lossy zfp and sz "
+           "leave them uncompressed)"),
+]
+
+# The arguments of `sweep.Case`
+CASE_OPTIONS = [
+    Option("name", required=True),
+    Option("mesh_n", None, int, (3,), positive=True, required=True),
+    Option("mesh_l", None, float, (3,), positive=True, required=True),
+    Option("relative_offset", None, float, (3,)),
+    Option("ratio", None, float, positive=True),
+    Option("stl", None),
+    Option("rotation", None, float, (3,), matrix=True),
+    Option("scale", None, float, (1, 3), positive=True),
+    Option("istret", None, int, choices=(0, 1, 2, 3)),
+    Option("beta", None, float, positive=True),
+]
+
+def resolve(options, given, settings, source):
+    """Resolves the settings of a subcommand.
+
+    The values `given` on the command line take precedence over the `settings` read from
+    `source`, which take precedence over the defaults. Raises ValueError naming the offending
+    setting if a setting is unknown or invalid.
+    """
+
+    names = [o.name for o in options]
+    unknown = [k for k in settings if k not in names]
+    if unknown:
+        raise ValueError(f"{source}: unknown setting {', '.join(unknown)}")
+
+    resolved = {}
+    for o in options:
+        if o.name in given:
+            value, where = given[o.name], "command line"
+        elif o.name in settings:
+            value, where = settings[o.name], source
+        else:
+            value, where = o.default, "default"
+        try:
+            resolved[o.name] = o.check(value)
+        except ValueError as e:
+            raise ValueError(f"{where}: {o.name}: {e}") from None
+
+    return resolved
+
+def check_stl(s):
+    """Checks the settings of the stl subcommand against each other and derives the mesh."""
+
+    if s["distance"] is not None and s["mpi"]:
+        raise ValueError("distance is not supported with mpi")
+    if s["sparse"] is not None and (s["mpi"] or s["distance"] is not None):
+        raise ValueError("sparse is not supported with mpi or distance")
+    if s["fraction"] is not None and (s["mpi"] or s["distance"] is not None
+                                      or s["sparse"] is not None):
+        raise ValueError("fraction is not supported with mpi, distance or sparse")
+    if s["bricks"] is not None and s["engine"] != "voxel":
+        raise ValueError("bricks requires the voxel engine")
+    if s["resolution"] is not None and s["engine"] != "voxel":
+        raise ValueError("resolution requires the voxel engine")
+    _check_stretching(s)
+
+    mesh_n = [int(n / s["ratio"]) for n in s["mesh_n"]]
+    if min(mesh_n) < 2:
+        raise ValueError(f"the mesh coarsened by {s['ratio']} has fewer than 2 points along an "
+                         f"axis: {mesh_n}")
+
+    return {"mesh_n": mesh_n}
+
+def check_cylinder(s):
+    """Checks the settings of the cylinder subcommand and derives the origin of the cylinder."""
+
+    if min(s["mesh_n"]) < 2:
+        raise ValueError(f"the mesh has fewer than 2 points along an axis: {s['mesh_n']}")
+    if s["radius"] is not None and not any(s["axis"]):
+        raise ValueError("the axis of the cylinder is zero")
+    if s["distance"] and s["dtype"] == "packed":
+        raise ValueError("distance is not supported with a packed mask")
+    _check_stretching(s)
+
+    origin = s["origin"]
+    if origin is None:
+        origin = [(n - 1) * d / 2 for n, d in zip(s["mesh_n"], s["spacing"])]
+
+    return {"origin": origin}
+
+def _check_stretching(s):
+    if s["istret"] != 0 and s["beta"] is None:
+        raise ValueError("istret requires beta")
+
+def check_sweep(cases):
+    """Checks the cases of a sweep, see `sweep.Case`."""
+
+    names = []
+    for i, case in enumerate(cases):
+        if not isinstance(case, dict):
+            raise ValueError(f"case {i}: expected a table of settings")
+        c = resolve(CASE_OPTIONS, {}, case, f"case {case.get('name', i)}")
+        if c["istret"] not in (None, 0) and c["beta"] is None:
+            raise ValueError(f"case {c['name']}: istret requires beta")
+        names.append(case["name"])
+
+    if not names:
+        raise ValueError("the sweep has no cases")
+    if len(set(names)) != len(names):
+        raise ValueError(f"case names must be unique: {names}")
+
+def run_stl(s):
+    from . import cache
+    from . import instrument
+    from . import pipeline
+
+    if s["clear_cache"]:
+        cache.clear()
+
+    comm = None
+    if s["mpi"]:
+        from mpi4py import MPI
+        comm = MPI.COMM_WORLD
+
+    # the stages of the run are timed, progress is reported during long embeddings
+    with instrument.Report() as report:
+        pipeline.stl_mask(s["stl"], s["mesh_n"], s["mesh_l"], s["relative_offset"], s["rotation"],
+                          s["scale"], s["output"], comm, use_cache=s["cache"], engine=s["engine"],
+                          voxels_per_cell=s["voxels_per_cell"], resolution=s["resolution"],
+                          band=s["distance"], sparse=s["sparse"], compression=s["compress"],
+                          samples=s["fraction"], brick=s["bricks"], istret=s["istret"],
+                          beta=s["beta"])
+
+    rank = 0 if comm is None else comm.Get_rank()
+    if rank == 0:
+        print(f"\n{report.summary()}")
+    if s["report"] is not None:
+        report.write(s["report"] if comm is None else f"{s['report']}.{rank}")
+
+def run_cylinder(s):
+    from . import instrument
+    from . import pipeline
+
+    with instrument.Report() as report:
+        pipeline.cylinder_mask(s["mesh_n"], s["spacing"], s["radius"], s["origin"], s["axis"],
+                               s["dtype"], s["output"], s["iibm"], s["distance"], s["compress"],
+                               s["istret"], s["beta"])
+
+    print(f"\n{report.summary()}")
+    if s["report"] is not None:
+        report.write(s["report"])
+
+def run_sweep(s, filename):
+    from . import sweep
+
+    cases, _ = sweep.load(filename)
+    files = sweep.sweep(cases, s["output_dir"], s["workers"], s["engine"], s["voxels_per_cell"],
+                        s["cache"], s["compress"])
+    print(f"\nSuccessfully generated {len(files)} masks.")
+
+def run_inspect(args):
+    from . import inspect_mask
+
+    summary = inspect_mask.inspect(args.file, args.name, args.chunk, bodies=args.bodies)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{summary['file']}: {args.name} {summary['shape']} [z,y,x]")
+        print(f"solid points: {summary['solid']} ({100 * summary['fraction']:.4f}%)")
+        if "bodies" in summary:
+            _print_regions("bodies", summary["bodies"], args.max_regions)
+        if summary["invalid"]:
+            print(f"values other than 0 and 1: {summary['invalid']} points, first at "
+                  f"{summary['first']}, values {summary['values']}")
+
+    return 1 if summary["invalid"] else 0
+
+def run_diff(args):
+    from . import inspect_mask
+
+    result = inspect_mask.diff(args.file_a, args.file_b, args.name, args.chunk, args.tolerance)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{args.file_a} and {args.file_b}: {args.name} {result['shape']} [z,y,x]")
+        print(f"different points: {result['different']}, solid only in the first: "
+              f"{result['solid_a']}, only in the second: {result['solid_b']}")
+        _print_regions("differing regions", result["regions"], args.max_regions)
+
+    return 1 if result["different"] else 0
+
+def _print_regions(title, regions, limit):
+    print(f"{title}: {len(regions)}")
+    for start, end, count in regions[:limit]:
+        print(f"  [{start[0]}:{end[0]}, {start[1]}:{end[1]}, {start[2]}:{end[2]}] {count} points")
+    if len(regions) > limit:
+        print(f"  ... {len(regions) - limit} more, see --json")
+
+def parser():
+    """Returns the parser of the command line."""
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--dry-run", action="store_true",
+                        help="validate and print the settings without generating anything")
+
+    configured = argparse.ArgumentParser(add_help=False, parents=[common])
+    configured.add_argument("--config", metavar="FILE", default=None,
+                            help="TOML, YAML or JSON file of settings, overridden by the flags")
+
+    p = argparse.ArgumentParser(prog="py4x3d2", description="Generate IBM masks for x3d2")
+    commands = p.add_subparsers(dest="command", required=True, metavar="COMMAND")
+
+    stl = commands.add_parser("stl", parents=[configured],
+                              help="embed two copies of an stl geometry (the two foil setup)",
+                              description="Generate an IBM mask for x3d2 from an stl file")
+    for o in STL_OPTIONS:
+        o.add_argument(stl)
+
+    cyl = commands.add_parser("cylinder", parents=[configured], help="embed an analytic cylinder",
+                              description="Generate the IBM mask of a cylinder for x3d2")
+    for o in CYLINDER_OPTIONS:
+        o.add_argument(cyl)
+
+    sweep = commands.add_parser("sweep", parents=[common],
+                                help="generate the masks of a sweep of two foil cases",
+                                description="Generate the IBM masks of a sweep of configurations")
+    sweep.add_argument("cases", metavar="FILE",
+                       help="TOML, YAML or JSON file listing the cases of the sweep")
+    for o in SWEEP_OPTIONS:
+        o.add_argument(sweep)
+
+    # the mask files are read back in z-chunks of --chunk planes
+    read = argparse.ArgumentParser(add_help=False)
+    read.add_argument("--name", default="ep1", help="name of the mask variable (default: ep1)")
+    read.add_argument("--chunk", type=_positive, default=None, metavar="NK",
+                      help="number of z-planes read at a time (default: about 64 MiB)")
+    read.add_argument("--json", action="store_true", help="print the results as JSON")
+    read.add_argument("--max-regions", type=_positive, default=20, metavar="N",
+                      help="number of regions printed (default: 20)")
+
+    inspect = commands.add_parser("inspect", parents=[read],
+                                  help="summarise and validate a mask file",
+                                  description="Count the solid points and bodies of a mask file "
+                                  "and check that it only holds 0 and 1")
+    inspect.add_argument("file", metavar="FILE", help="ADIOS2 mask file")
+    inspect.add_argument("--bodies", action=argparse.BooleanOptionalAction, default=True,
+                         help="find the bounding boxes of the solid bodies (default: true)")
+
+    diff = commands.add_parser("diff", parents=[read], help="compare two mask files",
+                               description="Compare two mask files and report the differing "
+                               "regions")
+    diff.add_argument("file_a", metavar="FILE_A", help="first ADIOS2 mask file")
+    diff.add_argument("file_b", metavar="FILE_B", help="second ADIOS2 mask file")
+    diff.add_argument("--tolerance", type=float, default=0.0, metavar="ATOL",
+                      help="largest difference between equal values (default: 0)")
+
+    return p
+
+def _positive(value):
+    n = int(value)
+    if n <= 0:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value}")
+    return n
+
+OPTIONS = {"stl": STL_OPTIONS, "cylinder": CYLINDER_OPTIONS, "sweep": SWEEP_OPTIONS}
+
+def settings(args):
+    """Resolves the settings of the parsed command line, raising ValueError if they are invalid."""
+
+    names = [o.name for o in OPTIONS[args.command]]
+    given = {k: v for k, v in vars(args).items() if k in names}
+
+    if args.command == "sweep":
+        source = config.read(args.cases)
+        cases = source.pop("case", [])
+        check_sweep(cases)
+        s = resolve(SWEEP_OPTIONS, given, source, args.cases)
+        return s, {"cases": [c["name"] for c in cases]}
+
+    source = {}
+    if args.config is not None:
+        source = config.read(args.config)
+        # A table named after the command holds its settings, otherwise they are at the top level
+        # (where `stl` is a setting of its own rather than a table)
+        if isinstance(source.get(args.command), dict):
+            source = source[args.command]
+
+    s = resolve(OPTIONS[args.command], given, source, args.config)
+    if args.command == "stl":
+        return s, check_stl(s)
+
+    return s, check_cylinder(s)
+
+def main(argv=None):
+    p = parser()
+    args = p.parse_args(argv)
+
+    if args.command in ("inspect", "diff"):
+        try:
+            return run_inspect(args) if args.command == "inspect" else run_diff(args)
+        except (OSError, ValueError) as e:
+            p.exit(2, f"{p.prog} {args.command}: error: {e}\n")
+
+    try:
+        s, derived = settings(args)
+    except (OSError, ValueError) as e:
+        p.exit(2, f"{p.prog} {args.command}: error: {e}\n")
+
+    if args.dry_run:
+        print(json.dumps({"command": args.command, "settings": s, "derived": derived}, indent=2))
+        return 0
+
+    if args.command == "stl":
+        run_stl({**s, **derived})
+    elif args.command == "cylinder":
+        run_cylinder({**s, **derived})
+    else:
+        run_sweep(s, args.cases)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
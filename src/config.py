@@ -0,0 +1,42 @@
+""" src/config.py
+
+Module to read the configuration files of the command line interface and the sweeps, and the
+default two foil setup.
+
+Configuration files are TOML, YAML or JSON, chosen by the file extension. This module only uses the
+standard library (PyYAML for YAML files) so that configurations can be read and validated without
+loading numpy, ADIOS2 or the STL libraries.
+"""
+
+import json
+import os
+
+# Default stl file, x3d2 mesh [nx, ny, nz], domain size [Lx, Ly, Lz] and offset between the
+# centres of the two foils
+STL = "front_foil.stl"
+MESH_N = [697, 1878, 429]
+MESH_L = [60.11421911, 161.97202797, 37.0]
+RELATIVE_OFFSET = [-13.244, 29.2215, 0.0]
+
+def read(filename):
+    """Reads a TOML, YAML or JSON file into a dict."""
+
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".json":
+        with open(filename) as fh:
+            config = json.load(fh)
+    elif ext in (".yaml", ".yml"):
+        import yaml
+        with open(filename) as fh:
+            config = yaml.safe_load(fh)
+    else:
+        import tomllib
+        with open(filename, "rb") as fh:
+            config = tomllib.load(fh)
+
+    if config is None:
+        return {}
+    if not isinstance(config, dict):
+        raise ValueError(f"{filename}: expected a table of settings")
+
+    return config
@@ -3,14 +3,41 @@
 Module to load and convert an STL file to a Numpy array that we can write.
 """
 
-import stl
-import stltovoxel as stv
 import numpy as np
 
+from . import cache as voxel_cache
+from . import grid
+from . import instrument
+from . import rasterize
 from . import voxel
 
-def convert(stl_file):
+# Voxel resolution (number of voxels along z) used when no target mesh is given
+DEFAULT_RESOLUTION = 350
+
+# Rough single-core cost model of stl-to-voxel, used to report the expected voxelisation time
+SECONDS_PER_LAYER = 5e-3
+SECONDS_PER_VOXEL = 2e-7
+
+def convert(stl_file, resolution=None, mesh_n=None, mesh_l=None, voxels_per_cell=2.0, cache=True,
+            engine="voxel", brick=None, triangles=None):
     """ Converts an stl file into a Numpy array.
+
+    With `engine="raster"` the stl file is not voxelised, instead its triangles are returned as a
+    `rasterize.Surface` which the embedder rasterizes directly onto the x3d2 grid.
+
+    The voxel `resolution` is the number of voxels along z. If it is not given but the target
+    x3d2 mesh (`mesh_n`, `mesh_l`) is, the smallest resolution giving at least `voxels_per_cell`
+    voxels per grid spacing is used, otherwise DEFAULT_RESOLUTION.
+
+    Unless `cache` is False the result is looked up in, and stored to, the on-disk voxel cache so
+    that unchanged geometries are only voxelised once.
+
+    With a `brick` size the voxels are returned as a `voxel.BrickVoxels`, storing only the bricks
+    of `brick`**3 voxels which are neither empty nor solid densely. The cache holds the dense
+    voxels.
+
+    The `triangles` of the stl file may be given when they are already loaded (see `load_mesh`),
+    so that the file is not parsed again. The cache is still keyed on the file.
     """
     #
     # This function is based on the implementation of `convert_files()` in the `stl-to-voxel`
@@ -36,23 +63,95 @@ def convert(stl_file):
     #   OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
     #   DEALINGS IN THE SOFTWARE.
     #
-    
-    mesh_obj = stl.mesh.Mesh.from_file(stl_file)
-    org_mesh = np.hstack(
-        (
-            mesh_obj.v0[:, np.newaxis],
-            mesh_obj.v1[:, np.newaxis],
-            mesh_obj.v2[:, np.newaxis]
-        )
-    )
+
+    if engine == "raster":
+        return rasterize.Surface(load_mesh(stl_file) if triangles is None else triangles)
+    elif engine != "voxel":
+        raise ValueError(f"Unknown conversion engine: {engine}")
+
+    org_mesh = triangles
+    if resolution is None:
+        if mesh_n is None:
+            resolution = DEFAULT_RESOLUTION
+        else:
+            if org_mesh is None:
+                org_mesh = load_mesh(stl_file)
+            mesh_min = org_mesh.min(axis=(0, 1))
+            mesh_max = org_mesh.max(axis=(0, 1))
+            resolution = choose_resolution(mesh_min, mesh_max, mesh_n, mesh_l, voxels_per_cell)
+
+            shape, nbytes, seconds = estimate(mesh_min, mesh_max, resolution)
+            print(f"Voxel resolution: {resolution} ({voxels_per_cell} voxels per grid spacing)")
+            print(f"Voxel array: {shape}, ~{nbytes / 1024**2:.1f} MiB, ~{seconds:.1f} s to voxelise")
+
+    if cache:
+        with instrument.stage("cache"):
+            key = voxel_cache.key(stl_file, resolution)
+            voxels = voxel_cache.load(key)
+        if voxels is not None:
+            return voxels if brick is None else voxel.BrickVoxels.from_voxels(voxels, brick)
+
+    if org_mesh is None:
+        org_mesh = load_mesh(stl_file)
+
+    # stl-to-voxel is only imported when voxelising, see `src/cli.py`
+    import stltovoxel as stv
 
     # Returns:
     # - vol:   The voxel grid
     # - scale: The number of voxels per unit length
     # - shift: The distance from the origin to the mesh centre
-    # TODO: Currently the voxel resolution is hardcoded, in future this could be determined in
-    #       combination with the x3d2 mesh resolution.
-    resolution = 350
-    vol, scale, shift = stv.convert_meshes([org_mesh], resolution, None, False)
+    with instrument.stage("voxelise") as s:
+        vol, scale, shift = stv.convert_meshes([org_mesh], resolution, None, False)
+        s.add_points(vol.size)
+    voxels = voxel.Voxels(vol, scale, shift)
+
+    if cache:
+        with instrument.stage("cache"):
+            voxel_cache.store(key, voxels)
+
+    return voxels if brick is None else voxel.BrickVoxels.from_voxels(voxels, brick)
+
+def load_mesh(stl_file):
+    """Loads the triangles of an stl file as an (N, 3, 3) array of vertex coordinates."""
+
+    import stl
+
+    with instrument.stage("load"):
+        mesh_obj = stl.mesh.Mesh.from_file(stl_file)
+        org_mesh = np.hstack(
+            (
+                mesh_obj.v0[:, np.newaxis],
+                mesh_obj.v1[:, np.newaxis],
+                mesh_obj.v2[:, np.newaxis]
+            )
+        )
+
+    return org_mesh
+
+def choose_resolution(mesh_min, mesh_max, mesh_n, mesh_l, voxels_per_cell=2.0):
+    """Chooses the smallest voxel resolution sampling the x3d2 mesh with the requested fidelity.
+
+    stl-to-voxel uses cubic voxels of size (z extent / resolution), these must be no larger than
+    the smallest grid spacing divided by `voxels_per_cell`. For a stretched mesh (a `grid.Grid`
+    as `mesh_l`) this is the smallest spacing anywhere in the domain.
+    """
+
+    spacing = [h for n, h in zip(mesh_n, grid.spacing(mesh_n, mesh_l)) if n > 1]
+    voxel_size = min(spacing) / voxels_per_cell
+    extent = mesh_max[2] - mesh_min[2]
+
+    return max(int(np.ceil(extent / voxel_size)), 1)
+
+def estimate(mesh_min, mesh_max, resolution):
+    """Estimates the voxel array shape [z,y,x], its size in bytes and the voxelisation time."""
+
+    extent = np.asarray(mesh_max) - np.asarray(mesh_min)
+    shape = np.flip(np.ceil(resolution * extent / extent[2]).astype(int))
+    count = int(np.prod(shape))
+
+    # stl-to-voxel stores the volume as int8
+    nbytes = count * np.dtype(np.int8).itemsize
+    seconds = SECONDS_PER_LAYER * shape[0] + SECONDS_PER_VOXEL * count
 
-    return voxel.Voxels(vol, scale, shift)
+    return shape, nbytes, seconds
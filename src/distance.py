@@ -0,0 +1,195 @@
+""" src/distance.py
+
+Module to compute the signed distance and nearest surface direction fields of an IBM mask.
+
+The surface is taken to cross the mesh half way between neighbouring fluid and solid points. The
+closest surface point of each grid point is found by propagating closest points from these seeds
+to the neighbouring points (closest point sweeping), restricted to a narrow band of grid points
+around the surface. Beyond the band the distance is capped at the band width and the direction is
+zero.
+
+The fields are only computed in the bounding box of each body of the mask, extended by the band,
+so that memory and time scale with the size of the bodies rather than the domain, e.g. for two
+foils far apart.
+"""
+
+import numpy as np
+
+from . import grid
+from . import mask
+from . import regions
+from . import scene
+
+# Names of the fields written alongside ep1
+FIELDS = ("dist", "dir_x", "dir_y", "dir_z")
+
+class NarrowBand:
+    def __init__(self, blocks, shape, cap):
+        """Stores the distance fields computed in disjoint blocks of the mesh.
+
+        Each block is a ([z,y,x] start, dist, direction) triple, `dist` holding the signed distance
+        (negative in the solid) and `direction` the [x,y,z] components of the unit vector pointing
+        to the nearest surface point. Outside the blocks the mesh is fluid at a distance of at
+        least `cap` from the surface. `shape` is the [z,y,x] shape of the mesh.
+        """
+
+        self.blocks = [(np.asarray(start), dist, direction) for start, dist, direction in blocks]
+        self.shape = tuple(shape)
+        self.cap = cap
+
+    def chunks(self, nk=None):
+        """Iterates over the fields of the mesh in z-chunks, yielding (k0, {name: chunk})."""
+
+        nz, ny, nx = self.shape
+        if nk is None:
+            nk = max(mask.CHUNK_BYTES // max(ny * nx * 8, 1), 1)
+
+        for k0 in range(0, nz, nk):
+            k1 = min(k0 + nk, nz)
+
+            fields = {"dist": np.full([k1 - k0, ny, nx], self.cap)}
+            for name in FIELDS[1:]:
+                fields[name] = np.zeros([k1 - k0, ny, nx])
+
+            for start, dist, direction in self.blocks:
+                end = start + dist.shape
+                b0 = max(k0, start[0])
+                b1 = min(k1, end[0])
+                if b0 < b1:
+                    dst = (slice(b0 - k0, b1 - k0),
+                           slice(start[1], end[1]),
+                           slice(start[2], end[2]))
+                    src = slice(b0 - start[0], b1 - start[0])
+
+                    fields["dist"][dst] = dist[src]
+                    for d, name in enumerate(FIELDS[1:]):
+                        fields[name][dst] = direction[d][src]
+
+            yield k0, fields
+
+def narrow_band(ibm, mesh_n, mesh_l, band=4):
+    """Computes the signed distance and direction fields of a mask within `band` grid spacings of
+    the surface.
+
+    The mask is scanned in z-chunks for its bodies, the face-connected components of the solid
+    points (see `regions.Regions`), and the fields are only computed in the bounding box of each
+    body extended by the band, overlapping boxes being merged, see NarrowBand. On a stretched mesh
+    (a `grid.Grid` as `mesh_l`) the band is measured in the smallest grid spacings.
+    """
+
+    nx, ny, nz = mesh_n
+    h = grid.spacing(mesh_n, mesh_l)
+    h = h[h > 0].min() if np.any(h > 0) else 1.0
+    cap = band * h
+
+    bodies = regions.Regions()
+    for k0, chunk in mask.chunks(ibm, dtype=np.uint8):
+        bodies.add(k0, chunk == 0)
+
+    # Boxes of the bodies extended by the band, in [z,y,x] order
+    ranges = []
+    for lo, hi, _ in bodies.regions():
+        ranges.append([np.maximum(np.array(lo) - band - 1, 0),
+                       np.minimum(np.array(hi) + band + 1, [nz, ny, nx])])
+
+    blocks = [_block(ibm, mesh_n, mesh_l, start, end, int(np.ceil(cap / h)) + 1, cap)
+              for start, end in scene.merge_ranges(ranges)]
+
+    return NarrowBand(blocks, [nz, ny, nx], cap)
+
+def _block(ibm, mesh_n, mesh_l, start, end, sweeps, cap):
+    """Computes the distance fields in the block [start, end) of the mesh, in [z,y,x] order.
+
+    The closest points are propagated for at most `sweeps` sweeps, enough to cross the band along
+    the finest axis.
+
+    Returns the ([z,y,x] start, dist, direction) triple of `NarrowBand`.
+    """
+
+    region = tuple(slice(s, e) for s, e in zip(start, end))
+    solid = np.asarray(ibm[region]) == 0
+
+    # Coordinates of the block in [z,y,x] order, broadcast along their own axes
+    table = [c[s:e] for c, s, e in zip(grid.coordinates(mesh_n, mesh_l)[::-1], start, end)]
+    coords = [_along(d, t) for d, t in enumerate(table)]
+
+    cp = [np.full(solid.shape, np.nan) for _ in range(3)]
+    d2 = np.full(solid.shape, np.inf)
+
+    # Lengths of the edges along each axis, the grid spacing itself on a uniform mesh so that
+    # seeds at the same distance tie exactly
+    if isinstance(mesh_l, grid.Grid):
+        edges = [np.diff(t) for t in table]
+    else:
+        h = np.flip(grid.spacing(mesh_n, mesh_l))
+        edges = [np.full(len(t) - 1, h[d]) for d, t in enumerate(table)]
+
+    # Seed the points either side of the surface with the midpoint of the edge crossing it
+    for a in range(3):
+        crossing = solid[_shifted(a, 0, -1)] != solid[_shifted(a, 1, None)]
+        half = _along(a, edges[a] / 2)
+        for side, other in [(_shifted(a, 0, -1), 1), (_shifted(a, 1, None), -1)]:
+            m = [np.broadcast_to(c, solid.shape)[side] for c in coords]
+            m[a] = m[a] + other * half
+            _update(cp, d2, side, crossing, m, half**2)
+
+    # Propagate the closest points to the neighbouring points, each sweep moves the closest points
+    # by one grid point along each axis, until they no longer change
+    for _ in range(sweeps):
+        changed = False
+        for a in range(3):
+            for dst, src in [(_shifted(a, 1, None), _shifted(a, 0, -1)),
+                             (_shifted(a, 0, -1), _shifted(a, 1, None))]:
+                cand = [c[src] for c in cp]
+                p = [np.broadcast_to(c, solid.shape)[dst] for c in coords]
+                cand_d2 = sum((cand[d] - p[d])**2 for d in range(3))
+                found = np.isfinite(cand_d2)
+                changed |= _update(cp, d2, dst, found, cand, np.where(found, cand_d2, np.inf))
+        if not changed:
+            break
+
+    # Signed distance within the band
+    dist = np.sqrt(d2)
+    inband = dist <= cap
+    dist = np.where(inband, dist, cap)
+    dist = np.where(solid, -dist, dist)
+
+    # The closest points lie on the staircase surface of the mask, the gradient of the distance
+    # gives a smoother direction to the surface than the closest points themselves
+    grad = np.gradient(dist, *table) if min(dist.shape) > 1 else [np.zeros(dist.shape)] * 3
+    norm = np.sqrt(sum(g**2 for g in grad))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.where(inband & (norm > 0), -np.sign(dist) / norm, 0)
+
+    direction = np.zeros((3,) + solid.shape)
+    for d in range(3):
+        direction[2 - d] = grad[d] * scale
+
+    return start, dist, direction
+
+def _along(a, values):
+    """Reshapes a 1D array to vary along axis `a` only."""
+
+    shape = [1, 1, 1]
+    shape[a] = len(values)
+    return values.reshape(shape)
+
+def _shifted(a, i0, i1):
+    """Returns the index selecting [i0, i1) along axis `a` and everything along the others."""
+
+    index = [slice(None)] * 3
+    index[a] = slice(i0, i1)
+    return tuple(index)
+
+def _update(cp, d2, index, valid, cand, cand_d2):
+    """Replaces the closest points at `index` by the candidates where they are closer.
+
+    Returns whether any closest point was replaced.
+    """
+
+    closer = valid & (cand_d2 < d2[index])
+    d2[index] = np.where(closer, cand_d2, d2[index])
+    for d in range(3):
+        cp[d][index] = np.where(closer, cand[d], cp[d][index])
+
+    return bool(np.any(closer))
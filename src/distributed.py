@@ -0,0 +1,121 @@
+""" src/distributed.py
+
+Module to generate IBM masks with MPI, each rank embedding only its own block of the mesh.
+
+The mesh is decomposed over a [px, py, pz] grid of processes, by default keeping x whole as in the
+x-pencils of x3d2. Each rank intersects the working range of every object with its block and writes
+the result with the global start/count of its chunks, so that a single file holding the global
+[nz, ny, nx] `ep1` field is produced. For example:
+
+    mpirun -n 4 python run.py --mpi
+
+When ADIOS2 is built with MPI the file is written collectively, otherwise the blocks are forwarded
+to rank 0 one chunk at a time and written there in the order they arrive, rank 0 writing the chunks
+received between its own so that the other ranks keep embedding.
+"""
+
+import numpy as np
+
+from . import scene
+from . import writer
+
+# Message tag used to forward blocks to the writing rank
+_TAG = 77
+
+def split(n, parts, index):
+    """Splits n points into `parts` contiguous ranges, returning the (start, count) of range
+    `index`.
+
+    The first n % parts ranges hold one extra point.
+    """
+
+    count = n // parts + (1 if index < n % parts else 0)
+    start = index * (n // parts) + min(index, n % parts)
+
+    return start, count
+
+def process_grid(nranks):
+    """Decomposes `nranks` into a [1, py, pz] process grid with py and pz as close as possible."""
+
+    pz = int(np.sqrt(nranks))
+    while nranks % pz != 0:
+        pz -= 1
+
+    return [1, nranks // pz, pz]
+
+def local_block(mesh_n, dims, rank):
+    """Returns the [z,y,x] start and count of the block of the mesh owned by `rank`.
+
+    The mesh size `mesh_n` and process grid `dims` are given in [x,y,z] order, ranks are numbered
+    with x varying fastest.
+    """
+
+    px, py, pz = dims
+    coords = [rank % px, (rank // px) % py, rank // (px * py)]
+
+    blocks = [split(n, p, c) for n, p, c in zip(mesh_n, dims, coords)]
+    start = [b[0] for b in reversed(blocks)]
+    count = [b[1] for b in reversed(blocks)]
+
+    return start, count
+
+def generate(placements, mesh_n, mesh_l, filename, comm, dims=None, iibm=1, nk=None,
+             dtype=np.uint8, compression=None):
+    """Generates the IBM mask of a list of placed objects across the ranks of `comm`.
+
+    Each rank embeds the objects into its own block of the mesh, one z-chunk at a time, and the
+    mask is written to `filename` as the global `ep1` field. The process grid `dims` is given in
+    [x,y,z] order and defaults to `process_grid(comm.Get_size())`. The field is compressed
+    according to `compression`, see `writer.operations`.
+    """
+
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+    if dims is None:
+        dims = process_grid(size)
+    if int(np.prod(dims)) != size:
+        raise ValueError(f"Process grid {dims} does not match the {size} ranks")
+
+    nx, ny, nz = mesh_n
+    shape = [nz, ny, nx]
+    start, count = local_block(mesh_n, dims, rank)
+    blocks = scene.iter_block(placements, mesh_n, mesh_l, start, count, nk, dtype=dtype)
+
+    if writer.adios2_mpi:
+        with writer.MaskWriter(filename, shape, comm, compression=compression) as w:
+            if rank == 0:
+                w.write_scalar("iibm", iibm)
+            for block_start, block in blocks:
+                w.write_block("ep1", block, block_start)
+    elif rank == 0:
+        from mpi4py import MPI
+
+        # Number of ranks still sending chunks, each ends with None
+        sending = size - 1
+        with writer.MaskWriter(filename, shape, compression=compression) as w:
+            w.write_scalar("iibm", iibm)
+            for block_start, block in blocks:
+                w.write_block("ep1", block, block_start)
+                while sending and comm.Iprobe(source=MPI.ANY_SOURCE, tag=_TAG):
+                    sending -= _receive(comm, w)
+            while sending:
+                sending -= _receive(comm, w)
+    else:
+        for block_start, block in blocks:
+            comm.send((block_start, np.asarray(block)), dest=0, tag=_TAG)
+        comm.send(None, dest=0, tag=_TAG)
+
+    comm.Barrier()
+
+def _receive(comm, w):
+    """Receives a chunk from any rank and writes it with `w`, returning 1 if a rank has finished."""
+
+    from mpi4py import MPI
+
+    message = comm.recv(source=MPI.ANY_SOURCE, tag=_TAG)
+    if message is None:
+        return 1
+
+    block_start, block = message
+    w.write_block("ep1", block, block_start)
+    return 0
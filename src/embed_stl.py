@@ -3,15 +3,90 @@
 Module to embed voxels representing a geometry as an IBM field array.
 """
 
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
-def embed(voxels, mesh_n, mesh_l, shift=[0, 0, 0]):
-    """Embeds the voxel data as an IBM within a mesh."""
+from . import grid
+from . import instrument
+from . import mask
+from . import rasterize
+from . import voxel
+
+def embed(voxels, mesh_n, mesh_l, shift=[0, 0, 0], rotation=None, workers=1, dtype=np.float64,
+          scale=None):
+    """Embeds the voxel data as an IBM within a mesh.
+
+    The working range is processed one k-slab at a time: the global -> local -> voxel index
+    mapping is computed for the whole (j, i) plane of the slab by broadcasting the 1D grid
+    coordinates, and the voxel values are gathered from the volume with fancy indexing. See
+    `embed_into` for the placement of the object.
+
+    With `workers > 1` the k-slabs are shared out between a pool of forked processes which fill
+    the IBM array in place through a shared memory mapping, the result is identical to the serial
+    embedding. This also holds for rasterized surfaces and brick voxels, see `embed_into`.
+
+    The IBM array is float64 by default, a compact `dtype` such as uint8, bool or "packed" (see
+    `mask.ones`) reduces the memory footprint of the mask.
+
+    The object may be scaled about its centre by `scale`, see `transform`. The mesh may be
+    stretched by giving a `grid.Grid` as `mesh_l`.
+    """
+
+    ibm = mask.ones(mesh_n, dtype=dtype, shared=workers > 1)
+    n0, nn = embed_into(ibm, voxels, mesh_n, mesh_l, shift, transform(rotation, scale), workers)
+    print(f"Working range (indices): {n0} -> {nn}")
+
+    return ibm
+
+def embed_into(ibm, voxels, mesh_n, mesh_l, shift=[0, 0, 0], rotation=None, workers=1,
+               start=[0, 0, 0]):
+    """Embeds the voxel data into an existing IBM array.
+
+    The object centre is placed at `shift` and optionally rotated about its centre by the 3x3
+    matrix `rotation`, which may also scale the object or be given as Euler angles, see
+    `transform`. Each grid point is mapped back into the frame of the object by the inverse of
+    the matrix, a plane of points at a time. Only the working range covered by the object is
+    visited and points inside the object are set to 0, so that embedding several objects into the
+    same array combines them as a logical AND of the individual masks. With `workers > 1` the
+    array must be allocated with `mask.ones(mesh_n, shared=True)`, otherwise ValueError is raised as
+    the workers' writes would be lost.
+
+    The array may hold a sub-block of the mesh whose first point is at the global [z,y,x] index
+    `start`, in which case only the part of the working range inside the block is embedded.
+
+    The mesh is given by `mesh_l`, the size of the domain of a uniform mesh, or a `grid.Grid` of
+    the coordinates along each axis, see `grid.coordinates`.
+
+    The object may also be a `rasterize.Surface`, which is rasterized directly onto the grid
+    rather than sampled from voxels. A `voxel.BrickVoxels` object which is only translated is
+    embedded brick by brick, skipping the empty bricks, see `_embed_bricks`. Both are shared out
+    between the `workers` by k-slabs of the working range like the voxels.
+
+    Returns the working range [n0, nn) as global [x,y,z] indices.
+    """
+
+    if workers > 1 and not mask.is_shared(ibm):
+        raise ValueError("Embedding with several workers requires a shared mask, allocate it with "
+                         "mask.ones(mesh_n, shared=True)")
+
+    rotation = transform(rotation)
+    if isinstance(voxels, rasterize.Surface):
+        if workers <= 1:
+            return rasterize.embed_into(ibm, voxels, mesh_n, mesh_l, shift, rotation, start)
+
+        # the working range restricted to the block held by the array
+        n0, nn = rasterize.working_range(voxels, mesh_n, mesh_l, shift, rotation)
+        origin = np.flip(np.array(start))
+        n0 = np.maximum(n0, origin)
+        nn = np.minimum(nn, origin + np.flip(ibm.shape))
 
-    nx, ny, nz = mesh_n
-    dx = mesh_l[0] / (nx - 1) if nx > 1 else 0
-    dy = mesh_l[1] / (ny - 1) if ny > 1 else 0
-    dz = mesh_l[2] / (nz - 1) if nz > 1 else 0
+        args = (ibm, voxels, mesh_n, mesh_l, shift, rotation, start)
+        _embed_parallel(_raster_slabs, args, n0[2], nn[2], workers)
+        return [n0, nn]
+
+    coords = grid.coordinates(mesh_n, mesh_l)
 
     # calculate center of the voxel object from its bounding box
     bbox_min, bbox_max = voxels.bounding_box()
@@ -20,45 +95,272 @@ def embed(voxels, mesh_n, mesh_l, shift=[0, 0, 0]):
     # calculate the offset vector needed to move the voxel's center
     # to the desired final 'shift' location in the domain.
     offset = np.array(shift) - voxel_center
+    inverse = None if rotation is None else _inverse(rotation)
+
+    with instrument.stage("bounds"):
+        n0, nn = working_range(voxels, mesh_n, mesh_l, shift, rotation)
+
+        # restrict the working range to the block held by the array
+        origin = np.flip(np.array(start))
+        n0 = np.maximum(n0, origin)
+        nn = np.minimum(nn, origin + np.flip(ibm.shape))
+
+    if isinstance(voxels, voxel.BrickVoxels) and inverse is None:
+        embed_slabs = _brick_slabs
+        args = (ibm, origin, voxels, n0, nn, coords, offset)
+    else:
+        embed_slabs = _embed_slabs
+        args = (ibm, origin, voxels, n0, nn, coords, offset, voxel_center, inverse)
+
+    if workers > 1:
+        _embed_parallel(embed_slabs, args, n0[2], nn[2], workers)
+    else:
+        embed_slabs(*args, n0[2], nn[2])
+
+    return [n0, nn]
+
+def working_range(voxels, mesh_n, mesh_l, shift=[0, 0, 0], rotation=None):
+    """Returns the working range [n0, nn) covered by the placed object as global [x,y,z] indices.
+
+    The object is placed as in `embed_into`, only the points in this range can be solid. For a
+    rotated object the range covers the placed corners of its bounding box. The range is found by
+    a binary search of the coordinates of the mesh.
+    """
+
+    rotation = transform(rotation)
+    if isinstance(voxels, rasterize.Surface):
+        return rasterize.working_range(voxels, mesh_n, mesh_l, shift, rotation)
+
+    coords = grid.coordinates(mesh_n, mesh_l)
+
+    bbox_min, bbox_max = voxels.bounding_box()
+    voxel_center = (bbox_min + bbox_max) / 2.0
+    offset = np.array(shift) - voxel_center
 
     # determine the loop bounds in the final grid using the correct offset
-    n0, nn = _bounds(voxels, mesh_n, [dx, dy, dz], offset)
-    print(f"Working range (indices): {n0} -> {nn}")
+    if rotation is None:
+        return _bounds(voxels, coords, offset)
+    else:
+        corners = _corners(bbox_min, bbox_max) - voxel_center
+        corners = corners @ rotation.T + np.array(shift)
+        return _box_bounds(corners.min(axis=0), corners.max(axis=0), coords)
 
-    ibm = np.ones([nz, ny, nx], dtype=np.float64)
-    for k in range(n0[2], nn[2]):
-        for j in range(n0[1], nn[1]):
-            for i in range(n0[0], nn[0]):
-                x_global = np.array([i * dx, j * dy, k * dz])
+def _embed_slabs(ibm, origin, voxels, n0, nn, coords, offset, centre, inverse, k0, k1):
+    """Embeds the voxels in the k-slabs [k0, k1) of the working range [n0, nn).
 
-                x_local = x_global - offset
+    The array holds the block of the mesh whose first point is at the global [x,y,z] index
+    `origin` and `coords` are the coordinates of the mesh along each axis. The `inverse` matrix
+    maps the placed object back into the frame of the voxels.
+    """
 
-                if voxels.query(x_local) > 0:
-                    ibm[k, j, i] = 0.0
+    x, y, z = coords
 
-    return ibm
+    if inverse is None:
+        # local coordinates of the grid lines crossing the working range
+        x_local = x[n0[0]:nn[0]] - offset[0]
+        y_local = y[n0[1]:nn[1]] - offset[1]
+        for k in range(k0, k1):
+            z_local = z[k] - offset[2]
+
+            solid = voxels.query_many(x_local[np.newaxis, :], y_local[:, np.newaxis], z_local) > 0
+            _clear(ibm, k - origin[2], n0 - origin, nn - origin, solid)
+    else:
+        # coordinates of the grid lines relative to the placed object centre, these are mapped
+        # back into the frame of the voxels one slab at a time
+        shift = offset + centre
+        x_rel = (x[n0[0]:nn[0]] - shift[0])[np.newaxis, :]
+        y_rel = (y[n0[1]:nn[1]] - shift[1])[:, np.newaxis]
+        for k in range(k0, k1):
+            z_rel = z[k] - shift[2]
+
+            x_local, y_local, z_local = (inverse[d, 0] * x_rel
+                                         + inverse[d, 1] * y_rel
+                                         + inverse[d, 2] * z_rel
+                                         + centre[d] for d in range(3))
+            solid = voxels.query_many(x_local, y_local, z_local) > 0
+            _clear(ibm, k - origin[2], n0 - origin, nn - origin, solid)
+
+def _brick_slabs(ibm, origin, voxels, n0, nn, coords, offset, k0, k1):
+    """Embeds a translated brick voxel object in the k-slabs [k0, k1) of the working range."""
+
+    n0 = np.array([n0[0], n0[1], k0])
+    nn = np.array([nn[0], nn[1], k1])
+    if k1 > k0:
+        _embed_bricks(ibm, origin, voxels, n0, nn, coords, offset)
+
+def _raster_slabs(ibm, surface, mesh_n, mesh_l, shift, rotation, start, k0, k1):
+    """Rasterizes the surface into the k-slabs [k0, k1) of the mesh."""
+
+    rasterize.embed_into(ibm, surface, mesh_n, mesh_l, shift, rotation, start, k_range=[k0, k1])
+
+def _embed_bricks(ibm, origin, voxels, n0, nn, coords, offset):
+    """Embeds a translated brick voxel object in the working range [n0, nn).
+
+    Along each axis the grid lines of the working range map to increasing voxel indices, so that
+    the grid points falling in each brick form a box of the working range. The boxes of solid
+    bricks are filled with a slice assignment, those of empty bricks are skipped and the points
+    in mixed bricks are looked up in the brick.
+    """
+
+    brick = voxels.brick
+
+    # The bricks crossed by the grid lines along each [z,y,x] axis as (brick, g0, g1, r) where the
+    # grid lines [g0, g1) of the working range fall in the brick at the voxel indices r within it
+    crossed = []
+    for d in [2, 1, 0]:
+        rel = coords[d][n0[d]:nn[d]] - offset[d] - voxels.shift[d]
+        idx = np.floor(rel * voxels.scale[d]).astype(int)
+
+        # Points on the upper face of the volume belong to the last voxel, as in `query_many`
+        m = voxels.n[2 - d]
+        idx = np.where((idx == m) & (rel == voxels.L[2 - d]), m - 1, idx)
+        valid = np.flatnonzero((idx >= 0) & (idx < m))
+        if len(valid) == 0:
+            return
+
+        axis = []
+        for b in range(idx[valid[0]] // brick, idx[valid[-1]] // brick + 1):
+            g0, g1 = valid[0] + np.searchsorted(idx[valid], [b * brick, (b + 1) * brick])
+            if g1 > g0:
+                axis.append((b, n0[d] + g0 - origin[d], n0[d] + g1 - origin[d],
+                             idx[g0:g1] - b * brick))
+        crossed.append(axis)
+
+    for bz, k0, k1, rz in crossed[0]:
+        for by, j0, j1, ry in crossed[1]:
+            for bx, i0, i1, rx in crossed[2]:
+                index = voxels.index[bz, by, bx]
+                if index < 0 and voxels.fill[bz, by, bx] <= 0:
+                    continue
+
+                # Read, modify and write the box so that compact and packed masks are supported
+                block = ibm[k0:k1, j0:j1, i0:i1]
+                if index < 0:
+                    block[...] = 0
+                else:
+                    data = voxels.bricks[index]
+                    block[data[rz[:, None, None], ry[None, :, None], rx[None, None, :]] > 0] = 0
+                ibm[k0:k1, j0:j1, i0:i1] = block
+
+def _clear(ibm, k, n0, nn, solid):
+    """Sets the solid points of the plane k in the working range [n0, nn) to 0.
+
+    The block is read and written back so that compact mask representations can be updated.
+    """
+
+    block = ibm[k, n0[1]:nn[1], n0[0]:nn[0]]
+    block[solid] = 0
+    ibm[k, n0[1]:nn[1], n0[0]:nn[0]] = block
+
+def transform(rotation=None, scale=None):
+    """Returns the 3x3 matrix placing an object, or None if the object is only translated.
+
+    The `rotation` is either a 3x3 matrix or the (x, y, z) Euler angles of `euler`. The object
+    is scaled along its own axes by `scale`, a single factor or one per [x,y,z] axis, before it
+    is rotated.
+    """
+
+    if rotation is not None:
+        rotation = np.asarray(rotation, dtype=np.float64)
+        if rotation.shape == (3,):
+            rotation = euler(rotation)
+        elif rotation.shape != (3, 3):
+            raise ValueError(f"A rotation is a 3x3 matrix or 3 Euler angles, got {rotation.shape}")
+
+    if scale is None:
+        return rotation
+
+    scale = np.broadcast_to(np.asarray(scale, dtype=np.float64), [3])
+    if np.any(scale == 0):
+        raise ValueError(f"Cannot scale an object by {scale}")
+
+    return np.diag(scale) if rotation is None else rotation * scale
+
+def euler(angles, order="xyz", degrees=True):
+    """Returns the rotation matrix of successive rotations about the fixed x, y and z axes.
+
+    The object is first rotated by angles[0] about the first axis of `order`, then by angles[1]
+    about the second and angles[2] about the third, e.g. for an angle of attack `alpha` about z
+    `euler([0, 0, alpha])`.
+    """
+
+    angles = np.radians(angles) if degrees else np.asarray(angles, dtype=np.float64)
+
+    matrix = np.eye(3)
+    for axis, a in zip(order, angles):
+        d = "xyz".index(axis)
+        i, j = [e for e in range(3) if e != d]
+        r = np.eye(3)
+        r[i, i] = r[j, j] = np.cos(a)
+        r[i, j] = -np.sin(a)
+        r[j, i] = np.sin(a)
+        if d == 1:
+            r = r.T
+        matrix = r @ matrix
+
+    return matrix
+
+def _inverse(matrix):
+    """Inverts a placement matrix, rotations are inverted exactly by their transpose."""
+
+    if np.allclose(matrix @ matrix.T, np.eye(3), rtol=0, atol=1e-12):
+        return matrix.T
+
+    return np.linalg.inv(matrix)
+
+def _corners(x0, xn):
+    """Returns the 8 corners of the box [x0, xn]."""
+
+    return np.array([[(x0, xn)[i][0], (x0, xn)[j][1], (x0, xn)[k][2]]
+                     for k in range(2) for j in range(2) for i in range(2)])
+
+# Slab embedder and its arguments for the parallel embedding, inherited by the forked workers
+# rather than pickled.
+_worker_args = None
+
+def _embed_worker(k0, k1):
+    embed_slabs, args = _worker_args
+    embed_slabs(*args, k0, k1)
+
+def _embed_parallel(embed_slabs, args, k0, k1, workers):
+    """Embeds the slabs [k0, k1) into a shared array using a pool of forked processes, each
+    calling `embed_slabs(*args, k0, k1)` on its slabs."""
+
+    global _worker_args
+
+    # Use several slabs per worker to balance the load as the object cross-section varies along z
+    nk = max(k1 - k0, 0)
+    nslabs = min(4 * workers, nk)
+    if nslabs == 0:
+        return
+    ks = np.linspace(k0, k1, nslabs + 1).astype(int)
+
+    _worker_args = (embed_slabs, args)
+    try:
+        ctx = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            list(pool.map(_embed_worker, ks[:-1], ks[1:]))
+    finally:
+        _worker_args = None
 
-def _bounds(voxels, nxyz, dxyz, offset):
+def _bounds(voxels, coords, offset):
     """Determines the loop bounds for embedding using the correct offset."""
 
     x0, xn = voxels.bounding_box()
 
-    x0_global = x0 + offset
-    xn_global = xn + offset
+    return _box_bounds(x0 + offset, xn + offset, coords)
 
-    # convert the final physical coordinates to grid indices
-    # handle dxyz=0 for 2D cases to avoid division by zero
-    dxyz_safe = np.array([d if d > 0 else 1 for d in dxyz])
-    n0 = np.floor(x0_global / dxyz_safe).astype(int)
+def _box_bounds(x0_global, xn_global, coords):
+    """Determines the loop bounds covering the box [x0_global, xn_global) in the mesh.
 
-    nn = np.ceil(xn_global / dxyz_safe).astype(int)
+    The range runs from the last grid line at or below the lower corner to the first grid line at
+    or above the upper corner, found by a binary search of the coordinates of the grid lines along
+    each axis so that uniform and stretched meshes are handled alike. A box beyond the last grid
+    line gives an empty range.
+    """
 
-    nx, ny, nz = nxyz
-    n0[0] = max(n0[0], 0)
-    n0[1] = max(n0[1], 0)
-    n0[2] = max(n0[2], 0)
-    nn[0] = min(nn[0], nx)
-    nn[1] = min(nn[1], ny)
-    nn[2] = min(nn[2], nz)
+    n0 = np.array([max(np.searchsorted(c, x0_global[d], "right") - 1, 0)
+                   if x0_global[d] <= c[-1] else len(c) for d, c in enumerate(coords)])
+    nn = np.array([np.searchsorted(c, xn_global[d], "left") for d, c in enumerate(coords)])
 
     return [n0, nn]
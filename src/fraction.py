@@ -0,0 +1,140 @@
+""" src/fraction.py
+
+Module to compute IBM masks holding the fluid volume fraction of each grid cell.
+
+The cell of a grid point is the box spanning half way to its neighbouring points, one grid spacing
+centred on the point on a uniform mesh. A plain mask samples
+the geometry once per cell, at the grid point, so that the surface becomes a staircase whose
+position depends on how the geometry lines up with the mesh. Here the cells cut by the surface
+instead hold the fraction of their `samples`**3 regularly spaced sub-points which are fluid.
+
+The grid points are first classified as for a plain mask, the surface can only cut the cells of
+points which differ from one of their 26 neighbours. Only the blocks of the mesh holding such
+interface cells are refined, so that the cost of the refinement scales with the area of the
+surface rather than the volume of the mesh. The sub-points of the cells form a mesh `samples`
+times finer than the x3d2 mesh, onto which the objects are embedded with the same engines as a
+plain mask. Stretched meshes (a `grid.Grid` as `mesh_l`) give stretched fine meshes.
+"""
+
+import numpy as np
+
+from . import embed_stl
+from . import grid
+from . import instrument
+from . import mask
+from . import scene
+
+def embed_scene(placements, mesh_n, mesh_l, samples=4, block=8):
+    """Computes the volume fraction mask of a list of placed objects.
+
+    The placements are as for `scene.embed_scene`. Returns a float64 array in [z,y,x] order.
+    """
+
+    nx, ny, nz = mesh_n
+    return embed_block(placements, mesh_n, mesh_l, [0, 0, 0], [nz, ny, nx], samples, block)
+
+def iter_scene(placements, mesh_n, mesh_l, samples=4, nk=None, block=8):
+    """Computes the volume fraction mask of a list of placed objects one z-chunk at a time.
+
+    Yields (k0, chunk) as `scene.iter_scene`, by default the chunks hold roughly
+    `mask.CHUNK_BYTES` of data.
+    """
+
+    nx, ny, nz = mesh_n
+    if nk is None:
+        nk = max(mask.CHUNK_BYTES // max(ny * nx * np.dtype(np.float64).itemsize, 1), 1)
+
+    for k0 in range(0, nz, nk):
+        yield k0, embed_block(placements, mesh_n, mesh_l, [k0, 0, 0], [min(nk, nz - k0), ny, nx],
+                              samples, block)
+
+def embed_block(placements, mesh_n, mesh_l, start, count, samples=4, block=8):
+    """Computes the volume fraction mask of a block of the mesh.
+
+    The block is given by the [z,y,x] `start` index of its first point and its [z,y,x] `count`.
+    The interface cells are refined in blocks of `block` points per direction. Returns a float64
+    array of shape `count`.
+    """
+
+    placements = [scene.placement(p) for p in placements]
+    start = np.asarray(start, dtype=int)
+    count = np.asarray(count, dtype=int)
+
+    # Classify the grid points of the block and of a layer of one point around it, which is needed
+    # to find the interface cells on the faces of the block
+    h0 = np.maximum(start - 1, 0)
+    h1 = np.minimum(start + count + 1, np.flip(mesh_n))
+    nodes = mask.ones(np.flip(h1 - h0), dtype=np.uint8)
+    for p in placements:
+        embed_stl.embed_into(nodes, p.voxels, mesh_n, mesh_l, p.translation, p.transform,
+                             start=h0)
+
+    inner = tuple(slice(s, s + n) for s, n in zip(start - h0, count))
+    interface = _interface(nodes)[inner]
+    ibm = nodes[inner].astype(np.float64)
+    if not np.any(interface):
+        return ibm
+
+    # The sub-point m of the cell i is the point i*samples + m of the fine mesh, axes with a single
+    # point are not refined
+    fine_mesh = grid.Grid(*[_sub_points(c, samples) for c in grid.coordinates(mesh_n, mesh_l)])
+    fine_n = fine_mesh.n
+    sub = np.flip([samples if n > 1 else 1 for n in mesh_n])
+
+    # Only the blocks holding interface cells are visited
+    edges = [np.append(np.arange(0, n, block), n) for n in count]
+    flags = interface
+    for a in range(3):
+        flags = np.logical_or.reduceat(flags, edges[a][:-1], axis=a)
+
+    for kb, jb, ib in zip(*np.nonzero(flags)):
+        b0 = np.array([edges[0][kb], edges[1][jb], edges[2][ib]])
+        b1 = np.array([edges[0][kb + 1], edges[1][jb + 1], edges[2][ib + 1]])
+        region = tuple(slice(s, e) for s, e in zip(b0, b1))
+
+        fine = mask.ones(np.flip((b1 - b0) * sub), dtype=np.uint8)
+        with instrument.stage("refine", points=fine.size):
+            for p in placements:
+                embed_stl.embed_into(fine, p.voxels, fine_n, fine_mesh, p.translation, p.transform,
+                                     start=(start + b0) * sub)
+
+        nb = b1 - b0
+        frac = fine.reshape(nb[0], sub[0], nb[1], sub[1], nb[2], sub[2]).mean(axis=(1, 3, 5))
+        cut = interface[region]
+        ibm[region][cut] = frac[cut]
+
+    return ibm
+
+def _sub_points(c, samples):
+    """Returns the `samples` regularly spaced sub-points of the cell of each point along an axis.
+
+    The cell of a point spans half way to its neighbours, the cells of the first and last points
+    are centred on them. An axis with a single point is returned as it is.
+    """
+
+    if len(c) == 1:
+        return c
+
+    mid = (c[1:] + c[:-1]) / 2
+    lo = np.concatenate([[c[0] - (mid[0] - c[0])], mid])
+    hi = np.concatenate([mid, [c[-1] + (c[-1] - mid[-1])]])
+    m = (np.arange(samples) + 0.5) / samples
+
+    return (lo[:, None] + m[None, :] * (hi - lo)[:, None]).ravel()
+
+def _interface(nodes):
+    """Finds the points of a mask which differ from one of their 26 neighbours.
+
+    The mask is extended by repeating its faces, so that the points on the faces are compared to
+    their neighbours inside the mask only.
+    """
+
+    lo = hi = np.pad(nodes, 1, mode="edge")
+    for a in range(3):
+        index = [[slice(None)] * 3 for _ in range(3)]
+        for i in range(3):
+            index[i][a] = slice(i, lo.shape[a] - 2 + i)
+        lo = np.minimum(np.minimum(lo[tuple(index[0])], lo[tuple(index[1])]), lo[tuple(index[2])])
+        hi = np.maximum(np.maximum(hi[tuple(index[0])], hi[tuple(index[1])]), hi[tuple(index[2])])
+
+    return lo != hi
@@ -0,0 +1,413 @@
+""" src/geometry.py
+
+Module of analytic geometry described by signed distance functions.
+
+Shapes are built from primitives (sphere, box, cylinder, plane and extruded NACA foil) combined
+with union, intersection and difference nodes. The signed distance is negative inside a shape and
+is evaluated with [x,y,z] coordinate arrays which broadcast together, so that evaluating over the
+grid from 1D coordinate vectors only builds the arrays that a primitive actually depends on.
+
+The mask is generated in blocks of grid points: the signed distance at the centre of each block
+classifies blocks farther from the surface than their half-diagonal as entirely solid or fluid,
+only the blocks crossed by the surface are evaluated point by point. The cost of generating a mask
+therefore scales with the surface area of the shape rather than the volume of the domain.
+"""
+
+import abc
+
+import numpy as np
+
+from . import grid
+from . import mask
+
+# Number of (point, segment) pairs evaluated at once by the foil distance
+PAIR_BATCH = 1 << 22
+
+class Shape(abc.ABC):
+    """Base class of the signed distance shapes.
+
+    Shapes combine with `|` (union), `&` (intersection) and `-` (difference). Subclasses must
+    implement `sdf` and `bounding_box`.
+    """
+
+    @abc.abstractmethod
+    def sdf(self, x, y, z):
+        """Returns the signed distance at the points (x, y, z), negative inside the shape."""
+
+    @abc.abstractmethod
+    def bounding_box(self):
+        """Returns the limits of the bounding box as a coordinate pair, possibly infinite."""
+
+    def clip(self, lo, hi):
+        """Returns the part of the shape tree which can be solid in the box [lo, hi].
+
+        Subtrees whose bounding boxes miss the box are dropped, None is returned if no part of the
+        shape can be solid in the box.
+        """
+
+        return self if _overlaps(self.bounding_box(), lo, hi) else None
+
+    def __or__(self, other):
+        return Union(self, other)
+
+    def __and__(self, other):
+        return Intersection(self, other)
+
+    def __sub__(self, other):
+        return Difference(self, other)
+
+class Sphere(Shape):
+    def __init__(self, centre, radius):
+        """A sphere of the given `radius` about `centre`."""
+
+        self.centre = np.asarray(centre, dtype=np.float64)
+        self.radius = radius
+
+    def sdf(self, x, y, z):
+        c = self.centre
+        return np.sqrt((x - c[0])**2 + (y - c[1])**2 + (z - c[2])**2) - self.radius
+
+    def bounding_box(self):
+        return [self.centre - self.radius, self.centre + self.radius]
+
+class Box(Shape):
+    def __init__(self, x0, xn):
+        """An axis-aligned box with corners x0 and xn."""
+
+        self.x0 = np.asarray(x0, dtype=np.float64)
+        self.xn = np.asarray(xn, dtype=np.float64)
+
+    def sdf(self, x, y, z):
+        c = (self.x0 + self.xn) / 2
+        h = (self.xn - self.x0) / 2
+        q = [abs(x - c[0]) - h[0], abs(y - c[1]) - h[1], abs(z - c[2]) - h[2]]
+
+        outside = np.sqrt(sum(np.maximum(qd, 0)**2 for qd in q))
+        inside = np.minimum(np.maximum(np.maximum(q[0], q[1]), q[2]), 0)
+        return outside + inside
+
+    def bounding_box(self):
+        return [self.x0, self.xn]
+
+class Cylinder(Shape):
+    def __init__(self, centre, axis, radius, length=np.inf):
+        """A cylinder of the given `radius` about the line through `centre` along `axis`.
+
+        The cylinder is capped at `length` / 2 either side of `centre`, by default it is infinite.
+        """
+
+        self.centre = np.asarray(centre, dtype=np.float64)
+        self.axis = np.asarray(axis, dtype=np.float64) / np.linalg.norm(axis)
+        self.radius = radius
+        self.length = length
+
+    def sdf(self, x, y, z):
+        p = [x - self.centre[0], y - self.centre[1], z - self.centre[2]]
+        u = self.axis
+
+        # Distance along the axis and the radius from the axis
+        t = p[0] * u[0] + p[1] * u[1] + p[2] * u[2]
+        r = np.sqrt(sum((p[d] - t * u[d])**2 for d in range(3)))
+
+        return _extrude(r - self.radius, abs(t) - self.length / 2)
+
+    def bounding_box(self):
+        # The caps are discs of the cylinder's radius normal to the axis
+        u = self.axis
+        disc = self.radius * np.sqrt(np.maximum(1 - u**2, 0))
+        half = abs(u) * self.length / 2 + disc if np.isfinite(self.length) else \
+            np.where(u != 0, np.inf, self.radius)
+
+        return [self.centre - half, self.centre + half]
+
+class Plane(Shape):
+    def __init__(self, point, normal):
+        """The half-space behind the plane through `point` with outward `normal`."""
+
+        self.point = np.asarray(point, dtype=np.float64)
+        self.normal = np.asarray(normal, dtype=np.float64) / np.linalg.norm(normal)
+
+    def sdf(self, x, y, z):
+        n = self.normal
+        return (x - self.point[0]) * n[0] + (y - self.point[1]) * n[1] + (z - self.point[2]) * n[2]
+
+    def bounding_box(self):
+        # The half-space is only bounded along axes which it does not cross
+        lo = np.full(3, -np.inf)
+        hi = np.full(3, np.inf)
+        for d in range(3):
+            if np.count_nonzero(self.normal) == 1 and self.normal[d] > 0:
+                hi[d] = self.point[d]
+            elif np.count_nonzero(self.normal) == 1 and self.normal[d] < 0:
+                lo[d] = self.point[d]
+
+        return [lo, hi]
+
+class Foil(Shape):
+    def __init__(self, naca="0012", chord=1.0, span=1.0, origin=[0, 0, 0], alpha=0.0, n=100):
+        """A NACA 4-digit foil section in the (x, y) plane extruded along z.
+
+        The leading edge is at `origin` with the chord along x and the section extruded from
+        origin[2] to origin[2] + span. The section is pitched nose up by `alpha` degrees about the
+        leading edge and represented by a closed polygon with `n` points on each surface.
+        """
+
+        self.naca = naca
+        self.chord = chord
+        self.span = span
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.alpha = alpha
+
+        self.polygon = naca4(naca, n) * chord
+
+    def _section(self, x, y):
+        """Rotates the points (x, y) into the frame of the foil section."""
+
+        a = np.radians(self.alpha)
+        xr = x - self.origin[0]
+        yr = y - self.origin[1]
+
+        return np.cos(a) * xr - np.sin(a) * yr, np.sin(a) * xr + np.cos(a) * yr
+
+    def sdf(self, x, y, z):
+        xs, ys = self._section(x, y)
+        zs = z - self.origin[2]
+
+        return _extrude(polygon_sdf(self.polygon, xs, ys), abs(zs - self.span / 2) - self.span / 2)
+
+    def bounding_box(self):
+        a = np.radians(self.alpha)
+        px, py = self.polygon[:, 0], self.polygon[:, 1]
+        x = np.cos(a) * px + np.sin(a) * py
+        y = -np.sin(a) * px + np.cos(a) * py
+
+        lo = self.origin + [x.min(), y.min(), 0]
+        hi = self.origin + [x.max(), y.max(), self.span]
+        return [lo, hi]
+
+class Union(Shape):
+    def __init__(self, *shapes):
+        """The union of the shapes."""
+
+        self.shapes = shapes
+
+    def sdf(self, x, y, z):
+        return _reduce(np.minimum, [s.sdf(x, y, z) for s in self.shapes])
+
+    def bounding_box(self):
+        boxes = [s.bounding_box() for s in self.shapes]
+        return [np.min([b[0] for b in boxes], axis=0), np.max([b[1] for b in boxes], axis=0)]
+
+    def clip(self, lo, hi):
+        shapes = [c for c in (s.clip(lo, hi) for s in self.shapes) if c is not None]
+        if len(shapes) == 0:
+            return None
+        return shapes[0] if len(shapes) == 1 else Union(*shapes)
+
+class Intersection(Shape):
+    def __init__(self, *shapes):
+        """The intersection of the shapes."""
+
+        self.shapes = shapes
+
+    def sdf(self, x, y, z):
+        return _reduce(np.maximum, [s.sdf(x, y, z) for s in self.shapes])
+
+    def bounding_box(self):
+        boxes = [s.bounding_box() for s in self.shapes]
+        return [np.max([b[0] for b in boxes], axis=0), np.min([b[1] for b in boxes], axis=0)]
+
+    def clip(self, lo, hi):
+        shapes = [s.clip(lo, hi) for s in self.shapes]
+        if any(s is None for s in shapes):
+            return None
+        return Intersection(*shapes)
+
+class Difference(Shape):
+    def __init__(self, a, b):
+        """The shape `a` with `b` removed."""
+
+        self.a = a
+        self.b = b
+
+    def sdf(self, x, y, z):
+        return np.maximum(self.a.sdf(x, y, z), -self.b.sdf(x, y, z))
+
+    def bounding_box(self):
+        return self.a.bounding_box()
+
+    def clip(self, lo, hi):
+        a = self.a.clip(lo, hi)
+        if a is None:
+            return None
+
+        b = self.b.clip(lo, hi)
+        return a if b is None else Difference(a, b)
+
+def naca4(code, n=100):
+    """Returns the closed polygon of a NACA 4-digit section with unit chord.
+
+    The (2n - 1, 2) vertices run from the trailing edge over the upper surface to the leading edge
+    and back along the lower surface, with cosine spacing along the chord.
+    """
+
+    m = int(code[0]) / 100
+    p = int(code[1]) / 10
+    t = int(code[2:]) / 100
+
+    x = (1 - np.cos(np.linspace(0, np.pi, n))) / 2
+    yt = 5 * t * (0.2969 * np.sqrt(x) - 0.1260 * x - 0.3516 * x**2 + 0.2843 * x**3 - 0.1015 * x**4)
+
+    # Mean camber line and its slope
+    yc = np.zeros_like(x)
+    dyc = np.zeros_like(x)
+    if m > 0:
+        fore = x < p
+        yc = np.where(fore, m / p**2 * (2 * p * x - x**2),
+                      m / (1 - p)**2 * (1 - 2 * p + 2 * p * x - x**2))
+        dyc = np.where(fore, 2 * m / p**2 * (p - x), 2 * m / (1 - p)**2 * (p - x))
+    theta = np.arctan(dyc)
+
+    upper = np.stack([x - yt * np.sin(theta), yc + yt * np.cos(theta)], axis=-1)
+    lower = np.stack([x + yt * np.sin(theta), yc - yt * np.cos(theta)], axis=-1)
+
+    return np.concatenate([upper[::-1], lower[1:]])
+
+def polygon_sdf(polygon, x, y):
+    """Returns the signed distance of the points (x, y) from a closed polygon.
+
+    The distance to the nearest edge is negative for points inside the polygon by the even-odd
+    rule. The points are processed in batches to bound the size of the (point, edge) arrays.
+    """
+
+    x, y = np.broadcast_arrays(x, y)
+    shape = x.shape
+    px = x.ravel()
+    py = y.ravel()
+
+    a = polygon
+    b = np.roll(polygon, -1, axis=0)
+    e = b - a
+    ee = np.maximum((e**2).sum(axis=-1), np.finfo(np.float64).tiny)
+
+    d = np.empty(px.shape)
+    batch = max(PAIR_BATCH // len(a), 1)
+    for i0 in range(0, len(px), batch):
+        qx = px[i0:i0 + batch, np.newaxis] - a[:, 0]
+        qy = py[i0:i0 + batch, np.newaxis] - a[:, 1]
+
+        t = np.clip((qx * e[:, 0] + qy * e[:, 1]) / ee, 0, 1)
+        dist = np.sqrt(((qx - t * e[:, 0])**2 + (qy - t * e[:, 1])**2).min(axis=-1))
+
+        # Count the edges crossed by a ray along +x
+        yi = py[i0:i0 + batch, np.newaxis]
+        span = (a[:, 1] > yi) != (b[:, 1] > yi)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xc = a[:, 0] + (yi - a[:, 1]) * e[:, 0] / e[:, 1]
+        inside = np.count_nonzero(span & (px[i0:i0 + batch, np.newaxis] < xc), axis=-1) % 2 == 1
+
+        d[i0:i0 + batch] = np.where(inside, -dist, dist)
+
+    return d.reshape(shape)
+
+def embed(shape, mesh_n, mesh_l, dtype=np.float64, block=16):
+    """Generates the IBM array of a shape.
+
+    Points where the signed distance is <= 0 are set to 0 (solid), see `embed_into`.
+    """
+
+    ibm = mask.ones(mesh_n, dtype=dtype)
+    n0, nn = embed_into(ibm, shape, mesh_n, mesh_l, block=block)
+    print(f"Working range (indices): {n0} -> {nn}")
+
+    return ibm
+
+def embed_into(ibm, shape, mesh_n, mesh_l, start=[0, 0, 0], block=16):
+    """Embeds a shape into an existing IBM array.
+
+    The array may hold a sub-block of the mesh whose first point is at the global [z,y,x] index
+    `start`. The grid points in the bounding box of the shape are split into blocks of `block`
+    points per direction, blocks whose centre is farther from the surface than their half-diagonal
+    are filled without evaluating their points. The array is updated one layer of blocks at a time.
+
+    Returns the working range [n0, nn) as global [x,y,z] indices.
+    """
+
+    coords = grid.coordinates(mesh_n, mesh_l)
+
+    lo, hi = shape.bounding_box()
+    origin = np.flip(np.array(start))
+    end = origin + np.flip(ibm.shape)
+    n0, nn = grid.box_range(lo, hi, coords)
+    n0 = np.maximum(n0, origin)
+    nn = np.minimum(nn, end)
+    if np.any(nn <= n0):
+        return [n0, nn]
+
+    # The first index of each block along each direction, with the end of the range appended
+    edges = [np.append(np.arange(n0[d], nn[d], block), nn[d]) for d in range(3)]
+    centre = []
+    half = []
+    for d in range(3):
+        c0 = coords[d][edges[d][:-1]]
+        c1 = coords[d][edges[d][1:] - 1]
+        shp = [1, 1, 1]
+        shp[2 - d] = len(c0)
+        centre.append(((c0 + c1) / 2).reshape(shp))
+        half.append(((c1 - c0) / 2).reshape(shp))
+
+    # Classify the blocks from the signed distance at their centres, |sdf| never overestimates the
+    # distance from the surface
+    s = shape.sdf(centre[0], centre[1], centre[2])
+    diag = np.sqrt(half[0]**2 + half[1]**2 + half[2]**2) * (1 + 1e-9)
+    solid = s < -diag
+    surface = abs(s) <= diag
+
+    x, y, z = coords
+    ex, ey, ez = edges
+    for kb in range(len(ez) - 1):
+        if not np.any(solid[kb] | surface[kb]):
+            continue
+
+        k0, k1 = ez[kb], ez[kb + 1]
+        layer = np.repeat(np.repeat(solid[kb], np.diff(ey), axis=0), np.diff(ex), axis=1)
+        layer = np.broadcast_to(layer, (k1 - k0,) + layer.shape).copy()
+
+        for jb, ib in zip(*np.nonzero(surface[kb])):
+            j0, j1 = ey[jb], ey[jb + 1]
+            i0, i1 = ex[ib], ex[ib + 1]
+
+            local = shape.clip([x[i0], y[j0], z[k0]], [x[i1 - 1], y[j1 - 1], z[k1 - 1]])
+            if local is None:
+                continue
+
+            d = local.sdf(x[np.newaxis, np.newaxis, i0:i1], y[np.newaxis, j0:j1, np.newaxis],
+                          z[k0:k1, np.newaxis, np.newaxis])
+            layer[:, j0 - n0[1]:j1 - n0[1], i0 - n0[0]:i1 - n0[0]] = d <= 0
+
+        # Read, modify and write the layer so that compact and packed masks are supported
+        region = (slice(k0 - origin[2], k1 - origin[2]),
+                  slice(n0[1] - origin[1], nn[1] - origin[1]),
+                  slice(n0[0] - origin[0], nn[0] - origin[0]))
+        values = ibm[region]
+        values[layer] = 0
+        ibm[region] = values
+
+    return [n0, nn]
+
+def _overlaps(box, lo, hi):
+    """Tests whether the bounding box overlaps the box [lo, hi]."""
+
+    return bool(np.all(box[0] <= np.asarray(hi)) and np.all(box[1] >= np.asarray(lo)))
+
+def _reduce(op, values):
+    result = values[0]
+    for v in values[1:]:
+        result = op(result, v)
+
+    return result
+
+def _extrude(d, h):
+    """Combines the signed distance `d` in a section with the distance `h` past its end caps."""
+
+    return np.sqrt(np.maximum(d, 0)**2 + np.maximum(h, 0)**2) + np.minimum(np.maximum(d, h), 0)
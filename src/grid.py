@@ -0,0 +1,130 @@
+""" src/grid.py
+
+Module describing the x3d2 mesh by the coordinates of its grid lines along each axis.
+
+The embedders take the mesh as the number of points `mesh_n` = [nx, ny, nz] and either the size of
+the domain `mesh_l` = [Lx, Ly, Lz], for a uniform mesh with the points `i * Lx / (nx - 1)`, or a
+Grid holding the coordinates of the points along each axis, e.g. for a mesh stretched in y as in
+x3d2. The coordinates are only ever used as 1D tables which are broadcast against each other, the
+range of points covered by an object is found by a binary search of the tables, so that stretched
+meshes cost the same to embed into as uniform ones.
+"""
+
+import numpy as np
+
+class Grid:
+    def __init__(self, x, y, z):
+        """A rectilinear mesh given by the strictly increasing coordinates of its points along x, y
+        and z."""
+
+        self.coords = [np.asarray(c, dtype=np.float64) for c in (x, y, z)]
+        for axis, c in zip("xyz", self.coords):
+            if c.ndim != 1 or len(c) == 0:
+                raise ValueError(f"The {axis} coordinates must be a non-empty 1D array")
+            if np.any(np.diff(c) <= 0):
+                raise ValueError(f"The {axis} coordinates must be strictly increasing")
+
+    @classmethod
+    def uniform(cls, mesh_n, mesh_l):
+        """Returns the uniform mesh of `mesh_n` points spanning [0, mesh_l]."""
+
+        return cls(*uniform(mesh_n, mesh_l))
+
+    @classmethod
+    def stretched(cls, mesh_n, mesh_l, beta, istret=1, axis=1, periodic=False):
+        """Returns the mesh of `mesh_n` points spanning [0, mesh_l], stretched along `axis` (y by
+        default) as x3d2 does, see `stretching`."""
+
+        coords = uniform(mesh_n, mesh_l)
+        coords[axis] = stretching(mesh_n[axis], mesh_l[axis], beta, istret, periodic)
+
+        return cls(*coords)
+
+    @property
+    def n(self):
+        """The number of points [nx, ny, nz]."""
+
+        return [len(c) for c in self.coords]
+
+    @property
+    def l(self):
+        """The size of the domain [Lx, Ly, Lz]."""
+
+        return [float(c[-1] - c[0]) for c in self.coords]
+
+    def __repr__(self):
+        return f"Grid(n={self.n}, l={self.l})"
+
+def uniform(mesh_n, mesh_l):
+    """Returns the coordinates of the points of a uniform mesh along x, y and z."""
+
+    return [np.arange(n) * (l / (n - 1) if n > 1 else 0) for n, l in zip(mesh_n, mesh_l)]
+
+def stretching(n, length, beta, istret=1, periodic=False):
+    """Returns the coordinates of `n` points spanning [0, length] stretched as in x3d2.
+
+    This is the mesh stretching of Incompact3d, which x3d2 inherits: the points are refined in the
+    centre of the domain (`istret` 1), near both ends (2) or near the start only (3), more strongly
+    for smaller `beta`, and become uniform as `beta` grows. `istret` 0 gives a uniform mesh. A
+    periodic axis does not repeat the point at `length`.
+    """
+
+    if istret == 0:
+        return np.arange(n) * length / (n if periodic else n - 1)
+    if istret not in (1, 2, 3):
+        raise ValueError(f"Unknown stretching {istret}, expected 0, 1, 2 or 3")
+    if beta <= 0:
+        raise ValueError(f"The stretching parameter beta must be positive, got {beta}")
+
+    yinf = -length / 2
+    alpha = abs((-yinf - np.sqrt(np.pi**2 * beta**2 + yinf**2)) / (2 * beta * yinf))
+
+    # The points are equally spaced in eta, and mapped by the integral of a spacing which is
+    # smallest where sin(pi eta)^2 is largest. The arctangent is unwrapped across its branches
+    start, end = {1: (0.0, 1.0), 2: (-0.5, 0.5), 3: (-0.5, 0.0)}[istret]
+    eta = start + (end - start) * np.arange(n) / (n if periodic else n - 1)
+    a = np.sqrt(alpha * beta + 1) / np.sqrt(alpha * beta)
+
+    def f(e):
+        return np.arctan(a * np.tan(np.pi * e)) + np.pi * np.round(e)
+
+    return length * (f(eta) - f(start)) / (f(end) - f(start))
+
+def coordinates(mesh_n, mesh_l):
+    """Returns the coordinates of the points of the mesh along x, y and z.
+
+    `mesh_l` is either the size of the domain of a uniform mesh or a Grid, whose number of points
+    must match `mesh_n`.
+    """
+
+    if isinstance(mesh_l, Grid):
+        if list(mesh_n) != mesh_l.n:
+            raise ValueError(f"The mesh has {list(mesh_n)} points but the grid {mesh_l.n}")
+        return mesh_l.coords
+
+    return uniform(mesh_n, mesh_l)
+
+def spacing(mesh_n, mesh_l):
+    """Returns the smallest grid spacing along x, y and z, 0 along axes with a single point."""
+
+    if not isinstance(mesh_l, Grid):
+        return np.array([l / (n - 1) if n > 1 else 0.0 for n, l in zip(mesh_n, mesh_l)])
+
+    return np.array([np.diff(c).min() if len(c) > 1 else 0.0
+                     for c in coordinates(mesh_n, mesh_l)])
+
+def centre(mesh_l):
+    """Returns the [x,y,z] centre of the domain."""
+
+    if isinstance(mesh_l, Grid):
+        return np.array([(c[0] + c[-1]) / 2 for c in mesh_l.coords])
+
+    return np.array(mesh_l, dtype=np.float64) / 2
+
+def box_range(lo, hi, coords):
+    """Returns the range [n0, nn) of the points inside the box [lo, hi] as [x,y,z] indices."""
+
+    n0 = np.array([np.searchsorted(c, lo[d], "left") for d, c in enumerate(coords)])
+    nn = np.array([np.searchsorted(c, hi[d], "right") for d, c in enumerate(coords)])
+
+    return [n0, nn]
@@ -0,0 +1,189 @@
+""" src/incremental.py
+
+Module to update an IBM mask when the placement of some objects changes.
+
+Only the working ranges of the changed objects, before and after the change, need to be
+re-evaluated: each range is reset to fluid and every object of the new scene which reaches it is
+embedded again. The cost of an update therefore scales with the size of the moved objects rather
+than the mesh. The re-evaluated blocks can be applied to a mask in memory or written as a delta file
+in the sparse mask format of `writer.write_sparse_mask`, both of which cost O(object box). They
+can also be patched into an existing mask file, which rewrites the whole file.
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+from . import embed_stl
+from . import mask
+from . import scene
+from . import writer
+
+def changed_ranges(old, new, mesh_n, mesh_l):
+    """Returns the disjoint [n0, nn) index ranges, in [x,y,z] order, which change between the
+    placements `old` and `new`.
+
+    The placements are matched by position in the lists, a placement which differs in its object,
+    translation, rotation or scale (or which was added or removed) changes the working ranges it
+    covers before and after the change.
+    """
+
+    old = [scene.placement(p) for p in old]
+    new = [scene.placement(p) for p in new]
+
+    ranges = []
+    for i in range(max(len(old), len(new))):
+        p = old[i] if i < len(old) else None
+        q = new[i] if i < len(new) else None
+        if p is not None and q is not None and _same(p, q):
+            continue
+
+        for r in [p, q]:
+            if r is None:
+                continue
+            n0, nn = embed_stl.working_range(r.voxels, mesh_n, mesh_l, r.translation, r.transform)
+            n0 = np.maximum(n0, 0)
+            nn = np.minimum(nn, mesh_n)
+            if np.all(nn > n0):
+                ranges.append([n0, nn])
+
+    return scene.merge_ranges(ranges)
+
+def reembed(old, new, mesh_n, mesh_l, workers=1, dtype=np.uint8):
+    """Re-evaluates the parts of the mesh which change between the placements `old` and `new`.
+
+    Returns a list of ([z,y,x] start, block) pairs holding the mask of the new scene over the
+    changed ranges, see `changed_ranges`.
+    """
+
+    new = [scene.placement(p) for p in new]
+
+    blocks = []
+    for n0, nn in changed_ranges(old, new, mesh_n, mesh_l):
+        start = np.flip(n0)
+        block = mask.ones(nn - n0, dtype=dtype, shared=workers > 1)
+        for p in new:
+            embed_stl.embed_into(block, p.voxels, mesh_n, mesh_l, p.translation, p.transform,
+                                 workers, start=start)
+        print(f"Re-embedded (indices): {n0} -> {nn}")
+        blocks.append((start, block))
+
+    return blocks
+
+def apply(ibm, blocks):
+    """Patches the blocks into a mask in place."""
+
+    for start, block in blocks:
+        ibm[_region(start, np.shape(block))] = np.asarray(block)
+
+    return ibm
+
+def write_delta(filename, blocks, shape, encoding="dense", compression=None):
+    """Writes the re-evaluated blocks to a delta file.
+
+    The delta uses the sparse mask format, `apply_delta` patches it into a mask.
+    """
+
+    writer.write_sparse_mask(filename, blocks, shape, encoding=encoding, compression=compression)
+
+def apply_delta(ibm, filename):
+    """Patches the blocks of a delta file into a mask in place."""
+
+    _, _, blocks = writer.read_blocks(filename)
+    return apply(ibm, blocks)
+
+def patch_file(filename, blocks, nk=None, compression=None):
+    """Patches the blocks into an existing mask file written by `writer.write_mask`.
+
+    ADIOS2 files cannot be modified in place, so this is a full rewrite: the mask is streamed from
+    the file one z-chunk at a time, patched and written to `<filename>.patch`, which then replaces
+    the original. Reading and writing cost O(domain) however small the blocks, use `write_delta`
+    to keep the output O(object box). The original is only removed once the patched file is in
+    place, and the partial patched file is removed if the rewrite fails. Only the mask itself is
+    re-embedded, fields derived from it such as the distance fields cannot be patched. This
+    requires the ADIOS2 Stream API.
+    """
+
+    with writer.Stream(filename, "r") as s:
+        for _ in s.steps():
+            variables = s.available_variables()
+            extra = set(variables) - {"iibm", "ep1"}
+            if extra:
+                raise ValueError(f"Cannot patch {filename}, it holds the fields {sorted(extra)}")
+
+            iibm = s.read("iibm")
+            shape = [int(n) for n in variables["ep1"]["Shape"].split(",")]
+            nz, ny, nx = shape
+            if nk is None:
+                nk = max(mask.CHUNK_BYTES // max(ny * nx * 8, 1), 1)
+
+            tmp = filename.rstrip(os.sep) + ".patch"
+            try:
+                with writer.MaskWriter(tmp, shape, compression=compression) as w:
+                    w.write_scalar("iibm", int(np.ravel(iibm)[0]))
+                    for k0 in range(0, nz, nk):
+                        k1 = min(k0 + nk, nz)
+                        chunk = s.read("ep1", [k0, 0, 0], [k1 - k0, ny, nx])
+                        apply(chunk, _clip(blocks, k0, k1))
+                        w.write_block("ep1", chunk, [k0, 0, 0])
+            except BaseException:
+                _remove(tmp)
+                raise
+
+    _replace(tmp, filename)
+
+def _replace(src, dst):
+    """Replaces the file or directory `dst` by `src`.
+
+    A directory cannot be replaced in one step, it is first renamed to a backup which is only
+    removed once `src` is in place, so that either the original or the new file exists at all
+    times.
+    """
+
+    if not os.path.isdir(dst):
+        os.replace(src, dst)
+        return
+
+    backup = dst.rstrip(os.sep) + ".orig"
+    _remove(backup)
+    os.replace(dst, backup)
+    try:
+        os.replace(src, dst)
+    except BaseException:
+        os.replace(backup, dst)
+        _remove(src)
+        raise
+    _remove(backup)
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def _same(p, q):
+    """Tests whether two placements place the same object in the same way."""
+
+    if p.voxels is not q.voxels or not np.array_equal(p.translation, q.translation):
+        return False
+    if p.transform is None or q.transform is None:
+        return p.transform is None and q.transform is None
+
+    return np.array_equal(p.transform, q.transform)
+
+def _clip(blocks, k0, k1):
+    """Returns the parts of the blocks in the z-chunk [k0, k1), relative to the chunk."""
+
+    clipped = []
+    for start, block in blocks:
+        b0 = max(k0, start[0])
+        b1 = min(k1, start[0] + np.shape(block)[0])
+        if b0 < b1:
+            part = np.asarray(block[b0 - start[0]:b1 - start[0]])
+            clipped.append(([b0 - k0, start[1], start[2]], part))
+
+    return clipped
+
+def _region(start, shape):
+    return tuple(slice(s, s + n) for s, n in zip(start, shape))
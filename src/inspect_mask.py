@@ -0,0 +1,147 @@
+""" src/inspect_mask.py
+
+Module to inspect, validate and compare the IBM masks of existing ADIOS2 files.
+
+Production masks are too large to load whole, so `ep1` is streamed back one z-chunk at a time with
+ADIOS2 selections and only reductions of each chunk are kept: the number of solid points, the
+values other than 0 and 1 and the bounding boxes of the bodies, the face-connected components of
+the solid points (see `regions.Regions`). Two masks are compared in the same way, the differing
+regions being the connected components of the points where the masks differ.
+
+This requires the ADIOS2 Stream API.
+"""
+
+import os
+
+import numpy as np
+
+from . import mask
+from . import regions as mask_regions
+from . import writer
+
+# Number of distinct values other than 0 and 1 listed by `inspect`
+MAX_VALUES = 10
+
+def shape(filename, name="ep1"):
+    """Returns the global [z,y,x] shape of the mask in `filename` and whether it is sparse."""
+
+    if not os.path.exists(filename):
+        raise ValueError(f"{filename} does not exist")
+
+    with writer.Stream(filename, "r") as s:
+        for _ in s.steps():
+            variables = s.available_variables()
+            sparse = f"{writer.sparse_name(name)}_shape"
+            if sparse in variables:
+                return [int(n) for n in s.read(sparse)], True
+            if name in variables:
+                return [int(n) for n in variables[name]["Shape"].split(",")], False
+
+    raise ValueError(f"{filename} holds no mask {name}")
+
+def iter_chunks(filename, name="ep1", nk=None):
+    """Iterates over the mask in `filename` in z-chunks of `nk` planes, yielding (k0, chunk).
+
+    Dense masks are read with one selection per chunk, so that only a chunk is in memory at a time.
+    The blocks of sparse masks are small by construction, they are read at once and the chunks are
+    filled from them. By default the chunks hold roughly `mask.CHUNK_BYTES` of float64 data.
+    """
+
+    (nz, ny, nx), sparse = shape(filename, name)
+    if nk is None:
+        nk = max(mask.CHUNK_BYTES // max(ny * nx * 8, 1), 1)
+
+    if sparse:
+        _, fill, blocks = writer.read_blocks(filename, name)
+        for k0 in range(0, nz, nk):
+            k1 = min(k0 + nk, nz)
+            chunk = np.full([k1 - k0, ny, nx], fill)
+            for start, block in blocks:
+                b0, b1 = max(k0, start[0]), min(k1, start[0] + block.shape[0])
+                if b0 < b1:
+                    chunk[b0 - k0:b1 - k0,
+                          start[1]:start[1] + block.shape[1],
+                          start[2]:start[2] + block.shape[2]] = block[b0 - start[0]:b1 - start[0]]
+            yield k0, chunk
+        return
+
+    with writer.Stream(filename, "r") as s:
+        for _ in s.steps():
+            for k0 in range(0, nz, nk):
+                k1 = min(k0 + nk, nz)
+                yield k0, s.read(name, [k0, 0, 0], [k1 - k0, ny, nx])
+
+def inspect(filename, name="ep1", nk=None, bodies=True):
+    """Summarises the mask in `filename`, read one z-chunk at a time.
+
+    Returns a dict holding the [z,y,x] `shape`, the number of `solid` (0) points and the `fraction`
+    of the domain they fill, the number of points holding values other than 0 and 1 (`invalid`),
+    up to MAX_VALUES of those `values` (followed by NaN if found) and the [z,y,x] index of the
+    `first` such point. With `bodies` the solid bodies are listed as ([z,y,x] start, [z,y,x] end,
+    number of points), see `regions.Regions`.
+    """
+
+    dims, _ = shape(filename, name)
+    solid = 0
+    invalid = 0
+    values = set()
+    nan = False
+    first = None
+    regions = mask_regions.Regions() if bodies else None
+
+    for k0, chunk in iter_chunks(filename, name, nk):
+        zero = chunk == 0
+        solid += int(np.count_nonzero(zero))
+
+        other = ~zero & (chunk != 1)
+        if np.any(other):
+            invalid += int(np.count_nonzero(other))
+            if first is None:
+                first = [int(i) for i in np.argwhere(other)[0]]
+                first[0] += k0
+            found = np.unique(chunk[other])
+            nan = nan or bool(np.isnan(found[-1]))
+            if len(values) < MAX_VALUES:
+                values.update(found[~np.isnan(found)][:MAX_VALUES].tolist())
+
+        if regions is not None:
+            regions.add(k0, zero)
+
+    summary = {"file": filename, "shape": dims, "solid": solid,
+               "fraction": solid / max(int(np.prod(dims)), 1), "invalid": invalid,
+               "values": sorted(values)[:MAX_VALUES] + [float("nan")] * nan, "first": first}
+    if regions is not None:
+        summary["bodies"] = regions.regions()
+
+    return summary
+
+def diff(filename_a, filename_b, name="ep1", nk=None, atol=0.0):
+    """Compares the masks in two files one z-chunk at a time.
+
+    Points differ when their values are more than `atol` apart. Returns a dict holding the [z,y,x]
+    `shape`, the number of `different` points, the number of points solid only in the first file
+    (`solid_a`) or only in the second (`solid_b`) and the differing `regions`, see
+    `regions.Regions`.
+    """
+
+    dims, _ = shape(filename_a, name)
+    dims_b, _ = shape(filename_b, name)
+    if dims != dims_b:
+        raise ValueError(f"The masks have different shapes {dims} and {dims_b}")
+    if nk is None:
+        nk = max(mask.CHUNK_BYTES // max(dims[1] * dims[2] * 8, 1), 1)
+
+    different = 0
+    solid_a = 0
+    solid_b = 0
+    regions = mask_regions.Regions()
+    chunks = zip(iter_chunks(filename_a, name, nk), iter_chunks(filename_b, name, nk))
+    for (k0, a), (_, b) in chunks:
+        differ = ~(np.abs(a - b) <= atol)
+        different += int(np.count_nonzero(differ))
+        solid_a += int(np.count_nonzero((a == 0) & (b != 0)))
+        solid_b += int(np.count_nonzero((b == 0) & (a != 0)))
+        regions.add(k0, differ)
+
+    return {"files": [filename_a, filename_b], "shape": dims, "different": different,
+            "solid_a": solid_a, "solid_b": solid_b, "regions": regions.regions()}
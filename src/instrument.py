@@ -0,0 +1,267 @@
+""" src/instrument.py
+
+Module to record the time and memory used by the stages of the mask generation.
+
+The pipeline marks its stages (loading the STL file, voxelising, computing the working ranges,
+embedding each object and writing) with `stage`. While a Report is active, each stage records its
+wall and CPU time, the increase of the resident set size (RSS) of the process over its RSS on
+entering the stage and the number of grid points it visited, accumulated over every time it is
+entered (the largest increase is kept). The times of a stage exclude the stages nested in it, so the
+stages add up to the total, whereas the RSS increase of a stage includes its nested stages. When no
+report is active `stage` does nothing.
+
+The peak RSS within a stage is only seen by the kernel's high-water mark, which is attributed to a
+stage when it rose during the stage; otherwise the RSS on leaving the stage is taken. The CPU time
+and the high-water mark include the forked worker processes which finished during the stage.
+"""
+
+import datetime
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+# The active report, see Report
+_active = None
+
+class Stage:
+    def __init__(self, name):
+        """Accumulates the measurements of a stage of the pipeline."""
+
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.points = 0
+        self.rss_increase = 0.0
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "wall_s": self.wall,
+            "cpu_s": self.cpu,
+            "points": self.points,
+            "points_per_s": self.points / self.wall if self.points and self.wall > 0 else None,
+            "rss_increase_mib": self.rss_increase,
+        }
+
+class Report:
+    def __init__(self, progress=True, **meta):
+        """Records the stages of the pipeline while active.
+
+        The report is activated by using it as a context manager. The keyword arguments describe
+        the run (e.g. the mesh) and are stored in the report as they are. With `progress` long
+        loops reporting through Progress print their progress and estimated time to completion.
+        """
+
+        self.meta = meta
+        self.progress = progress
+        self.stages = {}
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rss_increase = 0.0
+        self._stack = []
+
+    def __enter__(self):
+        global _active
+
+        self._previous = _active
+        _active = self
+        self._start = (time.perf_counter(), _cpu(), _rss())
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+
+        _active = self._previous
+        self.wall += time.perf_counter() - self._start[0]
+        self.cpu += _cpu() - self._start[1]
+        self.rss_increase = max(self.rss_increase, rss_increase(self._start[2]))
+
+    def as_dict(self):
+        return {
+            "meta": self.meta,
+            "environment": {
+                "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "host": platform.node(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "python": platform.python_version(),
+            },
+            "total": {"wall_s": self.wall, "cpu_s": self.cpu,
+                      "rss_increase_mib": self.rss_increase, "process_peak_rss_mib": peak_rss()},
+            "stages": [s.as_dict() for s in self.stages.values()],
+        }
+
+    def write(self, filename):
+        """Writes the report as JSON."""
+
+        with open(filename, "w") as fh:
+            json.dump(self.as_dict(), fh, indent=2)
+
+    def summary(self):
+        """Returns a table of the stages."""
+
+        lines = [f"{'stage':<20} {'calls':>6} {'wall (s)':>10} {'cpu (s)':>10} {'points/s':>12} "
+                 f"{'+RSS (MiB)':>10}"]
+        for s in self.stages.values():
+            rate = f"{s.points / s.wall:>12.3e}" if s.points and s.wall > 0 else f"{'':>12}"
+            lines.append(f"{s.name:<20} {s.calls:>6} {s.wall:>10.3f} {s.cpu:>10.3f} {rate} "
+                         f"{s.rss_increase:>10.1f}")
+        lines.append(f"{'total':<20} {'':>6} {self.wall:>10.3f} {self.cpu:>10.3f} {'':>12} "
+                     f"{self.rss_increase:>10.1f}")
+        lines.append(f"process peak RSS {peak_rss():.1f} MiB")
+
+        return "\n".join(lines)
+
+class _Timer:
+    def __init__(self, report, name, points):
+        self.report = report
+        self.stage = report.stages.setdefault(name, Stage(name))
+        self.points = points
+        self.nested = [0.0, 0.0]
+
+    def __enter__(self):
+        self.report._stack.append(self)
+        self.start = (time.perf_counter(), _cpu(), _rss())
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.start[0]
+        cpu = _cpu() - self.start[1]
+        self.report._stack.pop()
+
+        s = self.stage
+        s.calls += 1
+        s.wall += wall - self.nested[0]
+        s.cpu += cpu - self.nested[1]
+        s.points += self.points
+        s.rss_increase = max(s.rss_increase, rss_increase(self.start[2]))
+
+        if self.report._stack:
+            parent = self.report._stack[-1]
+            parent.nested[0] += wall
+            parent.nested[1] += cpu
+
+    def add_points(self, n):
+        """Adds to the number of grid points visited by the stage."""
+
+        self.points += int(n)
+
+class _Null:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def add_points(self, n):
+        pass
+
+_null = _Null()
+
+def stage(name, points=0):
+    """Returns a context manager recording a stage of the pipeline in the active report.
+
+    The number of grid `points` visited may be given up front or added with `add_points`.
+    """
+
+    if _active is None:
+        return _null
+
+    return _Timer(_active, name, int(points))
+
+def active():
+    """Returns the active report, or None."""
+
+    return _active
+
+class Progress:
+    def __init__(self, total, label, interval=10.0, stream=None):
+        """Prints the progress of a loop over `total` items and its estimated time to completion.
+
+        A line is printed at most every `interval` seconds, and only while a report with progress
+        enabled is active, so that short loops stay quiet.
+        """
+
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.stream = sys.stdout if stream is None else stream
+        self.done = 0
+        self.enabled = _active is not None and _active.progress
+        self.start = self.last = time.perf_counter()
+
+    def update(self, n=1):
+        self.done += n
+        if not self.enabled:
+            return
+
+        now = time.perf_counter()
+        if now - self.last < self.interval:
+            return
+
+        self.last = now
+        elapsed = now - self.start
+        eta = elapsed * (self.total - self.done) / self.done if self.done > 0 else float("nan")
+        print(f"{self.label}: {self.done}/{self.total} ({100 * self.done / self.total:.1f}%), "
+              f"{elapsed:.1f} s elapsed, ETA {eta:.1f} s", file=self.stream, flush=True)
+
+def peak_rss():
+    """Returns the peak resident set size of the process and its finished children in MiB."""
+
+    # ru_maxrss is in KiB on Linux
+    rss = [resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF,
+                                                         resource.RUSAGE_CHILDREN)]
+    return max(rss) / 1024
+
+def current_rss():
+    """Returns the current resident set size of the process in MiB.
+
+    This is read from /proc/self/statm, where it is not available the peak RSS of the process is
+    returned instead.
+    """
+
+    try:
+        with open("/proc/self/statm") as fh:
+            pages = int(fh.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return pages * resource.getpagesize() / 1024**2
+
+def rss_increase(start):
+    """Returns the increase in MiB of the RSS since `start`, as returned by `_rss`.
+
+    The high-water marks of the process and its finished children are taken as the peak when they
+    rose since `start`, otherwise the current RSS is.
+    """
+
+    rss, maxrss = _rss()
+    peak = rss
+    for before, after in zip(start[1], maxrss):
+        if after > before:
+            peak = max(peak, after)
+
+    return max(peak - start[0], 0.0)
+
+def _rss():
+    """Returns the current RSS and the high-water marks of the process and its children in MiB."""
+
+    # ru_maxrss is in KiB on Linux
+    maxrss = tuple(resource.getrusage(who).ru_maxrss / 1024 for who in (resource.RUSAGE_SELF,
+                                                                      resource.RUSAGE_CHILDREN))
+    return current_rss(), maxrss
+
+def _cpu():
+    """Returns the CPU time used by the process and its finished children."""
+
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+
+    return total
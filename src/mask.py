@@ -0,0 +1,130 @@
+""" src/mask.py
+
+Module to allocate IBM masks and store them compactly.
+
+x3d2 expects `ep1` as a float64 field of 1s (fluid) and 0s (solid), however the mask is binary so it
+can be built as uint8/bool or bit-packed and only widened to float64 chunk by chunk when written.
+"""
+
+import mmap
+
+import numpy as np
+
+# Number of bytes of widened mask per chunk written
+CHUNK_BYTES = 64 * 1024**2
+
+def ones(mesh_n, dtype=np.float64, shared=False):
+    """Allocates a mask of ones (fluid) for the mesh, stored in [z,y,x] order.
+
+    The `dtype` may be any NumPy dtype or "packed" for a bit-packed PackedMask. A `shared` mask is
+    placed in shared memory so that it can be filled in place by forked workers.
+    """
+
+    nx, ny, nz = mesh_n
+    if is_packed(dtype):
+        return PackedMask([nz, ny, nx], shared=shared)
+    elif shared:
+        return _shared_full([nz, ny, nx], 1, dtype)
+    else:
+        return np.ones([nz, ny, nx], dtype=dtype)
+
+def is_packed(dtype):
+    """Tests whether `dtype` requests a bit-packed mask."""
+
+    return isinstance(dtype, str) and dtype == "packed"
+
+def is_shared(mask):
+    """Tests whether the mask (or the array it is a view of) is held in shared memory, see ones."""
+
+    base = mask.bits if isinstance(mask, PackedMask) else mask
+    while base is not None:
+        if isinstance(base, mmap.mmap):
+            return True
+        base = base.obj if isinstance(base, memoryview) else getattr(base, "base", None)
+
+    return False
+
+def chunks(mask, nk=None, dtype=np.float64):
+    """Iterates over the mask in z-chunks widened to `dtype`, yielding (k0, chunk).
+
+    By default the chunks hold roughly CHUNK_BYTES of widened data, the widened copy of the full
+    mask never exists in memory.
+    """
+
+    nz, ny, nx = mask.shape
+    if nk is None:
+        nk = max(CHUNK_BYTES // max(ny * nx * np.dtype(dtype).itemsize, 1), 1)
+
+    for k0 in range(0, nz, nk):
+        yield k0, np.ascontiguousarray(mask[k0:k0 + nk], dtype=dtype)
+
+class PackedMask:
+    def __init__(self, shape, bits=None, shared=False):
+        """Stores a binary mask with 8 points per byte packed along x.
+
+        The mask is indexed like a [z,y,x] array, reading returns the unpacked uint8 values and
+        writing repacks the affected rows. Only the (k, j) rows touched by an index are unpacked.
+        """
+
+        self.shape = tuple(shape)
+
+        nb = (self.shape[2] + 7) // 8
+        if bits is None:
+            if shared:
+                bits = _shared_full([self.shape[0], self.shape[1], nb], 0xFF, np.uint8)
+            else:
+                bits = np.full([self.shape[0], self.shape[1], nb], 0xFF, dtype=np.uint8)
+        self.bits = bits
+
+    @property
+    def ndim(self):
+        return 3
+
+    @property
+    def dtype(self):
+        return np.dtype(np.uint8)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def _key(self, key):
+        """Splits an index into its (k, j) row and i components."""
+
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (3 - len(key))
+
+        return key[:2], key[2]
+
+    def _unpack(self, rows):
+        return np.unpackbits(self.bits[rows], axis=-1, count=self.shape[2])
+
+    def __getitem__(self, key):
+        rows, i = self._key(key)
+        return self._unpack(rows)[..., i]
+
+    def __setitem__(self, key, value):
+        rows, i = self._key(key)
+        unpacked = self._unpack(rows)
+        unpacked[..., i] = value
+        self.bits[rows] = np.packbits(unpacked, axis=-1)
+
+    def __array__(self, dtype=None, copy=None):
+        unpacked = self[:, :, :]
+        return unpacked if dtype is None else unpacked.astype(dtype)
+
+def _shared_full(shape, value, dtype):
+    """Allocates an array filled with `value` in an anonymous shared memory mapping.
+
+    The mapping is inherited by processes forked after the allocation so that they can write into
+    the array in place, the array keeps the mapping alive for as long as it is referenced.
+    """
+
+    dtype = np.dtype(dtype)
+    count = int(np.prod(shape))
+    buf = mmap.mmap(-1, max(count * dtype.itemsize, 1), flags=mmap.MAP_SHARED)
+    arr = np.frombuffer(buf, dtype=dtype, count=count).reshape(shape)
+    arr[...] = value
+
+    return arr
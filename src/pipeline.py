@@ -0,0 +1,149 @@
+""" src/pipeline.py
+
+Module generating and writing the IBM masks of the command line interface, see `src/cli.py`.
+
+`stl_mask` places two copies of an stl geometry either side of the centre of the domain (the two
+foil setup) and `cylinder_mask` generates the mask of an analytic cylinder. Both write the mask to
+an ADIOS2 file for x3d2.
+"""
+
+import numpy as np
+
+from . import convert_stl
+from . import cylinder
+from . import distance
+from . import distributed
+from . import fraction
+from . import grid
+from . import instrument
+from . import mask
+from . import scene
+from . import sweep
+from . import writer
+
+def stl_mask(stl_file, mesh_n, mesh_l, relative_offset=sweep.RELATIVE_OFFSET, rotation=None,
+             scale=None, filename=None, comm=None, use_cache=True, engine="voxel",
+             voxels_per_cell=2.0, band=None, sparse=None, compression=None, samples=None,
+             brick=None, istret=0, beta=None, resolution=None):
+    """Generates the mask of the two foil setup and writes it to `filename`.
+
+    The foils are placed `relative_offset` apart and rotated and scaled about their centres, see
+    `sweep.placements`. By default the mask is written to ibm.bp (test.bp4 with ADIOS2 < 2.10), or
+    ibm_sparse.bp (test_sparse.bp4) for a `sparse` mask, which x3d2 cannot load directly.
+    With an MPI communicator `comm` the first rank converts the stl file and each rank embeds and
+    writes its own block of the mesh. At most one of the distance fields (`band`), the `sparse`
+    encoding and the volume fractions (`samples`) may be requested. With `istret` the mesh is
+    stretched in y as x3d2 does with the parameter `beta`, see `grid.stretching`. A voxel
+    `resolution` (voxels along z) overrides `voxels_per_cell`.
+    """
+
+    rank = 0 if comm is None else comm.Get_rank()
+
+    report = instrument.active()
+    if report is not None:
+        report.meta.update(stl=stl_file, mesh_n=mesh_n, mesh_l=mesh_l, engine=engine, rank=rank,
+                           istret=istret, beta=beta)
+
+    if istret != 0:
+        mesh_l = grid.Grid.stretched(mesh_n, mesh_l, beta, istret)
+
+    # Convert STL to voxel array, unless given the voxel resolution is chosen to sample the mesh
+    # with `voxels_per_cell` voxels per grid spacing. With the raster engine the STL triangles are
+    # kept and rasterized directly onto the mesh instead. When running with MPI the first rank
+    # converts the STL and shares the result with the other ranks
+    voxels = None
+    if rank == 0:
+        voxels = convert_stl.convert(stl_file, resolution, mesh_n=mesh_n, mesh_l=mesh_l,
+                                     voxels_per_cell=voxels_per_cell, cache=use_cache,
+                                     engine=engine, brick=brick)
+    if comm is not None:
+        voxels = comm.bcast(voxels, root=0)
+
+    if rank == 0:
+        if engine == "voxel":
+            print(f"Model dimensions: {voxels.L}")
+            print(f"Model scale: {voxels.scale}")
+            print(f"Voxel size: {1 / voxels.scale}")
+            print(f"Voxel count: {voxels.n}")
+            if brick is not None:
+                print(f"Mixed bricks: {np.count_nonzero(voxels.index >= 0)} of "
+                      f"{voxels.index.size}, {voxels.nbytes() / 1024**2:.1f} MiB")
+        else:
+            print(f"Triangle count: {len(voxels.triangles)}")
+        print(f"Bounding box: {voxels.bounding_box()}")
+
+    # place the two foils either side of the centre of the domain, the mask is produced and
+    # written one z-chunk at a time so that the full array never exists in memory
+    placements = sweep.placements(voxels, mesh_l, relative_offset, rotation, scale)
+    if filename is None:
+        stem, ext = ("ibm", "bp") if writer.adios2_new_api else ("test", "bp4")
+        filename = f"{stem}.{ext}" if sparse is None else f"{stem}_sparse.{ext}"
+
+    # shape of the mask is (nz, ny, nx)
+    shape = [mesh_n[2], mesh_n[1], mesh_n[0]]
+    if sparse is not None:
+        # only the blocks of the mesh covered by the foils are embedded and written
+        blocks = scene.embed_blocks(placements, mesh_n, mesh_l, dtype=np.uint8)
+        writer.write_sparse_mask(filename, blocks, shape, iibm=1, encoding=sparse,
+                                 compression=compression)
+    elif samples is not None:
+        # the cells cut by the surface hold their fluid volume fraction
+        chunks = fraction.iter_scene(placements, mesh_n, mesh_l, samples=samples)
+        writer.write_mask(filename, chunks, shape, iibm=1, compression=compression)
+    elif band is not None:
+        # the distance fields need the complete mask, which is kept in compact form
+        ibm = scene.embed_scene(placements, mesh_n, mesh_l, dtype=np.uint8)
+        fields = distance.narrow_band(ibm, mesh_n, mesh_l, band=band)
+        writer.write_mask(filename, mask.chunks(ibm), shape, iibm=1, fields=fields.chunks(),
+                          compression=compression)
+    elif comm is None:
+        chunks = scene.iter_scene(placements, mesh_n, mesh_l, dtype=np.uint8)
+        writer.write_mask(filename, chunks, shape, iibm=1, compression=compression)
+    else:
+        # each rank embeds and writes its own block of the mesh
+        distributed.generate(placements, mesh_n, mesh_l, filename, comm, iibm=1,
+                             compression=compression)
+
+    if rank == 0 and sparse is not None:
+        print(f"\nSuccessfully generated the sparse mask {filename}, which x3d2 cannot load "
+              f"directly, expand it with writer.read_mask.")
+    elif rank == 0:
+        print(f"\nSuccessfully generated clean {filename} file.")
+
+    return filename
+
+def cylinder_mask(mesh_n, spacing, radius=None, origin=None, axis=None, dtype=np.float64,
+                  filename="ibm.bp", iibm=1, fields=False, compression=None, istret=0, beta=None):
+    """Generates the mask of a cylinder and writes it to `filename`.
+
+    The mesh has `mesh_n` [nx,ny,nz] points `spacing` [dx,dy,dz] apart. The cylinder of `radius`
+    passes through `origin` [x,y,z] along `axis` [x,y,z], without a radius the mask is all fluid.
+    With `fields` the signed distance and direction fields of the cylinder are also written. With
+    `istret` the points along y are stretched over the same length, see `stl_mask`.
+    """
+
+    # the arguments of `cylinder` are in [z,y,x] order
+    n = list(np.flip(mesh_n))
+    dxyz = list(np.flip(spacing))
+    if istret != 0:
+        dxyz[1] = grid.stretching(mesh_n[1], (mesh_n[1] - 1) * spacing[1], beta, istret)
+
+    report = instrument.active()
+    if report is not None:
+        report.meta.update(mesh_n=list(mesh_n), spacing=list(spacing), radius=radius,
+                           istret=istret, beta=beta)
+
+    # the cylinder is evaluated in z-chunks directly into the mask
+    ibm = mask.ones(mesh_n, dtype=dtype)
+    field_chunks = None
+    if radius is not None:
+        with instrument.stage("cylinder", points=np.prod(n)):
+            cylinder.gencyl(dxyz, n, radius, np.flip(origin), np.flip(axis), out=ibm)
+        if fields:
+            field_chunks = cylinder.iter_fields(dxyz, n, radius, np.flip(origin), np.flip(axis))
+
+    writer.write_mask(filename, mask.chunks(ibm), n, iibm=iibm, fields=field_chunks,
+                      compression=compression)
+    print(f"\nSuccessfully generated {filename}.")
+
+    return filename
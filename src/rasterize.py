@@ -0,0 +1,195 @@
+""" src/rasterize.py
+
+Module to rasterize a triangulated surface directly onto the x3d2 grid.
+
+Rather than voxelising the stl file at an unrelated resolution and resampling the voxels onto the
+grid, the triangles are intersected with the rays running along x through each (j, k) row of grid
+points. A grid point is inside the object when an odd number of triangles cross its row before it
+(parity ray casting). The rows crossed by each triangle are found and the crossings counted with
+array operations over all rows of a k-chunk at once.
+"""
+
+import numpy as np
+
+from . import grid
+
+# Number of (triangle, row) pairs processed at once
+PAIR_BATCH = 1 << 22
+
+class Surface:
+    def __init__(self, triangles):
+        """Stores a closed triangulated surface as an (N, 3, 3) array of vertex coordinates.
+
+        This has the same bounding box interface as Voxels so that it can be placed and embedded
+        in the same way.
+        """
+
+        self.triangles = np.asarray(triangles, dtype=np.float64)
+
+    def bounding_box(self):
+        """Returns the limits of the bounding box as a coordinate pair."""
+
+        return [self.triangles.min(axis=(0, 1)), self.triangles.max(axis=(0, 1))]
+
+    def placed(self, shift, rotation=None):
+        """Returns the triangles with the bounding box centre rotated about and moved to `shift`."""
+
+        bbox_min, bbox_max = self.bounding_box()
+        centre = (bbox_min + bbox_max) / 2.0
+
+        tris = self.triangles - centre
+        if rotation is not None:
+            tris = tris @ np.asarray(rotation, dtype=np.float64).T
+
+        return tris + np.asarray(shift, dtype=np.float64)
+
+def embed_into(ibm, surface, mesh_n, mesh_l, shift=[0, 0, 0], rotation=None, start=[0, 0, 0],
+               nk=None, k_range=None):
+    """Rasterizes the surface into an existing IBM array.
+
+    The arguments follow `embed_stl.embed_into`: the surface is placed with its bounding box
+    centre at `shift`, points inside are set to 0 and the array may hold a sub-block of the mesh
+    starting at the global [z,y,x] index `start`. The rows are processed `nk` planes at a time,
+    only the global z-planes [k0, k1) of `k_range` are rasterized if it is given.
+
+    Returns the working range [n0, nn) as global [x,y,z] indices.
+    """
+
+    coords = grid.coordinates(mesh_n, mesh_l)
+    tris = surface.placed(shift, rotation)
+
+    # Grid points within the bounding box of the placed surface, restricted to the block held by
+    # the array
+    n0, nn = _box_range(tris, coords)
+    origin = np.flip(np.array(start))
+    n0 = np.maximum(n0, origin)
+    nn = np.minimum(nn, origin + np.flip(ibm.shape))
+    if k_range is not None:
+        n0[2] = max(n0[2], k_range[0])
+        nn[2] = min(nn[2], k_range[1])
+    if np.any(nn <= n0):
+        return [n0, nn]
+
+    tris = _oriented(tris)
+
+    nbx = nn[0] - n0[0]
+    nby = nn[1] - n0[1]
+    if nk is None:
+        nk = max((1 << 24) // (nby * (nbx + 1)), 1)
+
+    x, y, z = coords
+    for k0 in range(n0[2], nn[2], nk):
+        k1 = min(k0 + nk, nn[2])
+
+        # Count the crossings before each grid point of the rows in the chunk
+        toggles = np.zeros([k1 - k0, nby, nbx + 1], dtype=np.uint8)
+        for jj, kk, xc in _crossings(tris, y, z, [n0[1], nn[1]], [k0, k1]):
+            ic = np.clip(np.searchsorted(x, xc, "right") - n0[0], 0, nbx)
+            np.add.at(toggles, (kk - k0, jj - n0[1], ic), 1)
+
+        # uint8 wraps modulo 256 which preserves the parity
+        inside = np.cumsum(toggles[..., :nbx], axis=-1, dtype=np.uint8) & 1
+
+        for k in range(k0, k1):
+            solid = inside[k - k0] > 0
+            block = ibm[k - origin[2],
+                        n0[1] - origin[1]:nn[1] - origin[1],
+                        n0[0] - origin[0]:nn[0] - origin[0]]
+            block[solid] = 0
+            ibm[k - origin[2],
+                n0[1] - origin[1]:nn[1] - origin[1],
+                n0[0] - origin[0]:nn[0] - origin[0]] = block
+
+    return [n0, nn]
+
+def working_range(surface, mesh_n, mesh_l, shift=[0, 0, 0], rotation=None):
+    """Returns the range [n0, nn) of grid points in the bounding box of the placed surface as
+    global [x,y,z] indices."""
+
+    coords = grid.coordinates(mesh_n, mesh_l)
+    return _box_range(surface.placed(shift, rotation), coords)
+
+def _box_range(tris, coords):
+    return grid.box_range(tris.min(axis=(0, 1)), tris.max(axis=(0, 1)), coords)
+
+def _oriented(tris):
+    """Drops triangles parallel to x and orders the rest anticlockwise in the (y, z) plane."""
+
+    e1 = tris[:, 1, 1:] - tris[:, 0, 1:]
+    e2 = tris[:, 2, 1:] - tris[:, 0, 1:]
+    area = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+
+    tris = tris[area != 0]
+    flip = area[area != 0] < 0
+    tris[flip] = tris[flip][:, [0, 2, 1]]
+
+    return tris
+
+def _edge(u, v, py, pz):
+    """Evaluates the edge function of the directed edge u -> v in the (y, z) plane.
+
+    The function is always computed from the lexicographically smaller vertex so that the two
+    triangles sharing an edge obtain exactly opposite values. Points on the edge are assigned to
+    one side only by breaking ties on the direction of the edge.
+    """
+
+    swap = (u[:, 1] > v[:, 1]) | ((u[:, 1] == v[:, 1]) & (u[:, 2] > v[:, 2]))
+    a = np.where(swap[:, np.newaxis], v, u)
+    b = np.where(swap[:, np.newaxis], u, v)
+
+    w = (b[:, 1] - a[:, 1]) * (pz - a[:, 2]) - (b[:, 2] - a[:, 2]) * (py - a[:, 1])
+    w = np.where(swap, -w, w)
+
+    ey = v[:, 1] - u[:, 1]
+    ez = v[:, 2] - u[:, 2]
+    owner = (ez < 0) | ((ez == 0) & (ey > 0))
+
+    return (w > 0) | ((w == 0) & owner)
+
+def _crossings(tris, y, z, jr, kr):
+    """Finds the rows (j, k) in the ranges jr, kr crossed by each triangle.
+
+    Yields batches of the row indices and the x coordinate of the crossing.
+    """
+
+    # Triangles overlapping the rows of the chunk
+    lo = tris.min(axis=1)
+    hi = tris.max(axis=1)
+    keep = (hi[:, 2] >= z[kr[0]]) & (lo[:, 2] <= z[kr[1] - 1])
+    tris = tris[keep]
+    lo = lo[keep]
+    hi = hi[keep]
+
+    # Candidate rows of each triangle from its bounding box
+    j0 = np.clip(np.searchsorted(y, lo[:, 1], "left"), jr[0], jr[1])
+    j1 = np.clip(np.searchsorted(y, hi[:, 1], "right"), jr[0], jr[1])
+    k0 = np.clip(np.searchsorted(z, lo[:, 2], "left"), kr[0], kr[1])
+    k1 = np.clip(np.searchsorted(z, hi[:, 2], "right"), kr[0], kr[1])
+    nj = np.maximum(j1 - j0, 0)
+    npairs = nj * np.maximum(k1 - k0, 0)
+
+    # Process the (triangle, row) pairs in batches of whole triangles
+    ends = np.cumsum(npairs)
+    t0 = 0
+    while t0 < len(tris):
+        base = ends[t0] - npairs[t0]
+        t1 = min(max(np.searchsorted(ends, base + PAIR_BATCH, "right"), t0 + 1), len(tris))
+
+        # Enumerate the rows of each triangle's bounding box, j varying fastest
+        t = np.repeat(np.arange(t0, t1), npairs[t0:t1])
+        local = np.arange(base, ends[t1 - 1]) - (ends[t] - npairs[t])
+        jj = j0[t] + local % nj[t]
+        kk = k0[t] + local // nj[t]
+
+        py = y[jj]
+        pz = z[kk]
+        v0, v1, v2 = tris[t, 0], tris[t, 1], tris[t, 2]
+        inside = _edge(v0, v1, py, pz) & _edge(v1, v2, py, pz) & _edge(v2, v0, py, pz)
+
+        # Intersect the ray with the plane of the triangle
+        n = np.cross(v1 - v0, v2 - v0)
+        xc = v0[:, 0] - (n[:, 1] * (py - v0[:, 1]) + n[:, 2] * (pz - v0[:, 2])) / n[:, 0]
+
+        yield jj[inside], kk[inside], xc[inside]
+
+        t0 = t1
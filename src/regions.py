@@ -0,0 +1,158 @@
+""" src/regions.py
+
+Module to find the connected regions of a boolean mask given one z-chunk at a time.
+
+The regions are the face-connected components of the true points, e.g. the bodies of an IBM mask
+(its solid points) or the parts of the mesh where two masks differ. They are found from the runs of
+true points along x, joining each run to the runs it overlaps in the neighbouring rows, and are
+carried from one chunk to the next by the runs of its last plane, so that masks too large to hold
+in memory can be scanned in bounded memory.
+"""
+
+import numpy as np
+
+class Regions:
+    def __init__(self):
+        """Finds the face-connected components of the true points of a [z,y,x] boolean array given
+        in consecutive z-chunks, see `add`.
+
+        Each component is kept as its bounding box and number of points only, so that the memory
+        used does not grow with the size of the array.
+        """
+
+        self.parent = []
+        self.lo = np.zeros([0, 3], dtype=np.int64)
+        self.hi = np.zeros([0, 3], dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+
+        # runs (j, x0, x1, component) of the last plane added
+        self.last = None
+
+    def add(self, k0, chunk):
+        """Adds the true points of the z-chunk starting at plane `k0`."""
+
+        nk, ny, nx = chunk.shape
+        k, j, x0, x1 = _runs(chunk)
+        k += k0
+
+        # the runs of the previous plane come first, so that the chunk joins its components
+        n_prev = 0
+        if self.last is not None:
+            pj, px0, px1, pids = self.last
+            n_prev = len(pj)
+            k = np.concatenate([np.full(n_prev, k0 - 1), k])
+            j = np.concatenate([pj, j])
+            x0 = np.concatenate([px0, x0])
+            x1 = np.concatenate([px1, x1])
+
+        label = _components(k - k0 + 1, j, x0, x1, ny, nx)
+        comps, inv = np.unique(label, return_inverse=True)
+
+        lo = np.full([len(comps), 3], np.iinfo(np.int64).max)
+        hi = np.full([len(comps), 3], -1)
+        for d, (a, b) in enumerate([(k, k), (j, j), (x0, x1 - 1)]):
+            np.minimum.at(lo[:, d], inv, a)
+            np.maximum.at(hi[:, d], inv, b)
+        count = np.bincount(inv[n_prev:], weights=(x1 - x0)[n_prev:],
+                            minlength=len(comps)).astype(np.int64)
+
+        # components continuing from the previous chunk join the components of their runs
+        ids = np.full(len(comps), -1)
+        for c, p in zip(inv[:n_prev], self.last[3] if n_prev else []):
+            p = self._find(p)
+            ids[c] = p if ids[c] < 0 else self._union(ids[c], p)
+
+        for c in np.nonzero(ids >= 0)[0]:
+            r = self._find(ids[c])
+            self.lo[r] = np.minimum(self.lo[r], lo[c])
+            self.hi[r] = np.maximum(self.hi[r], hi[c])
+            self.count[r] += count[c]
+            ids[c] = r
+
+        new = ids < 0
+        ids[new] = len(self.parent) + np.arange(np.count_nonzero(new))
+        self.parent.extend(ids[new].tolist())
+        self.lo = np.concatenate([self.lo, lo[new]])
+        self.hi = np.concatenate([self.hi, hi[new]])
+        self.count = np.concatenate([self.count, count[new]])
+
+        end = k == k0 + nk - 1
+        self.last = (j[end], x0[end], x1[end], ids[inv[end]])
+
+    def regions(self):
+        """Returns the components as a list of ([z,y,x] start, [z,y,x] end, number of points),
+        with exclusive ends, sorted by their start."""
+
+        roots = [i for i, p in enumerate(self.parent) if p == i]
+        regions = [(self.lo[i].tolist(), (self.hi[i] + 1).tolist(), int(self.count[i]))
+                   for i in roots]
+
+        return sorted(regions)
+
+    def _find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return a
+        a, b = min(a, b), max(a, b)
+
+        self.parent[b] = a
+        self.lo[a] = np.minimum(self.lo[a], self.lo[b])
+        self.hi[a] = np.maximum(self.hi[a], self.hi[b])
+        self.count[a] += self.count[b]
+
+        return a
+
+def _runs(chunk):
+    """Returns the [k, j, x0, x1) runs of true points along x of a [z,y,x] chunk, in [z,y,x]
+    order."""
+
+    nk, ny, nx = chunk.shape
+    padded = np.zeros([nk, ny, nx + 2], dtype=np.int8)
+    padded[:, :, 1:-1] = chunk
+    edges = np.diff(padded, axis=2)
+
+    k, j, x0 = np.nonzero(edges == 1)
+    x1 = np.nonzero(edges == -1)[2]
+
+    return k, j, x0, x1
+
+def _components(k, j, x0, x1, ny, nx):
+    """Labels the face-connected components of the runs, given in [z,y,x] order, by the smallest
+    index of their runs."""
+
+    # The runs overlapping a run in the previous row (j - 1) or plane (k - 1) are contiguous, as
+    # the runs are sorted and do not overlap within a row, and are found by a binary search of the
+    # run starts and ends keyed by row
+    row = k * ny + j
+    w = nx + 1
+    start, end = row * w + x0, row * w + x1
+
+    a, b = [], []
+    for step, has in [(1, j > 0), (ny, k > 0)]:
+        q = row[has] - step
+        lo = np.searchsorted(end, q * w + x0[has], "right")
+        hi = np.searchsorted(start, q * w + x1[has], "left")
+        n = np.maximum(hi - lo, 0)
+        first = np.cumsum(n) - n
+        a.append(np.repeat(np.nonzero(has)[0], n))
+        b.append(np.repeat(lo, n) + np.arange(n.sum()) - np.repeat(first, n))
+    a, b = np.concatenate(a), np.concatenate(b)
+
+    # Every run takes the smallest label of the runs it overlaps, with pointer jumping, until the
+    # labels no longer change
+    label = np.arange(len(row))
+    while True:
+        m = np.minimum(label[a], label[b])
+        new = label.copy()
+        np.minimum.at(new, a, m)
+        np.minimum.at(new, b, m)
+        new = new[new]
+        if np.array_equal(new, label):
+            return label
+        label = new
@@ -0,0 +1,145 @@
+""" src/scene.py
+
+Module to embed several placed objects into a single IBM field array.
+"""
+
+import numpy as np
+
+from . import embed_stl
+from . import instrument
+from . import mask
+
+class Placement:
+    def __init__(self, voxels, translation, rotation=None, scale=None):
+        """Places a voxel object in the mesh.
+
+        The centre of the object's bounding box is moved to `translation`. Before it is moved the
+        object is optionally scaled about its centre by `scale`, one factor or one per axis, and
+        rotated about its centre by `rotation`, a 3x3 matrix or (x, y, z) Euler angles in degrees
+        (see `embed_stl.euler`). The combined scaling and rotation is held as the matrix
+        `transform`.
+        """
+
+        self.voxels = voxels
+        self.translation = np.asarray(translation, dtype=np.float64)
+        self.rotation = embed_stl.transform(rotation)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.transform = embed_stl.transform(self.rotation, self.scale)
+
+def placement(p):
+    """Converts a (voxels, translation[, rotation[, scale]]) tuple into a Placement."""
+
+    if isinstance(p, Placement):
+        return p
+    else:
+        return Placement(*p)
+
+def embed_scene(placements, mesh_n, mesh_l, workers=1, dtype=np.float64):
+    """Embeds a list of placed objects into a single IBM array.
+
+    The placements are Placement objects or (voxels, translation[, rotation[, scale]]) tuples. A
+    single mask is allocated and each object only visits the region of the mesh covered by its
+    bounding box, overlapping objects combine as a logical AND of their masks. The mask is stored
+    with the given `dtype`, see `mask.ones`.
+    """
+
+    ibm = mask.ones(mesh_n, dtype=dtype, shared=workers > 1)
+    for i, p in enumerate(placements):
+        n0, nn = _embed(ibm, i, placement(p), mesh_n, mesh_l, workers)
+        print(f"Working range (indices): {n0} -> {nn}")
+
+    return ibm
+
+def iter_scene(placements, mesh_n, mesh_l, nk=None, workers=1, dtype=np.float64):
+    """Embeds a list of placed objects one z-chunk of the mesh at a time.
+
+    Yields (k0, chunk) where `chunk` holds the planes [k0, k0 + nk) of the mask, so that the mask
+    can be written as it is produced without the full array ever existing in memory. By default
+    the chunks hold roughly `mask.CHUNK_BYTES` of float64 data.
+    """
+
+    nx, ny, nz = mesh_n
+    for start, chunk in iter_block(placements, mesh_n, mesh_l, [0, 0, 0], [nz, ny, nx], nk,
+                                   workers, dtype):
+        yield start[0], chunk
+
+def iter_block(placements, mesh_n, mesh_l, start, count, nk=None, workers=1, dtype=np.float64):
+    """Embeds a list of placed objects into a block of the mesh one z-chunk at a time.
+
+    The block is given by the [z,y,x] `start` index of its first point and its [z,y,x] `count`.
+    Yields the [z,y,x] start index of each chunk and the chunk itself.
+    """
+
+    nz, ny, nx = count
+    if nk is None:
+        nk = max(mask.CHUNK_BYTES // max(ny * nx * np.dtype(np.float64).itemsize, 1), 1)
+
+    placements = [placement(p) for p in placements]
+    progress = instrument.Progress(-(-nz // nk), "Embedded z-chunks")
+    for k0 in range(start[0], start[0] + nz, nk):
+        chunk_start = [k0, start[1], start[2]]
+        chunk = mask.ones([nx, ny, min(nk, start[0] + nz - k0)], dtype=dtype, shared=workers > 1)
+        for i, p in enumerate(placements):
+            _embed(chunk, i, p, mesh_n, mesh_l, workers, chunk_start)
+
+        progress.update()
+        yield chunk_start, chunk
+
+def embed_blocks(placements, mesh_n, mesh_l, workers=1, dtype=np.float64):
+    """Embeds a list of placed objects into the sub-blocks of the mesh which they cover.
+
+    Only the working ranges of the objects are allocated, ranges which overlap are merged into
+    their bounding box so that the blocks are disjoint. The rest of the mesh is fluid. Returns a
+    list of ([z,y,x] start, block) pairs.
+    """
+
+    placements = [placement(p) for p in placements]
+
+    ranges = []
+    for p in placements:
+        n0, nn = embed_stl.working_range(p.voxels, mesh_n, mesh_l, p.translation, p.transform)
+        n0 = np.maximum(n0, 0)
+        nn = np.minimum(nn, mesh_n)
+        if np.all(nn > n0):
+            ranges.append([n0, nn])
+
+    blocks = []
+    for n0, nn in merge_ranges(ranges):
+        start = np.flip(n0)
+        block = mask.ones(nn - n0, dtype=dtype, shared=workers > 1)
+        for i, p in enumerate(placements):
+            _embed(block, i, p, mesh_n, mesh_l, workers, start)
+        print(f"Block (indices): {n0} -> {nn}")
+        blocks.append((start, block))
+
+    return blocks
+
+def _embed(ibm, i, p, mesh_n, mesh_l, workers=1, start=[0, 0, 0]):
+    """Embeds the i-th placement, recording the points it visits as a stage of the run."""
+
+    with instrument.stage(f"embed body {i}") as s:
+        n0, nn = embed_stl.embed_into(ibm, p.voxels, mesh_n, mesh_l, p.translation, p.transform,
+                                      workers, start=start)
+        s.add_points(np.prod(np.maximum(np.asarray(nn) - n0, 0)))
+
+    return n0, nn
+
+def merge_ranges(ranges):
+    """Merges overlapping [n0, nn) index ranges until they are disjoint."""
+
+    ranges = list(ranges)
+    merged = True
+    while merged:
+        merged = False
+        for a in range(len(ranges)):
+            for b in range(a + 1, len(ranges)):
+                (a0, an), (b0, bn) = ranges[a], ranges[b]
+                if np.all(a0 < bn) and np.all(b0 < an):
+                    ranges[a] = [np.minimum(a0, b0), np.maximum(an, bn)]
+                    del ranges[b]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return ranges
@@ -0,0 +1,148 @@
+""" src/sweep.py
+
+Module to generate the masks of many configurations of the two foil setup of `run.py` in one go.
+
+A sweep is a list of cases, each giving the x3d2 mesh, the offset between the two foils, their
+rotation and scale and a coarsening ratio. Every geometry is loaded and converted once for the
+whole sweep, at the finest voxel resolution needed by any of its cases, and the masks are then
+generated by a pool of forked processes which share the converted geometry.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import config as sweep_config
+from . import convert_stl
+from . import grid
+from . import scene
+from . import writer
+from .config import RELATIVE_OFFSET
+
+class Case:
+    def __init__(self, name, mesh_n, mesh_l, relative_offset=RELATIVE_OFFSET, ratio=1,
+                 stl=sweep_config.STL, rotation=None, scale=None, istret=0, beta=None):
+        """A configuration of the two foil setup.
+
+        The mesh of `mesh_n` points is coarsened by `ratio`, the mask is written to `<name>.bp`.
+        Both foils are rotated and scaled about their centres by `rotation` (a 3x3 matrix or Euler
+        angles in degrees) and `scale`, see `scene.Placement`, so that e.g. a sweep over the angle
+        of attack shares a single voxelisation. With `istret` the mesh is stretched in y as x3d2
+        does with the parameter `beta`, see `grid.stretching`.
+        """
+
+        self.name = name
+        self.mesh_n = [int(n / ratio) for n in mesh_n]
+        self.mesh_l = list(mesh_l)
+        self.relative_offset = np.asarray(relative_offset, dtype=np.float64)
+        self.stl = stl
+        self.rotation = rotation
+        self.scale = scale
+        self.mesh = self.mesh_l
+        if istret != 0:
+            self.mesh = grid.Grid.stretched(self.mesh_n, self.mesh_l, beta, istret)
+
+def load(filename):
+    """Loads a sweep from a TOML, YAML or JSON file.
+
+    The file holds the cases as a list of tables under `case`, which take the arguments of Case,
+    and optionally the settings of `sweep` at the top level. Returns the list of cases and the
+    settings.
+    """
+
+    config = sweep_config.read(filename)
+    cases = [Case(**c) for c in config.pop("case", [])]
+    names = [c.name for c in cases]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Case names must be unique: {names}")
+
+    return cases, config
+
+def placements(voxels, mesh_l, relative_offset=RELATIVE_OFFSET, rotation=None, scale=None):
+    """Places the two foils either side of the centre of the domain.
+
+    The domain is given by its size `mesh_l` or as a `grid.Grid`.
+    """
+
+    # define the desired centre for the entire two-foil system
+    system_centre = grid.centre(mesh_l)
+    relative_offset = np.asarray(relative_offset, dtype=np.float64)
+
+    # calculate the final absolute positions for each foil's centre
+    centre_pos_1 = system_centre - relative_offset / 2.0
+    centre_pos_2 = system_centre + relative_offset / 2.0
+
+    return [scene.Placement(voxels, centre_pos_1, rotation, scale),
+            scene.Placement(voxels, centre_pos_2, rotation, scale)]
+
+def geometries(cases, engine="voxel", voxels_per_cell=2.0, cache=True):
+    """Converts each stl file of the sweep once.
+
+    The voxel resolution of each file is the finest needed by any of the cases using it. Each file
+    is only parsed once, its triangles are passed on to the conversion.
+    """
+
+    result = {}
+    for stl_file in sorted(set(c.stl for c in cases)):
+        triangles = convert_stl.load_mesh(stl_file)
+        if engine == "voxel":
+            mesh_min = triangles.min(axis=(0, 1))
+            mesh_max = triangles.max(axis=(0, 1))
+            resolution = max(convert_stl.choose_resolution(mesh_min, mesh_max, c.mesh_n, c.mesh,
+                                                           voxels_per_cell)
+                             for c in cases if c.stl == stl_file)
+            print(f"{stl_file}: voxel resolution {resolution}")
+            result[stl_file] = convert_stl.convert(stl_file, resolution, cache=cache,
+                                                   triangles=triangles)
+        else:
+            result[stl_file] = convert_stl.convert(stl_file, engine=engine, triangles=triangles)
+
+    return result
+
+def generate(case, voxels, output_dir=".", compression=None):
+    """Generates and writes the mask of a single case, returning the file name."""
+
+    filename = os.path.join(output_dir, f"{case.name}.bp")
+    nx, ny, nz = case.mesh_n
+
+    chunks = scene.iter_scene(placements(voxels, case.mesh, case.relative_offset, case.rotation,
+                                         case.scale),
+                              case.mesh_n, case.mesh, dtype=np.uint8)
+    writer.write_mask(filename, chunks, [nz, ny, nx], iibm=1, compression=compression)
+    print(f"{case.name}: mesh {case.mesh_n} -> {filename}")
+
+    return filename
+
+def sweep(cases, output_dir=".", workers=1, engine="voxel", voxels_per_cell=2.0, cache=True,
+          compression=None):
+    """Generates the masks of all the cases, returning their file names.
+
+    The geometries are converted once before the cases are shared out between `workers` forked
+    processes, which inherit the converted geometries rather than receiving copies.
+    """
+
+    global _worker_args
+
+    os.makedirs(output_dir, exist_ok=True)
+    geometry = geometries(cases, engine, voxels_per_cell, cache)
+
+    if workers <= 1 or len(cases) <= 1:
+        return [generate(c, geometry[c.stl], output_dir, compression) for c in cases]
+
+    _worker_args = (cases, geometry, output_dir, compression)
+    try:
+        ctx = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=min(workers, len(cases)), mp_context=ctx) as pool:
+            return list(pool.map(_sweep_worker, range(len(cases))))
+    finally:
+        _worker_args = None
+
+# Arguments of the sweep, set before the pool is forked so that workers inherit them
+_worker_args = None
+
+def _sweep_worker(index):
+    cases, geometry, output_dir, compression = _worker_args
+    case = cases[index]
+    return generate(case, geometry[case.stl], output_dir, compression)
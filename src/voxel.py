@@ -65,6 +65,68 @@ class Voxels:
         else:
             return self.vol[ijk[0], ijk[1], ijk[2]]
 
+    def query_many(self, x, y=None, z=None):
+        """Obtains the voxel values at many points.
+
+        The points are given either as an (N,3) array of [x,y,z] coordinates or as separate x, y and
+        z arrays which broadcast together, the result has the (broadcast) shape of the points. The
+        out-of-range, rounding and upper face rules of `query` are applied to every point, points
+        for which `query` would index past the voxel array are treated as outside (0).
+        """
+
+        if y is None and z is None:
+            xyz = np.asarray(x)
+            x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+
+        ijk, valid = self._indices(x, y, z)
+        values = self._gather(ijk)
+
+        return np.where(valid, values, np.zeros((), dtype=values.dtype))
+
+    def _indices(self, x, y, z):
+        """Returns the [z,y,x] voxel indices of the points, clipped to the volume, and whether each
+        point lies in the volume following the rules of `query_many`."""
+
+        # Work in the [z,y,x] ordering of the voxel data, the indices along each axis only depend on
+        # the coordinate along that axis so broadcasting is deferred until the gather.
+        coords = (z, y, x)
+        shift = np.flip(self.shift)
+        scale = np.flip(self.scale)
+
+        ijk = []
+        outside = False
+        on_n = False
+        on_face = []
+        for d in range(3):
+            xyz_rel = np.asarray(coords[d]) - shift[d]
+            idx = np.floor(xyz_rel * scale[d]).astype(int)
+
+            ijk.append(idx)
+            outside = outside | (idx < 0) | (idx > self.n[d])
+            on_n = on_n | (idx == self.n[d])
+            on_face.append(xyz_rel == self.L[d])
+
+        # Points with an index equal to n lie past the last voxel unless they intersect the upper
+        # face of the volume, in which case the index is pulled back onto the last voxel.
+        edge = ~outside & on_n
+        valid = ~outside
+        if np.any(edge):
+            valid = valid & (~edge | on_face[0] | on_face[1] | on_face[2])
+            for d in range(3):
+                ijk[d] = np.where(edge & on_face[d], ijk[d] - 1, ijk[d])
+                valid = valid & (ijk[d] >= 0) & (ijk[d] < self.n[d])
+
+        # Clip the indices so that the gather is always in range, invalid points are discarded by
+        # the caller
+        ijk = [np.clip(ijk[d], 0, self.n[d] - 1) for d in range(3)]
+
+        return ijk, valid
+
+    def _gather(self, ijk):
+        """Returns the voxel values at the (broadcast) [z,y,x] indices."""
+
+        return self.vol[ijk[0], ijk[1], ijk[2]]
+
     def dims(self):
         """Returns the dimensions of the object."""
 
@@ -81,4 +143,89 @@ class Voxels:
         """Returns the number of voxels representing the object."""
 
         return np.flip(self.n)
-        
+
+class BrickVoxels(Voxels):
+    def __init__(self, fill, index, bricks, n, scale, shift, brick):
+        """Stores a voxel object as bricks of `brick`**3 voxels.
+
+        Most of the bounding box of a thin body is either empty or solid, so only the bricks which
+        mix values are stored densely, in `bricks`. The uniform bricks are reduced to their value
+        in the [z,y,x] brick array `fill`, `index` gives the position of each mixed brick in
+        `bricks` and is -1 for uniform bricks. `n` is the [z,y,x] shape of the full volume, which
+        is padded up to a whole number of bricks by repeating its last voxels, so that the padding
+        never mixes a brick. Use `from_voxels` to build the bricks from a dense voxel object.
+        """
+
+        self.fill = fill
+        self.index = index
+        self.bricks = bricks
+        self.brick = brick
+        self.scale = scale
+        self.shift = shift
+
+        self.n = tuple(int(m) for m in n)
+        self.L = self.n / np.flip(self.scale)
+
+    @classmethod
+    def from_voxels(cls, voxels, brick=16):
+        """Splits the volume of a dense voxel object into bricks, one layer of bricks at a time."""
+
+        nz, ny, nx = voxels.n
+        nb = [-(-m // brick) for m in voxels.n]
+
+        fill = np.zeros(nb, dtype=voxels.vol.dtype)
+        index = np.full(nb, -1, dtype=np.int64)
+        bricks = []
+        count = 0
+        for kb in range(nb[0]):
+            k0 = kb * brick
+            layer = np.asarray(voxels.vol[k0:k0 + brick])
+            layer = np.pad(layer, [(0, brick - len(layer)), (0, nb[1] * brick - ny),
+                                   (0, nb[2] * brick - nx)], mode="edge")
+
+            # (jb, ib, k, j, i) view of the bricks of the layer
+            layer = layer.reshape(brick, nb[1], brick, nb[2], brick).transpose(1, 3, 0, 2, 4)
+            lo = layer.min(axis=(2, 3, 4))
+            hi = layer.max(axis=(2, 3, 4))
+
+            fill[kb] = lo
+            mixed = lo != hi
+            index[kb][mixed] = count + np.arange(np.count_nonzero(mixed))
+            count += np.count_nonzero(mixed)
+            bricks.append(layer[mixed])
+
+        bricks = np.concatenate(bricks) if bricks else np.zeros([0, brick, brick, brick])
+        return cls(fill, index, bricks.astype(voxels.vol.dtype, copy=False), voxels.n,
+                   voxels.scale, voxels.shift, brick)
+
+    def query(self, xyz):
+        """Obtains the voxel value at coordinates [xyz]."""
+
+        return self.query_many(np.asarray(xyz, dtype=np.float64)[np.newaxis])[0]
+
+    def _gather(self, ijk):
+        b = [i // self.brick for i in ijk]
+        index = self.index[b[0], b[1], b[2]]
+        if len(self.bricks) == 0:
+            return self.fill[b[0], b[1], b[2]]
+
+        r = [i % self.brick for i in ijk]
+        mixed = self.bricks[np.maximum(index, 0), r[0], r[1], r[2]]
+        return np.where(index >= 0, mixed, self.fill[b[0], b[1], b[2]])
+
+    def dense(self):
+        """Returns the full [z,y,x] voxel volume."""
+
+        vol = np.repeat(np.repeat(np.repeat(self.fill, self.brick, 0), self.brick, 1),
+                        self.brick, 2)
+        for kb, jb, ib in zip(*np.nonzero(self.index >= 0)):
+            vol[kb * self.brick:(kb + 1) * self.brick,
+                jb * self.brick:(jb + 1) * self.brick,
+                ib * self.brick:(ib + 1) * self.brick] = self.bricks[self.index[kb, jb, ib]]
+
+        return vol[:self.n[0], :self.n[1], :self.n[2]]
+
+    def nbytes(self):
+        """Returns the memory used by the bricks."""
+
+        return self.fill.nbytes + self.index.nbytes + self.bricks.nbytes
@@ -0,0 +1,330 @@
+""" src/writer.py
+
+Module to write IBM masks to ADIOS2 files for loading into x3d2.
+
+The mask is written as a sequence of start/count sub-blocks of a global [nz, ny, nx] array, so that
+it can be written as it is produced without the full array existing in memory.
+
+Masks of small bodies in large domains can instead be written sparsely: only the sub-blocks holding
+solid points are stored and the rest of the field takes the fill value. ADIOS2 has no fill value,
+the unwritten points of a global array read as 0 (solid), so a sparse mask `<name>` is stored under
+the variables `<sparse>` = `<name>_sparse` and the file holds no `<name>` for x3d2 to misread as
+solid. Such files cannot be loaded by x3d2 directly, `read_mask` expands them into the full mask.
+The fill value (1, fluid) is stored in `<sparse>_fill`, the global [z,y,x] shape of the field in
+`<sparse>_shape`, the [z,y,x] start and count of each block as rows of `<sparse>_blocks` (absent
+when there are no blocks) and the blocks are encoded according to `<sparse>_encoding`, an index
+into ENCODINGS:
+
+- dense: the blocks are written to the global float64 field `<sparse>` with start/count,
+- bitmask: the blocks are bit-packed (np.packbits of the flattened block) and concatenated into the
+  uint8 array `<sparse>_bits`,
+- rle: the blocks are flattened into runs of alternating values starting with 1 and the run lengths
+  concatenated into the int64 array `<sparse>_runs`.
+
+For the bitmask and rle encodings `<sparse>_offsets` holds the offset of each block in the
+concatenated array, followed by its total length.
+
+The float64 fields can be compressed by an ADIOS2 operator such as blosc, bzip2 or zfp. Which
+operators are available depends on how ADIOS2 was built, when none of the requested operators is
+available the fields are written uncompressed. The lossy operators (LOSSY) would no longer store the
+masks as exact 0s and 1s, so they only compress the other fields (the distance fields) and the
+masks are then written uncompressed.
+"""
+
+import numpy as np
+
+import adios2
+
+from . import instrument
+
+if hasattr(adios2, "__version__"):
+    adios2_minor = int(adios2.__version__.split('.')[1])
+    if adios2_minor >= 10:
+        from adios2 import Stream
+        adios2_new_api = True
+    else:
+        adios2_new_api = False
+else:
+    # Assume old API
+    adios2_new_api = False
+
+# Whether the ADIOS2 library can write a single file collectively from several MPI ranks
+adios2_mpi = bool(getattr(adios2, "is_built_with_mpi", False))
+
+# Encodings of sparse masks, the index is written to the file
+ENCODINGS = ("dense", "bitmask", "rle")
+
+# Default parameters of the ADIOS2 operators. The mask only holds 0s and 1s so the lossless
+# operators shuffle the bits of the float64 values, the lossy operators are given a tolerance for
+# the distance fields.
+OPERATORS = {
+    "blosc": {"compressor": "zstd", "clevel": "5", "doshuffle": "BLOSC_BITSHUFFLE"},
+    "bzip2": {"blockSize100k": "9"},
+    "zfp": {"accuracy": "1e-6"},
+    "sz": {"accuracy": "1e-6"},
+}
+
+# Operators which do not reproduce the values exactly, never applied to the masks
+LOSSY = ("zfp", "sz", "mgard")
+
+def operator_available(name):
+    """Tests whether the ADIOS2 build supports the operator `name`."""
+
+    try:
+        if adios2_new_api:
+            adios2.Adios().define_operator(f"probe_{name}", name)
+        else:
+            adios2.ADIOS().DefineOperator(f"probe_{name}", name)
+        return True
+    except Exception:
+        return False
+
+def operations(compression):
+    """Returns the ADIOS2 operations for a compression request, or None to write uncompressed.
+
+    The request is an operator name, a (name, parameters) pair or a list of these in order of
+    preference, the first available operator is used. Parameters default to OPERATORS.
+    """
+
+    if compression is None:
+        return None
+
+    candidates = [compression] if isinstance(compression, (str, tuple)) else list(compression)
+    for candidate in candidates:
+        name, params = (candidate, None) if isinstance(candidate, str) else candidate
+        if operator_available(name):
+            params = OPERATORS.get(name, {}) if params is None else params
+            return [(name, {k: str(v) for k, v in params.items()})]
+
+    print(f"ADIOS2 operators {candidates} are not available, writing uncompressed")
+    return None
+
+class MaskWriter:
+    def __init__(self, filename, shape, comm=None, compression=None):
+        """Opens an ADIOS2 file to write fields over a global [nz, ny, nx] array.
+
+        Both the `Stream` API of ADIOS2 >= 2.10 and the older `adios2.open` API are supported. When
+        an MPI communicator `comm` is given the file is opened collectively and each rank writes
+        its own blocks, this requires ADIOS2 to be built with MPI. The float64 fields are
+        compressed with the first available operator of `compression`, see `operations`, except
+        that the masks (`ep1` and sparse masks) are written uncompressed by a lossy operator.
+        """
+
+        self.shape = [int(n) for n in shape]
+        self.operations = operations(compression)
+        self.mask_operations = self.operations
+        if self.operations and self.operations[0][0] in LOSSY:
+            print(f"Warning: ADIOS2 operator {self.operations[0][0]} is lossy, the masks are "
+                  "written uncompressed and only the other fields are compressed")
+            self.mask_operations = None
+        args = (filename, "w") if comm is None else (filename, "w", comm)
+        if adios2_new_api:
+            self._fh = Stream(*args)
+        else:
+            self._fh = adios2.open(*args)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        with instrument.stage("write"):
+            self._fh.close()
+
+    def write_scalar(self, name, value):
+        """Writes a single value such as the IBM type `iibm`."""
+
+        if adios2_new_api:
+            self._fh.write(name, value)
+        else:
+            self._fh.write(name, np.array([value]))
+
+    def write_block(self, name, block, start):
+        """Writes a sub-block of a global field, `start` is the [z,y,x] index of its first point.
+
+        The block is widened to the float64 data expected by x3d2.
+        """
+
+        ops = self.mask_operations if is_mask(name) else self.operations
+        with instrument.stage("write", points=np.size(block)):
+            block = np.ascontiguousarray(block, dtype=np.float64)
+            start = [int(s) for s in start]
+            count = list(block.shape)
+
+            if adios2_new_api:
+                self._fh.write(name, block, self.shape, start, count, operations=ops)
+            elif ops:
+                self._fh.write(name, block, self.shape, start, count, ops)
+            else:
+                self._fh.write(name, block, self.shape, start, count)
+
+    def write_array(self, name, array):
+        """Writes a complete global array, keeping its data type."""
+
+        array = np.ascontiguousarray(array)
+        shape = list(array.shape)
+        start = [0] * array.ndim
+
+        if adios2_new_api:
+            self._fh.write(name, array, shape, start, shape, operations=None)
+        else:
+            self._fh.write(name, array, shape, start, shape)
+
+    def write_chunks(self, name, chunks):
+        """Writes a global field from an iterable of (k0, chunk) z-chunks."""
+
+        for k0, chunk in chunks:
+            self.write_block(name, chunk, [k0, 0, 0])
+
+    def write_fields(self, chunks):
+        """Writes several global fields from an iterable of (k0, {name: chunk}) z-chunks."""
+
+        for k0, fields in chunks:
+            for name, chunk in fields.items():
+                self.write_block(name, chunk, [k0, 0, 0])
+
+def write_mask(filename, chunks, shape, iibm=1, fields=None, compression=None):
+    """Writes an IBM mask given as an iterable of (k0, chunk) z-chunks to `filename`.
+
+    Additional fields, such as the distance fields of `distance.NarrowBand.chunks`, may be given as
+    an iterable of (k0, {name: chunk}) z-chunks and are written alongside `ep1`. All fields are
+    compressed according to `compression`, see `operations`.
+    """
+
+    with MaskWriter(filename, shape, compression=compression) as w:
+        w.write_scalar("iibm", iibm)
+        w.write_chunks("ep1", chunks)
+        if fields is not None:
+            w.write_fields(fields)
+
+def write_sparse_mask(filename, blocks, shape, iibm=1, encoding="dense", name="ep1",
+                      compression=None):
+    """Writes an IBM mask given as a list of ([z,y,x] start, block) sub-blocks to `filename`.
+
+    The rest of the mask is fluid, see the module documentation for the file layout. The mask is
+    stored under `<name>_sparse` and cannot be loaded by x3d2 directly. Dense blocks are compressed
+    according to `compression`, see `operations`.
+    """
+
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown sparse mask encoding: {encoding}")
+    name = sparse_name(name)
+
+    table = np.array([list(start) + list(block.shape) for start, block in blocks],
+                     dtype=np.int64).reshape(-1, 6)
+
+    with MaskWriter(filename, shape, compression=compression) as w:
+        w.write_scalar("iibm", iibm)
+        w.write_scalar(f"{name}_fill", 1.0)
+        w.write_scalar(f"{name}_encoding", ENCODINGS.index(encoding))
+        w.write_array(f"{name}_shape", np.array(shape, dtype=np.int64))
+        if len(blocks) == 0:
+            return
+
+        w.write_array(f"{name}_blocks", table)
+
+        if encoding == "dense":
+            for start, block in blocks:
+                w.write_block(name, block, start)
+        else:
+            encode = _bitmask if encoding == "bitmask" else _rle
+            data = [encode(np.asarray(block)) for _, block in blocks]
+            offsets = np.cumsum([0] + [len(d) for d in data], dtype=np.int64)
+            dtype = np.uint8 if encoding == "bitmask" else np.int64
+
+            w.write_array(f"{name}_offsets", offsets)
+            w.write_array(f"{name}_{'bits' if encoding == 'bitmask' else 'runs'}",
+                          np.concatenate(data + [np.zeros(0, dtype=dtype)]).astype(dtype))
+
+def sparse_name(name="ep1"):
+    """Returns the name under which the sparse mask `name` is stored."""
+
+    return f"{name}_sparse"
+
+def is_mask(name):
+    """Tests whether the field `name` is a mask (`ep1` or a sparse mask) to be stored exactly."""
+
+    return name == "ep1" or name.endswith(sparse_name(""))
+
+def read_mask(filename, name="ep1"):
+    """Reads a complete IBM mask back from a dense or sparse ADIOS2 file.
+
+    This requires the ADIOS2 Stream API.
+    """
+
+    with Stream(filename, "r") as s:
+        for _ in s.steps():
+            if f"{sparse_name(name)}_shape" not in s.available_variables():
+                return s.read(name)
+
+            shape, fill, blocks = _read_blocks(s, sparse_name(name))
+
+    ibm = np.full(shape, fill)
+    for start, block in blocks:
+        ibm[start[0]:start[0] + block.shape[0],
+            start[1]:start[1] + block.shape[1],
+            start[2]:start[2] + block.shape[2]] = block
+
+    return ibm
+
+def read_blocks(filename, name="ep1"):
+    """Reads the blocks of a sparse IBM mask without expanding them.
+
+    Returns the global [z,y,x] shape, the fill value and the list of ([z,y,x] start, block) pairs.
+    This requires the ADIOS2 Stream API.
+    """
+
+    with Stream(filename, "r") as s:
+        for _ in s.steps():
+            return _read_blocks(s, sparse_name(name))
+
+def _read_blocks(s, name):
+    shape = [int(n) for n in s.read(f"{name}_shape")]
+    fill = float(s.read(f"{name}_fill"))
+    if f"{name}_blocks" not in s.available_variables():
+        return shape, fill, []
+
+    table = s.read(f"{name}_blocks").reshape(-1, 6)
+    encoding = ENCODINGS[int(s.read(f"{name}_encoding"))]
+
+    if encoding != "dense":
+        offsets = s.read(f"{name}_offsets")
+        data = s.read(f"{name}_{'bits' if encoding == 'bitmask' else 'runs'}")
+
+    blocks = []
+    for b, row in enumerate(table):
+        start, count = row[:3], row[3:]
+        if encoding == "dense":
+            block = s.read(name, list(start), list(count))
+        elif encoding == "bitmask":
+            block = _unbitmask(data[offsets[b]:offsets[b + 1]], count)
+        else:
+            block = _unrle(data[offsets[b]:offsets[b + 1]], count)
+        blocks.append((start, block))
+
+    return shape, fill, blocks
+
+def _bitmask(block):
+    return np.packbits(block.ravel() != 0)
+
+def _unbitmask(bits, count):
+    return np.unpackbits(bits, count=int(np.prod(count))).reshape(count)
+
+def _rle(block):
+    """Returns the lengths of the runs of alternating values of the flattened block, starting with
+    a (possibly empty) run of 1s."""
+
+    flat = block.ravel() != 0
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    edges = np.concatenate([[0], change, [flat.size]])
+    runs = np.diff(edges)
+    if flat.size > 0 and not flat[0]:
+        runs = np.concatenate([[0], runs])
+
+    return runs.astype(np.int64)
+
+def _unrle(runs, count):
+    values = np.arange(len(runs)) % 2 == 0
+    return np.repeat(values, runs).astype(np.uint8).reshape(count)
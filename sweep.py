@@ -0,0 +1,12 @@
+""" sweep.py
+
+Generates the IBM masks of a sweep of configurations, equivalent to `py4x3d2 sweep`, see
+`src/cli.py`.
+"""
+
+import sys
+
+from src import cli
+
+if __name__ == "__main__":
+    sys.exit(cli.main(["sweep", *sys.argv[1:]]))
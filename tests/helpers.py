@@ -0,0 +1,142 @@
+""" tests/helpers.py
+
+Fixtures shared by the tests and the benchmarks.
+"""
+
+import numpy as np
+from stl import mesh
+
+from src import embed_stl
+from src import grid
+from src import writer
+from src.voxel import Voxels
+
+# Sweep file of two cases over one stl file, see sweep.load
+CONFIG = """
+workers = 2
+output_dir = "out"
+
+[[case]]
+name = "coarse"
+mesh_n = [40, 20, 10]
+mesh_l = [8.0, 4.0, 2.0]
+ratio = 2
+
+[[case]]
+name = "fine"
+mesh_n = [41, 21, 11]
+mesh_l = [8.0, 4.0, 2.0]
+relative_offset = [3.0, 0.0, 0.0]
+"""
+
+def embed_reference(voxels, mesh_n, mesh_l, shift=[0, 0, 0]):
+    """Point-by-point embedding, used as the reference for the vectorized embedder.
+
+    The mesh may be uniform or a `grid.Grid`.
+    """
+
+    nx, ny, nz = mesh_n
+    x, y, z = grid.coordinates(mesh_n, mesh_l)
+
+    bbox_min, bbox_max = voxels.bounding_box()
+    offset = np.array(shift) - (bbox_min + bbox_max) / 2.0
+
+    n0, nn = embed_stl._bounds(voxels, [x, y, z], offset)
+
+    ibm = np.ones([nz, ny, nx], dtype=np.float64)
+    for k in range(n0[2], nn[2]):
+        for j in range(n0[1], nn[1]):
+            for i in range(n0[0], nn[0]):
+                x_global = np.array([x[i], y[j], z[k]])
+
+                x_local = x_global - offset
+
+                if voxels.query(x_local) > 0:
+                    ibm[k, j, i] = 0.0
+
+    return ibm
+
+def ellipsoid(n, scale, shift):
+    """Builds a voxelised ellipsoid filling a [z,y,x] volume of n voxels."""
+
+    k, j, i = np.indices(n)
+    r = sum(((c + 0.5) / m - 0.5)**2 for c, m in zip((k, j, i), n))
+    vol = (r <= 0.25).astype(np.int8)
+
+    return Voxels(vol, np.array(scale, dtype=float), np.array(shift, dtype=float))
+
+def write_stl(filename, triangles):
+    """Writes a (N, 3, 3) array of triangles as an STL file."""
+
+    m = mesh.Mesh(np.zeros(len(triangles), dtype=mesh.Mesh.dtype))
+    m.vectors[:] = triangles
+    m.save(filename)
+
+def box_triangles(x0, xn):
+    """Returns the 12 outward facing triangles of the box [x0, xn] as a (12, 3, 3) array."""
+
+    x0 = np.asarray(x0, dtype=float)
+    xn = np.asarray(xn, dtype=float)
+    c = np.array([[(x0, xn)[i][0], (x0, xn)[j][1], (x0, xn)[k][2]]
+                  for k in range(2) for j in range(2) for i in range(2)])
+    faces = [[0, 2, 3, 1], [4, 5, 7, 6], [0, 1, 5, 4], [2, 6, 7, 3], [0, 4, 6, 2], [1, 3, 7, 5]]
+
+    tris = []
+    for f in faces:
+        tris.append([c[f[0]], c[f[1]], c[f[2]]])
+        tris.append([c[f[0]], c[f[2]], c[f[3]]])
+
+    return np.array(tris)
+
+def rotation_z(theta):
+    c = np.cos(theta)
+    s = np.sin(theta)
+    return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+def read_field(filename, name):
+    """Reads a complete field back from an ADIOS2 file."""
+
+    with writer.Stream(filename, "r") as s:
+        for _ in s.steps():
+            return s.read(name)
+
+def flood_fill(solid):
+    """Finds the face-connected components of a small boolean array one point at a time, used as
+    the reference for `regions.Regions`."""
+
+    label = -np.ones(solid.shape, dtype=int)
+    regions = []
+    for seed in zip(*np.nonzero(solid)):
+        if label[seed] >= 0:
+            continue
+        label[seed] = len(regions)
+        stack, points = [seed], []
+        while stack:
+            p = stack.pop()
+            points.append(p)
+            for d in range(3):
+                for step in (-1, 1):
+                    q = list(p)
+                    q[d] += step
+                    q = tuple(q)
+                    if 0 <= q[d] < solid.shape[d] and solid[q] and label[q] < 0:
+                        label[q] = label[seed]
+                        stack.append(q)
+        points = np.array(points)
+        regions.append((points.min(axis=0).tolist(), (points.max(axis=0) + 1).tolist(),
+                        len(points)))
+
+    return sorted(regions)
+
+def bodies():
+    """Returns a [z,y,x] mask of a hollow box, a bar joined to it through a chunk boundary and a
+    U-shaped body whose arms only meet in its last planes."""
+
+    ibm = np.ones([12, 10, 16])
+    ibm[1:6, 1:6, 1:6] = 0
+    ibm[2:5, 2:5, 2:5] = 1
+    ibm[5:9, 3, 3] = 0
+    ibm[2:10, 7, 8:14] = 0
+    ibm[2:9, 7, 10:12] = 1
+
+    return ibm
@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
+import os
+import sys
 import numpy as np
-from adios2 import Stream
-from test_cylinder import *
 import argparse
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from test_cylinder import *
+from src import cylinder
+from src.mask import ones, chunks
+from src.writer import write_mask
+
 #
 # Default values
 #
@@ -16,6 +22,7 @@ default_dy = default_dx
 default_dz = default_dx
 default_save = True
 default_verbose = True
+default_dtype = "float64"
 output = "ibm"
 
 #
@@ -30,7 +37,10 @@ parser.add_argument('--dz', type=float, default=default_dz, help='step of the me
 parser.add_argument('--nx', type=int, default=default_nx, help='number of cells in x')
 parser.add_argument('--ny', type=int, default=default_ny, help='number of cells in y')
 parser.add_argument('--nz', type=int, default=default_nz, help='number of cells in z')
+parser.add_argument('--dtype', default=default_dtype, choices=['float64', 'uint8', 'bool', 'packed'], help='in-memory type of the mask')
 parser.add_argument('--save', type=bool, default=default_save, help='save profiles', action=argparse.BooleanOptionalAction)
+parser.add_argument('--distance', type=bool, default=False, help='save the signed distance and direction fields', action=argparse.BooleanOptionalAction)
+parser.add_argument('--compress', nargs='+', default=None, metavar='OPERATOR', help='compress the fields with the first available ADIOS2 operator')
 parser.add_argument('--cyl', nargs=7, 
                              metavar=('Rcyl', 'x0', 'y0', 'z0', 'ax', 'ay', 'az'),
                              help="Define a cylinder with radius Rcyl, position (x0, y0, z0) and axis (ax, ay, az)", 
@@ -46,6 +56,7 @@ if args.verbose:
     print("  Type of IBM : " + str(args.iibm))
     print("  Step of the mesh : " + str(args.dx) + " " + str(args.dy) + " " + str(args.dz))
     print("  Number of cells : " + str(args.nx) + " " + str(args.ny) + " " + str(args.nz))
+    print("  Mask type : " + args.dtype)
     print("  Generate the IBM input : " + str(args.save))
     print("  Cylinder : " + str(args.cyl))
 
@@ -60,25 +71,35 @@ dx = args.dx
 dy = args.dy
 dz = args.dz
 
+dtype = args.dtype if args.dtype == "packed" else np.dtype(args.dtype)
+
 #
 # Generate the mask
 #
-mask = np.ones((nz, ny, nx), dtype=np.double)
+# the cylinder is evaluated in z-chunks directly into the mask
+mask = ones([nx, ny, nz], dtype=dtype)
 if args.cyl:
-    mask = mask * gencyl([dz, dy, dx], 
-                         [nz, ny, nx], 
-                         args.cyl[0], 
-                         [args.cyl[3], args.cyl[2], args.cyl[1]], 
-                         [args.cyl[6], args.cyl[5], args.cyl[4]])
+    cylinder.gencyl([dz, dy, dx], 
+                    [nz, ny, nx], 
+                    args.cyl[0], 
+                    [args.cyl[3], args.cyl[2], args.cyl[1]], 
+                    [args.cyl[6], args.cyl[5], args.cyl[4]],
+                    out=mask)
 
 #
 # Ouptut to ADIOS2
 #
 if args.save:
-    with Stream("ibm.bp", "w") as s:
-        # Basic IBM
-        s.write("iibm", 1)
-
-        # describe array using python dimensions (z, y, x)
-        # adios will automatically map this to fortran's (x, y, z)
-        s.write("ep1", np.ascontiguousarray(mask), shape=[nz, ny, nx], start=[0,0,0], count=[nz, ny, nx], operations=None)
+    # describe array using python dimensions (z, y, x)
+    # adios will automatically map this to fortran's (x, y, z)
+    # the mask is widened to float64 one chunk at a time
+    # the distance fields of the cylinder are computed analytically
+    fields = None
+    if args.cyl and args.distance:
+        fields = cylinder.iter_fields([dz, dy, dx],
+                                      [nz, ny, nx],
+                                      args.cyl[0],
+                                      [args.cyl[3], args.cyl[2], args.cyl[1]],
+                                      [args.cyl[6], args.cyl[5], args.cyl[4]])
+    write_mask("ibm.bp", chunks(mask), [nz, ny, nx], iibm=1, fields=fields,
+               compression=args.compress)
@@ -0,0 +1,84 @@
+""" tests/test_cache.py
+"""
+
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import cache
+from src.voxel import Voxels
+
+class TestCache(unittest.TestCase):
+    """Tests storing, loading and evicting cache entries."""
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+        self.vox = Voxels(np.ones([20, 5, 10], dtype=np.int8),
+                          np.array([10.0, 2.5, 5.0]),
+                          np.array([0.75, -3.0, 2.0]))
+
+    def tearDown(self):
+
+        self.tmp.cleanup()
+
+    def test_key(self):
+
+        a = os.path.join(self.dir, "a.stl")
+        b = os.path.join(self.dir, "b.stl")
+        with open(a, "wb") as f:
+            f.write(b"solid a")
+        with open(b, "wb") as f:
+            f.write(b"solid b")
+
+        self.assertEqual(cache.key(a, 350), cache.key(a, 350))
+        self.assertNotEqual(cache.key(a, 350), cache.key(a, 100))
+        self.assertNotEqual(cache.key(a, 350), cache.key(b, 350))
+
+    def test_roundtrip(self):
+
+        self.assertIsNone(cache.load("k", self.dir))
+
+        cache.store("k", self.vox, self.dir)
+        vox = cache.load("k", self.dir)
+
+        self.assertIsInstance(vox.vol, np.memmap)
+        self.assertTrue(np.array_equal(vox.vol, self.vox.vol))
+        self.assertTrue(np.array_equal(vox.scale, self.vox.scale))
+        self.assertTrue(np.array_equal(vox.shift, self.vox.shift))
+        self.assertTrue(np.array_equal(vox.L, self.vox.L))
+
+    def test_evicted(self):
+        # Another process evicts the entry while it is being loaded
+
+        cache.store("k", self.vox, self.dir)
+        with mock.patch("src.cache.os.utime", side_effect=FileNotFoundError):
+            self.assertIsNone(cache.load("k", self.dir))
+
+    def test_evict(self):
+
+        for k in ["a", "b", "c"]:
+            cache.store(k, self.vox, self.dir)
+            t = time.time() - 10 + ["a", "b", "c"].index(k)
+            os.utime(os.path.join(self.dir, k), (t, t))
+
+        # Using an entry makes it the most recent
+        cache.load("a", self.dir)
+
+        size = cache.entries(self.dir)[0][1]
+        cache.evict(self.dir, 2 * size)
+
+        self.assertEqual(sorted(k for k, _, _ in cache.entries(self.dir)), ["a", "c"])
+
+    def test_clear(self):
+
+        cache.store("a", self.vox, self.dir)
+        cache.clear(self.dir)
+
+        self.assertEqual(cache.entries(self.dir), [])
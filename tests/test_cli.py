@@ -0,0 +1,221 @@
+""" tests/test_cli.py
+"""
+
+import contextlib
+import inspect
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import cli
+from src import cylinder
+from src import sweep
+from src import writer
+from tests.helpers import CONFIG
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+def dry_run(argv):
+    """Runs the command line with --dry-run, returning the printed settings."""
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        cli.main([*argv, "--dry-run"])
+
+    return json.loads(out.getvalue())
+
+class TestOption(unittest.TestCase):
+    """Tests validating the values of settings."""
+
+    def test_lists(self):
+
+        option = cli.Option("mesh_n", [1, 1, 1], int, (3,))
+        self.assertEqual(option.check([4, 5, 6]), [4, 5, 6])
+        for value in ([4, 5], 4, [4, 5, 6.5], None):
+            with self.assertRaises(ValueError):
+                option.check(value)
+
+        scale = cli.Option("scale", None, float, (1, 3), positive=True)
+        self.assertEqual(scale.check(2), 2.0)
+        self.assertEqual(scale.check([2]), 2.0)
+        self.assertEqual(scale.check([1, 2, 3]), [1.0, 2.0, 3.0])
+        self.assertIsNone(scale.check(None))
+        with self.assertRaises(ValueError):
+            scale.check([1, 0, 3])
+
+    def test_matrix(self):
+
+        rotation = cli.Option("rotation", None, float, (3,), matrix=True)
+        self.assertEqual(rotation.check([[0, -1, 0], [1, 0, 0], [0, 0, 1]])[0], [0.0, -1.0, 0.0])
+        with self.assertRaises(ValueError):
+            rotation.check([[0, -1], [1, 0], [0, 0]])
+
+    def test_types(self):
+
+        with self.assertRaises(ValueError):
+            cli.Option("cache", True, bool).check("yes")
+        with self.assertRaises(ValueError):
+            cli.Option("workers", 1, int).check(True)
+        with self.assertRaises(ValueError):
+            cli.Option("engine", "voxel", choices=("voxel", "raster")).check("mesh")
+
+    def test_known(self):
+
+        # The settings mirror those of the modules they are passed to
+        self.assertEqual(cli.ENCODINGS, tuple(writer.ENCODINGS))
+        self.assertEqual([o.name for o in cli.CASE_OPTIONS],
+                         list(inspect.signature(sweep.Case).parameters))
+
+class TestSettings(unittest.TestCase):
+    """Tests resolving the settings from the defaults, config files and flags."""
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+
+        filename = os.path.join(self.tmp.name, name)
+        with open(filename, "w") as fh:
+            fh.write(text)
+
+        return filename
+
+    def test_defaults(self):
+
+        result = dry_run(["stl"])
+        self.assertEqual(result["settings"]["stl"], "front_foil.stl")
+        self.assertEqual(result["settings"]["mesh_n"], [697, 1878, 429])
+        self.assertEqual(result["derived"]["mesh_n"], [697, 1878, 429])
+        self.assertTrue(result["settings"]["cache"])
+
+    def test_toml(self):
+
+        filename = self.write("case.toml", "[stl]\nstl = 'foil.stl'\nmesh_n = [101, 201, 51]\n"
+                              "ratio = 2\nrotation = [0, 0, 15]\n\n[cylinder]\nradius = 0.5\n")
+
+        result = dry_run(["stl", "--config", filename, "--ratio", "4", "--no-cache"])
+        s = result["settings"]
+        self.assertEqual(s["stl"], "foil.stl")
+        self.assertEqual(s["ratio"], 4.0)
+        self.assertEqual(s["rotation"], [0.0, 0.0, 15.0])
+        self.assertFalse(s["cache"])
+        self.assertEqual(result["derived"]["mesh_n"], [25, 50, 12])
+
+        result = dry_run(["cylinder", "--config", filename, "--mesh-n", "11", "21", "31"])
+        self.assertEqual(result["settings"]["radius"], 0.5)
+        self.assertTrue(np.allclose(result["derived"]["origin"], [0.5, 1.0, 1.5]))
+
+    def test_yaml(self):
+
+        filename = self.write("case.yaml", "mesh_n: [33, 33, 17]\nscale: [1, 2, 1]\n"
+                              "distance: 2\n")
+
+        s = dry_run(["stl", "--config", filename])["settings"]
+        self.assertEqual(s["mesh_n"], [33, 33, 17])
+        self.assertEqual(s["scale"], [1.0, 2.0, 1.0])
+        self.assertEqual(s["distance"], 2)
+
+    def test_top_level(self):
+
+        filename = self.write("top.toml", "stl = 'foil.stl'\nratio = 2\n")
+
+        s = dry_run(["stl", "--config", filename])["settings"]
+        self.assertEqual(s["stl"], "foil.stl")
+        self.assertEqual(s["ratio"], 2.0)
+
+    def test_resolution(self):
+        # A fixed voxel resolution is passed on to the conversion of the stl file
+
+        self.assertIsNone(dry_run(["stl"])["settings"]["resolution"])
+        self.assertEqual(dry_run(["stl", "--resolution", "350"])["settings"]["resolution"], 350)
+
+        with mock.patch("src.convert_stl.convert", side_effect=RuntimeError) as convert, \
+             contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(RuntimeError):
+                cli.main(["stl", "--resolution", "350", "--voxels-per-cell", "4"])
+        self.assertEqual(convert.call_args.args[1], 350)
+
+    def test_sweep(self):
+
+        filename = self.write("sweep.toml", CONFIG)
+
+        result = dry_run(["sweep", filename, "--workers", "4"])
+        self.assertEqual(result["settings"]["workers"], 4)
+        self.assertEqual(result["settings"]["output_dir"], "out")
+        self.assertEqual(result["derived"]["cases"], ["coarse", "fine"])
+
+    def test_invalid(self):
+
+        unknown = self.write("unknown.toml", "mesh = [1, 2, 3]\n")
+        wrong = self.write("wrong.toml", "ratio = 'x'\n")
+        case = self.write("case.toml", "[[case]]\nname = 'a'\nmesh_n = [11, 11]\n"
+                          "mesh_l = [1, 1, 1]\n")
+
+        for argv in (["stl", "--config", unknown],
+                     ["stl", "--config", wrong],
+                     ["stl", "--fraction", "--sparse", "rle"],
+                     ["stl", "--engine", "raster", "--bricks"],
+                     ["stl", "--engine", "raster", "--resolution", "350"],
+                     ["stl", "--ratio", "1000"],
+                     ["stl", "--istret", "1"],
+                     ["cylinder", "--istret", "4", "--beta", "1"],
+                     ["cylinder", "--radius", "1", "--axis", "0", "0", "0"],
+                     ["sweep", case]):
+            with self.subTest(argv=argv), contextlib.redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit) as cm:
+                    cli.main([*argv, "--dry-run"])
+                self.assertEqual(cm.exception.code, 2)
+
+class TestStartup(unittest.TestCase):
+
+    def test_lazy_imports(self):
+
+        # --help and --dry-run do not load numpy, ADIOS2 or the STL libraries
+        code = ("import contextlib, io, sys\n"
+                "from src import cli\n"
+                "with contextlib.redirect_stdout(io.StringIO()):\n"
+                "    cli.main(['stl', '--dry-run'])\n"
+                "    cli.main(['cylinder', '--dry-run'])\n"
+                "    try:\n"
+                "        cli.main(['--help'])\n"
+                "    except SystemExit:\n"
+                "        pass\n"
+                "print(sorted(m for m in sys.modules\n"
+                "             if m.split('.')[0] in ('numpy', 'adios2', 'stl', 'stltovoxel')))\n")
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True,
+                                text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+@unittest.skipUnless(writer.adios2_new_api, "reading back requires the ADIOS2 Stream API")
+class TestCylinder(unittest.TestCase):
+
+    def test_cylinder(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "cyl.bp")
+            with contextlib.redirect_stdout(io.StringIO()):
+                cli.main(["cylinder", "--mesh-n", "12", "14", "16", "--spacing", "0.1", "0.2",
+                          "0.3", "--radius", "0.5", "--origin", "0.6", "1.2", "2.0", "--axis",
+                          "1", "0", "1", "--output", filename])
+            ep1 = writer.read_mask(filename)
+
+        expected = cylinder.gencyl([0.3, 0.2, 0.1], [16, 14, 12], 0.5, [2.0, 1.2, 0.6],
+                                   [1.0, 0.0, 1.0])
+        self.assertEqual(ep1.shape, (16, 14, 12))
+        self.assertTrue(np.array_equal(ep1, expected))
+        self.assertGreater(np.count_nonzero(ep1 == 0), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+""" tests/test_convert_stl.py
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import cache
+from src import convert_stl
+from tests.helpers import box_triangles, write_stl
+
+class TestConvertCache(unittest.TestCase):
+    """Tests that STL conversion goes through the voxel cache."""
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stl_file = os.path.join(self.tmp.name, "box.stl")
+        write_stl(self.stl_file, box_triangles([0.0, 0.0, 0.0], [1.0, 2.0, 4.0]))
+
+        self.env = mock.patch.dict(os.environ,
+                                   {"PY4X3D2_CACHE_DIR": os.path.join(self.tmp.name, "cache")})
+        self.env.start()
+
+    def tearDown(self):
+
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_cache(self):
+
+        vox = convert_stl.convert(self.stl_file)
+        self.assertEqual(len(cache.entries()), 1)
+
+        with mock.patch("stltovoxel.convert_meshes") as convert_meshes:
+            cached = convert_stl.convert(self.stl_file)
+            convert_meshes.assert_not_called()
+
+        self.assertIsInstance(cached.vol, np.memmap)
+        self.assertTrue(np.array_equal(cached.vol, vox.vol))
+        self.assertTrue(np.array_equal(cached.scale, vox.scale))
+        self.assertTrue(np.array_equal(cached.shift, vox.shift))
+
+    def test_no_cache(self):
+
+        convert_stl.convert(self.stl_file, cache=False)
+        self.assertEqual(cache.entries(), [])
+
+class TestResolution(unittest.TestCase):
+    """Tests choosing the voxel resolution from the x3d2 mesh."""
+
+    def test_choose(self):
+
+        mesh_min = np.array([0.0, 0.0, 0.0])
+        mesh_max = np.array([1.0, 2.0, 4.0])
+        mesh_n = [11, 41, 21]
+        mesh_l = [1.0, 2.0, 4.0]
+
+        # The smallest grid spacing is 0.05 in y
+        resolution = convert_stl.choose_resolution(mesh_min, mesh_max, mesh_n, mesh_l, 2.0)
+        self.assertEqual(resolution, 160)
+        self.assertLessEqual(4.0 / resolution, 0.05 / 2.0)
+        self.assertGreater(4.0 / (resolution - 1), 0.05 / 2.0)
+
+    def test_convert(self):
+
+        with tempfile.TemporaryDirectory() as tmp:
+            stl_file = os.path.join(tmp, "box.stl")
+            write_stl(stl_file, box_triangles([0.0, 0.0, 0.0], [1.0, 2.0, 4.0]))
+
+            mesh_n = [11, 21, 21]
+            mesh_l = [2.0, 4.0, 8.0]
+            vox = convert_stl.convert(stl_file, mesh_n=mesh_n, mesh_l=mesh_l, voxels_per_cell=1.5,
+                                      cache=False)
+
+        resolution = convert_stl.choose_resolution([0.0, 0.0, 0.0], [1.0, 2.0, 4.0], mesh_n,
+                                                   mesh_l, 1.5)
+        shape, nbytes, _ = convert_stl.estimate([0.0, 0.0, 0.0], [1.0, 2.0, 4.0], resolution)
+
+        self.assertTrue(np.all(1 / vox.scale <= 0.2 / 1.5 + 1e-12))
+        self.assertEqual(tuple(shape), vox.vol.shape)
+        self.assertEqual(nbytes, vox.vol.nbytes)
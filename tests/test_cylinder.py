@@ -6,6 +6,8 @@ import unittest
 
 import numpy as np
 
+from src import cylinder
+
 NX=10
 NY=10
 NZ=10
@@ -58,7 +60,7 @@ def get_grid_radius(ijk, dxyz, origin, axis):
     x = get_grid_point(ijk, dxyz)
     return get_point_radius(x, origin, axis)
 
-def gencyl(dxyz, n, rcyl, origin, axis):
+def gencyl(dxyz, n, rcyl, origin, axis, dtype=np.float64):
     """Generates a mask array representing a cylinder.
 
     :param dxyz:   The grid spacing (dz,dy,dx)
@@ -66,6 +68,7 @@ def gencyl(dxyz, n, rcyl, origin, axis):
     :param rcyl:   The cylinder radius
     :param origin: The origin vector for the cylinder axis
     :param axis:   The vector along the cylinder axis
+    :param dtype:  The data type of the mask array
     :return:       Mask array of 0s for exterior points, 1s for interior points.
     """
     k, j, i = np.indices(n)
@@ -78,7 +81,7 @@ def gencyl(dxyz, n, rcyl, origin, axis):
     c = np.cross(p - p0, u)
     distance = np.linalg.norm(c, axis=-1) / np.linalg.norm(u)
 
-    mask = np.where(distance <= rcyl, 0.0, 1.0)
+    mask = np.where(distance <= rcyl, 0.0, 1.0).astype(dtype, copy=False)
 
     return mask
 
@@ -101,14 +104,114 @@ class TestMask(unittest.TestCase):
                     elif r < RCYL:
                         self.assertEqual(mask[k][j][i], 0.0)
 
-# class TestDistance(unittest.TestCase):
-#     """Test that the distance from the surface is correct: exterior points are at a positive
-#     distance, interior points are at a negative distance."""
-#     pass
+class TestChunked(unittest.TestCase):
+    """Test that the chunked generator matches the point cloud reference."""
+
+    def check(self, axis, origin, dtype=np.float64, nk=3):
+        n = [11, 13, 17]
+        dxyz = [0.1, 0.09, 0.07]
+        rcyl = 0.37
+
+        ref = gencyl(dxyz, n, rcyl, origin, axis)
+        mask = cylinder.gencyl(dxyz, n, rcyl, origin, axis, dtype=dtype, nk=nk)
+
+        self.assertEqual(mask.shape, tuple(n))
+        self.assertEqual(np.count_nonzero(ref == 0) > 0, True)
+        np.testing.assert_array_equal(np.asarray(mask, dtype=np.float64), ref)
+
+    def test_z(self):
+        self.check([1, 0, 0], [0, 0.5, 0.6])
+
+    def test_y(self):
+        self.check([0, 2, 0], [0.5, 0, 0.6])
+
+    def test_x(self):
+        self.check([0, 0, 1], [0.5, 0.6, 0])
+
+    def test_oblique(self):
+        self.check([1, 2, 3], [0.4, 0.5, 0.6])
+
+    def test_dtype(self):
+        for dtype in [np.uint8, np.bool_, "packed"]:
+            with self.subTest(dtype=dtype):
+                self.check([1, 2, 3], [0.4, 0.5, 0.6], dtype=dtype)
+                self.check([0, 0, 1], [0.5, 0.6, 0], dtype=dtype)
+
+    def test_out(self):
+        mask = np.zeros([11, 13, 17], dtype=np.uint8)
+        result = cylinder.gencyl([0.1, 0.09, 0.07], [11, 13, 17], 0.37, [0, 0.5, 0.6], [1, 0, 0],
+                                 out=mask)
+        self.assertIs(result, mask)
+        self.assertTrue(np.any(mask == 1))
+
+    def test_stretched(self):
+        n = [11, 13, 17]
+        y = np.linspace(0, 1, n[1])**2 * 1.1
+        mask = cylinder.gencyl([0.1, y, 0.07], n, 0.37, [0.4, 0.5, 0.6], [1, 2, 3])
+
+        z, x = np.arange(n[0]) * 0.1, np.arange(n[2]) * 0.07
+        for k, j, i in np.ndindex(*n):
+            r = get_point_radius(np.array([z[k], y[j], x[i]]), np.array([0.4, 0.5, 0.6]),
+                                 np.array([1, 2, 3]))
+            if abs(r - 0.37) > 1e-12:
+                self.assertEqual(mask[k, j, i], float(r > 0.37))
+
+def get_fields(n, origin, axis):
+    """Gathers the distance fields of a cylinder over the whole grid."""
+
+    fields = {}
+    for k0, chunk in cylinder.iter_fields([DZ, DY, DX], n, RCYL, origin, axis, nk=3):
+        for name, f in chunk.items():
+            fields.setdefault(name, []).append(np.broadcast_to(f, [len(f)] + n[1:]))
+
+    return {name: np.concatenate(f) for name, f in fields.items()}
+
+class TestDistance(unittest.TestCase):
+    """Test that the distance from the surface is correct: exterior points are at a positive
+    distance, interior points are at a negative distance."""
+
+    def test_x(self):
+
+        origin = [0.5, 0.4, 0]
+        fields = get_fields([NZ, NY, NX], origin, [0, 0, 1])
+
+        for k in range(NZ):
+            for j in range(NY):
+                for i in range(NX):
+
+                    r = get_grid_radius([k, j, i], [DZ, DY, DX], origin, [0, 0, 1])
+                    self.assertAlmostEqual(fields["dist"][k, j, i], r - RCYL)
+
+    def test_oblique(self):
+
+        origin = [0.5, 0.4, 0.3]
+        axis = [1, 2, 3]
+        fields = get_fields([NZ, NY, NX], origin, axis)
+        mask = gencyl([DZ, DY, DX], [NZ, NY, NX], RCYL, origin, axis)
+
+        self.assertTrue(np.all(fields["dist"][mask == 1] > 0))
+        self.assertTrue(np.all(fields["dist"][mask == 0] <= 0))
+
+class TestDirection(unittest.TestCase):
+    """Test that the direction vector is correct: it should point to the nearest surface point."""
+
+    def test_oblique(self):
+
+        origin = [0.5, 0.4, 0.3]
+        axis = [1, 2, 3]
+        fields = get_fields([NZ, NY, NX], origin, axis)
+
+        for k in range(NZ):
+            for j in range(NY):
+                for i in range(NX):
+
+                    d = np.array([fields[name][k, j, i] for name in ["dir_z", "dir_y", "dir_x"]])
+                    self.assertAlmostEqual(np.linalg.norm(d), 1.0)
 
-# class TestDirection(unittest.TestCase):
-#     """Test that the direction vector is correct: it should point to the nearest surface point."""
-#     pass
+                    # Moving by the distance along the direction reaches the surface
+                    x = get_grid_point([k, j, i], [DZ, DY, DX])
+                    s = x + abs(fields["dist"][k, j, i]) * d
+                    self.assertAlmostEqual(get_point_radius(s, origin, axis), RCYL)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,163 @@
+""" tests/test_distance.py
+"""
+
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+import numpy as np
+
+from src import cylinder
+from src import distance
+from src import mask
+from src import writer
+from tests.helpers import read_field
+
+N = [41, 37, 33]
+DXYZ = [0.05, 0.05, 0.05]
+RCYL = 0.4
+ORIGIN = [1.0, 0.9, 0.8]
+AXIS = [1, 1, 2]
+
+def mesh():
+    """Returns the [x,y,z] mesh dimensions of the [z,y,x] test grid."""
+
+    mesh_n = list(np.flip(N))
+    mesh_l = [(n - 1) * h for n, h in zip(mesh_n, np.flip(DXYZ))]
+    return mesh_n, mesh_l
+
+def gather(chunks, plane=N[1:]):
+    """Concatenates (k0, {name: chunk}) z-chunks into full fields."""
+
+    fields = {}
+    for k0, chunk in chunks:
+        for name, f in chunk.items():
+            fields.setdefault(name, []).append(np.broadcast_to(f, (len(f),) + tuple(plane)))
+
+    return {name: np.concatenate(f) for name, f in fields.items()}
+
+class TestNarrowBand(unittest.TestCase):
+    """Compares the distance fields computed from a cylinder mask against the analytic fields."""
+
+    def setUp(self):
+
+        self.ibm = cylinder.gencyl(DXYZ, N, RCYL, ORIGIN, AXIS, dtype=np.uint8)
+        self.exact = gather(cylinder.iter_fields(DXYZ, N, RCYL, ORIGIN, AXIS))
+        mesh_n, mesh_l = mesh()
+        self.band = distance.narrow_band(self.ibm, mesh_n, mesh_l, band=4)
+        self.fields = gather(self.band.chunks(nk=7))
+
+        # The cylinder crosses the domain boundaries where the surface continuing outside the
+        # domain is unknown to the mask, only compare away from the boundaries
+        self.inner = np.zeros(N, dtype=bool)
+        self.inner[5:-5, 5:-5, 5:-5] = True
+
+    def test_distance(self):
+
+        dist = self.fields["dist"]
+        exact = self.exact["dist"]
+        h = max(DXYZ)
+
+        inband = (abs(exact) < 3.5 * h) & self.inner
+        self.assertTrue(np.all(abs(dist[inband] - exact[inband]) <= h / 2))
+        self.assertTrue(np.all(dist[abs(exact) > 4.5 * h] ** 2 == (4 * h) ** 2))
+
+        # The sign always follows the mask
+        self.assertTrue(np.all((dist < 0) == (self.ibm == 0)))
+
+    def test_direction(self):
+
+        exact = np.stack([self.exact[name] for name in distance.FIELDS[1:]])
+        direction = np.stack([self.fields[name] for name in distance.FIELDS[1:]])
+        dist = abs(self.exact["dist"])
+        h = max(DXYZ)
+
+        inband = (dist > h) & (dist < 3.5 * h) & self.inner
+        norm = np.sqrt((direction**2).sum(axis=0))
+        self.assertTrue(np.allclose(norm[inband], 1.0))
+        self.assertTrue(np.all((direction * exact).sum(axis=0)[inband] > 0.9))
+
+    def test_empty(self):
+
+        mesh_n, mesh_l = mesh()
+        band = distance.narrow_band(mask.ones(mesh_n, dtype="packed"), mesh_n, mesh_l)
+        fields = gather(band.chunks())
+
+        self.assertTrue(np.all(fields["dist"] == band.cap))
+        self.assertTrue(np.all(fields["dir_x"] == 0))
+
+class TestAnisotropic(unittest.TestCase):
+    """Tests the band on a mesh much finer along one axis than the others."""
+
+    def test_half_space(self):
+
+        # hx = hz = 1 and hy = 0.1, solid below y = 6.35
+        mesh_n = [16, 128, 16]
+        mesh_l = [15.0, 12.7, 15.0]
+        ibm = mask.ones(mesh_n, dtype=np.uint8)
+        ibm[:, :64, :] = 0
+
+        band = distance.narrow_band(ibm, mesh_n, mesh_l, band=4)
+        self.assertAlmostEqual(band.cap, 0.4)
+
+        # The distance grows smoothly with y up to the cap, in every column
+        dist = gather(band.chunks(), ibm.shape[1:])["dist"]
+        y = np.linspace(0.0, 12.7, 128)
+        exact = np.minimum(abs(y - 6.35), band.cap) * np.where(y < 6.35, -1, 1)
+        self.assertTrue(np.allclose(dist, exact[None, :, None]))
+
+class TestBodies(unittest.TestCase):
+    """Tests that the fields are only computed around the bodies of the mask."""
+
+    def test_far_apart(self):
+
+        # Two small bodies at either end of a long domain, as the two foils
+        mesh_n = [400, 24, 24]
+        mesh_l = [39.9, 2.3, 2.3]
+        ibm = mask.ones(mesh_n, dtype=np.uint8)
+        ibm[9:15, 9:15, 20:26] = 0
+        ibm[9:15, 8:15, 370:377] = 0
+
+        tracemalloc.start()
+        try:
+            band = distance.narrow_band(ibm, mesh_n, mesh_l, band=4)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        # The fields over the box spanning both bodies would take over 50 bytes per point
+        self.assertLess(peak, 8 * ibm.size)
+        self.assertEqual(sorted(b[1].shape for b in band.blocks), [(16, 16, 16), (16, 17, 17)])
+
+        # Each body gets the same fields as on its own
+        fields = gather(band.chunks(), ibm.shape[1:])
+        for x0, x1 in [(0, 200), (200, 400)]:
+            alone = ibm.copy()
+            alone[:, :, x0:x1] = 1
+            other = gather(distance.narrow_band(alone, mesh_n, mesh_l, band=4).chunks(),
+                           ibm.shape[1:])
+            region = (slice(None), slice(None), slice(400 - x1, 400 - x0))
+            for name, f in fields.items():
+                self.assertTrue(np.array_equal(f[region], other[name][region]))
+
+@unittest.skipUnless(writer.adios2_new_api, "reading back requires the ADIOS2 Stream API")
+class TestWriteFields(unittest.TestCase):
+    """Tests writing the distance fields alongside the mask."""
+
+    def test_write(self):
+
+        ibm = cylinder.gencyl(DXYZ, N, RCYL, ORIGIN, AXIS, dtype=np.uint8)
+        mesh_n, mesh_l = mesh()
+        band = distance.narrow_band(ibm, mesh_n, mesh_l)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "ibm.bp")
+            writer.write_mask(filename, mask.chunks(ibm, 10), N, fields=band.chunks(nk=10))
+
+            self.assertTrue(np.array_equal(read_field(filename, "ep1"), ibm))
+            for name, f in gather(band.chunks()).items():
+                self.assertTrue(np.array_equal(read_field(filename, name), f))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+""" tests/test_distributed.py
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src import distributed
+from src.scene import embed_scene
+from tests.helpers import ellipsoid, read_field
+
+try:
+    from mpi4py import MPI
+except ImportError:
+    MPI = None
+
+class TestDecomposition(unittest.TestCase):
+    """Tests that the rank blocks tile the mesh."""
+
+    def test_split(self):
+
+        for n, parts in [(10, 3), (7, 7), (429, 4)]:
+            ranges = [distributed.split(n, parts, p) for p in range(parts)]
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(sum(c for _, c in ranges), n)
+            for (s0, c0), (s1, _) in zip(ranges[:-1], ranges[1:]):
+                self.assertEqual(s0 + c0, s1)
+            self.assertLessEqual(max(c for _, c in ranges) - min(c for _, c in ranges), 1)
+
+    def test_process_grid(self):
+
+        self.assertEqual(distributed.process_grid(1), [1, 1, 1])
+        self.assertEqual(distributed.process_grid(4), [1, 2, 2])
+        self.assertEqual(distributed.process_grid(6), [1, 3, 2])
+        self.assertEqual(distributed.process_grid(7), [1, 7, 1])
+
+    def test_blocks(self):
+
+        mesh_n = [11, 9, 7]
+        dims = [2, 3, 2]
+
+        cover = np.zeros([7, 9, 11], dtype=int)
+        for rank in range(int(np.prod(dims))):
+            start, count = distributed.local_block(mesh_n, dims, rank)
+            cover[start[0]:start[0] + count[0],
+                  start[1]:start[1] + count[1],
+                  start[2]:start[2] + count[2]] += 1
+
+        self.assertTrue(np.all(cover == 1))
+
+@unittest.skipIf(MPI is None, "requires mpi4py")
+class TestGenerate(unittest.TestCase):
+    """Tests generating a mask through the MPI path."""
+
+    def test_self(self):
+
+        vox = ellipsoid([12, 9, 15], [7.5, 4.5, 6.0], [0.3, -1.0, 2.0])
+        mesh_n = [23, 19, 17]
+        mesh_l = [4.0, 3.0, 5.0]
+        placements = [(vox, [2.1, 1.3, 2.4]), (vox, [2.6, 1.7, 2.9])]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "ibm.bp")
+            distributed.generate(placements, mesh_n, mesh_l, filename, MPI.COMM_SELF, nk=5)
+            ep1 = read_field(filename, "ep1")
+
+        self.assertTrue(np.array_equal(ep1, embed_scene(placements, mesh_n, mesh_l)))
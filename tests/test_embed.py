@@ -0,0 +1,129 @@
+""" tests/test_embed.py
+"""
+
+import unittest
+
+import numpy as np
+
+from src.voxel import BrickVoxels, Voxels
+from src import embed_stl
+from src import grid
+from src import mask
+from src import rasterize
+from tests.helpers import embed_reference, ellipsoid
+
+class TestEmbed(unittest.TestCase):
+    """Tests the vectorized embedding against the point-by-point reference."""
+
+    def test_ellipsoid(self):
+
+        vox = ellipsoid([12, 9, 15], [7.5, 4.5, 6.0], [0.3, -1.0, 2.0])
+        mesh_n = [23, 19, 17]
+        mesh_l = [4.0, 3.0, 5.0]
+        shift = [2.1, 1.3, 2.4]
+
+        ibm = embed_stl.embed(vox, mesh_n, mesh_l, shift)
+        ref = embed_reference(vox, mesh_n, mesh_l, shift)
+
+        self.assertEqual(ibm.dtype, ref.dtype)
+        self.assertTrue(np.array_equal(ibm, ref))
+        self.assertTrue(np.any(ibm == 0.0))
+
+    def test_faces(self):
+        # Grid lines coincide with the voxel faces.
+
+        vox = Voxels(np.ones([10, 10, 10], dtype=np.int8),
+                     np.array([10.0, 10.0, 10.0]),
+                     np.array([0.0, 0.0, 0.0]))
+        mesh_n = [21, 21, 21]
+        mesh_l = [2.0, 2.0, 2.0]
+        shift = [0.5, 0.5, 0.5]
+
+        ibm = embed_stl.embed(vox, mesh_n, mesh_l, shift)
+        ref = embed_reference(vox, mesh_n, mesh_l, shift)
+
+        self.assertTrue(np.array_equal(ibm, ref))
+        self.assertEqual(ibm[0, 0, 0], 0.0)
+        self.assertEqual(ibm[9, 9, 9], 0.0)
+        self.assertEqual(ibm[10, 10, 10], 1.0)
+
+    def test_clipped(self):
+        # The object extends past the domain boundaries.
+
+        vox = ellipsoid([8, 8, 8], [4.0, 4.0, 4.0], [0.0, 0.0, 0.0])
+        mesh_n = [11, 11, 11]
+        mesh_l = [2.0, 2.0, 2.0]
+        shift = [0.1, 1.95, 1.0]
+
+        ibm = embed_stl.embed(vox, mesh_n, mesh_l, shift)
+        ref = embed_reference(vox, mesh_n, mesh_l, shift)
+
+        self.assertTrue(np.array_equal(ibm, ref))
+
+    def test_stretched(self):
+        # The grid lines are refined around the centre of the object in y.
+
+        vox = ellipsoid([12, 9, 15], [7.5, 4.5, 6.0], [0.3, -1.0, 2.0])
+        mesh_n = [23, 19, 17]
+        mesh = grid.Grid.stretched(mesh_n, [4.0, 3.0, 5.0], 0.4)
+        shift = [2.1, 1.4, 2.4]
+
+        ibm = embed_stl.embed(vox, mesh_n, mesh, shift)
+        ref = embed_reference(vox, mesh_n, mesh, shift)
+
+        self.assertTrue(np.array_equal(ibm, ref))
+        self.assertFalse(np.array_equal(ibm, embed_stl.embed(vox, mesh_n, mesh.l, shift)))
+
+class TestEmbedParallel(unittest.TestCase):
+    """Tests that the multi-process embedding is identical to the serial embedding."""
+
+    def test_workers(self):
+
+        vox = ellipsoid([12, 9, 15], [7.5, 4.5, 6.0], [0.3, -1.0, 2.0])
+        mesh_n = [23, 19, 17]
+        mesh_l = [4.0, 3.0, 5.0]
+        shift = [2.1, 1.3, 2.4]
+
+        serial = embed_stl.embed(vox, mesh_n, mesh_l, shift)
+        for workers in [2, 3]:
+            ibm = embed_stl.embed(vox, mesh_n, mesh_l, shift, workers=workers)
+            self.assertEqual(ibm.shape, serial.shape)
+            self.assertEqual(ibm.dtype, serial.dtype)
+            self.assertEqual(ibm.tobytes(), serial.tobytes())
+
+    def test_engines(self):
+        # Rasterized surfaces and brick voxels are also shared out between the workers
+
+        vox = ellipsoid([12, 9, 15], [7.5, 4.5, 6.0], [0.3, -1.0, 2.0])
+        surface = rasterize.Surface(np.array([[[0.0, 0.0, 0.0], [1.5, 0.0, 0.0], [0.0, 1.5, 0.0]],
+                                              [[0.0, 0.0, 0.0], [0.0, 1.5, 0.0], [0.0, 0.0, 1.5]],
+                                              [[0.0, 0.0, 0.0], [0.0, 0.0, 1.5], [1.5, 0.0, 0.0]],
+                                              [[1.5, 0.0, 0.0], [0.0, 0.0, 1.5], [0.0, 1.5, 0.0]]]))
+        mesh_n = [23, 19, 17]
+        mesh_l = [4.0, 3.0, 5.0]
+        shift = [2.1, 1.3, 2.4]
+
+        for obj in [surface, BrickVoxels.from_voxels(vox, brick=4)]:
+            with self.subTest(obj=type(obj).__name__):
+                serial = embed_stl.embed(obj, mesh_n, mesh_l, shift, dtype=np.uint8)
+                ibm = embed_stl.embed(obj, mesh_n, mesh_l, shift, workers=3, dtype=np.uint8)
+                self.assertTrue(np.any(serial == 0))
+                self.assertEqual(ibm.tobytes(), serial.tobytes())
+
+    def test_not_shared(self):
+        # The writes of the forked workers into a private array would be lost
+
+        vox = ellipsoid([12, 9, 15], [7.5, 4.5, 6.0], [0.3, -1.0, 2.0])
+        mesh_n = [23, 19, 17]
+        mesh_l = [4.0, 3.0, 5.0]
+        shift = [2.1, 1.3, 2.4]
+
+        with self.assertRaises(ValueError):
+            embed_stl.embed_into(mask.ones(mesh_n), vox, mesh_n, mesh_l, shift, workers=2)
+
+        # Views of a shared mask, and shared packed masks, are written in place
+        serial = embed_stl.embed(vox, mesh_n, mesh_l, shift, dtype=np.uint8)
+        for ibm, view in [(mask.ones(mesh_n, dtype=np.uint8, shared=True), lambda m: m[:]),
+                          (mask.ones(mesh_n, dtype="packed", shared=True), lambda m: m)]:
+            embed_stl.embed_into(view(ibm), vox, mesh_n, mesh_l, shift, workers=2)
+            self.assertTrue(np.array_equal(np.asarray(ibm), serial))
@@ -0,0 +1,84 @@
+""" tests/test_fraction.py
+"""
+
+import unittest
+
+import numpy as np
+
+from src import fraction
+from src import rasterize
+from src import scene
+from tests.helpers import box_triangles
+
+# Unit grid spacing, the faces of the box lie a quarter cell from the cell faces so that the
+# fractions sampled with 4 sub-points per direction are exact
+MESH_N = [12, 12, 10]
+MESH_L = [11.0, 11.0, 9.0]
+SIZE = [2.5, 3.5, 1.5]
+CENTRE = [5.0, 5.0, 4.0]
+
+def overlap(n, a, b):
+    """Returns the length of the overlap of the cells [i - 1/2, i + 1/2] with [a, b]."""
+
+    i = np.arange(n)
+    return np.clip(np.minimum(i + 0.5, b) - np.maximum(i - 0.5, a), 0, None)
+
+def box_fraction(size, centre):
+    """Returns the exact fluid fraction of the cells of the mesh around a box."""
+
+    f = [overlap(n, c - s / 2, c + s / 2) for n, s, c in zip(MESH_N, size, centre)]
+    return 1 - f[2][:, None, None] * f[1][None, :, None] * f[0][None, None, :]
+
+class TestFraction(unittest.TestCase):
+    """Compares the volume fraction masks of a box against the exact fractions."""
+
+    def setUp(self):
+
+        self.surface = rasterize.Surface(box_triangles([0, 0, 0], SIZE))
+
+    def test_box(self):
+
+        ibm = fraction.embed_scene([(self.surface, CENTRE)], MESH_N, MESH_L, samples=4)
+        exact = box_fraction(SIZE, CENTRE)
+
+        self.assertEqual(ibm.dtype, np.float64)
+        self.assertTrue(np.allclose(ibm, exact))
+        self.assertAlmostEqual((1 - ibm).sum(), np.prod(SIZE))
+
+    def test_interface(self):
+
+        # Away from the surface the fractions are the plain mask
+        ibm = fraction.embed_scene([(self.surface, CENTRE)], MESH_N, MESH_L, samples=4, block=3)
+        plain = scene.embed_scene([(self.surface, CENTRE)], MESH_N, MESH_L)
+        cut = fraction._interface(plain.astype(np.uint8))
+
+        self.assertTrue(np.array_equal(ibm[~cut], plain[~cut]))
+        self.assertTrue(np.all((ibm[cut] > 0) | (plain[cut] == 0)))
+
+    def test_chunks(self):
+
+        placements = [(self.surface, CENTRE), (self.surface, [8.0, 7.25, 4.5])]
+        ibm = fraction.embed_scene(placements, MESH_N, MESH_L)
+
+        k0s = []
+        for k0, chunk in fraction.iter_scene(placements, MESH_N, MESH_L, nk=3):
+            k0s.append(k0)
+            self.assertTrue(np.array_equal(chunk, ibm[k0:k0 + 3]))
+        self.assertEqual(k0s, [0, 3, 6, 9])
+
+    def test_rotation(self):
+
+        # Rotating the box a quarter turn about z swaps its x and y sizes
+        rotation = [[0, -1, 0], [1, 0, 0], [0, 0, 1]]
+        ibm = fraction.embed_scene([(self.surface, CENTRE, rotation)], MESH_N, MESH_L)
+        exact = box_fraction([SIZE[1], SIZE[0], SIZE[2]], CENTRE)
+
+        self.assertTrue(np.allclose(ibm, exact))
+
+    def test_empty(self):
+
+        ibm = fraction.embed_scene([(self.surface, [50.0, 50.0, 50.0])], MESH_N, MESH_L)
+        self.assertTrue(np.all(ibm == 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+""" tests/test_geometry.py
+"""
+
+import unittest
+
+import numpy as np
+
+from src import geometry
+from src.geometry import Box, Cylinder, Foil, Plane, Sphere
+
+MESH_N = [33, 29, 25]
+MESH_L = [4.0, 3.5, 3.0]
+
+def grid(mesh_n, mesh_l):
+    """Returns the x, y and z coordinates of the mesh points as broadcastable [z,y,x] arrays."""
+
+    x, y, z = [np.arange(n) * l / (n - 1) for n, l in zip(mesh_n, mesh_l)]
+    return x[np.newaxis, np.newaxis, :], y[np.newaxis, :, np.newaxis], z[:, np.newaxis, np.newaxis]
+
+def embed_reference(shape, mesh_n, mesh_l):
+    """Evaluates the signed distance at every mesh point."""
+
+    d = shape.sdf(*grid(mesh_n, mesh_l))
+    return np.where(np.broadcast_to(d, np.flip(mesh_n)) <= 0, 0.0, 1.0)
+
+def scene():
+    """Returns a shape tree using every primitive and combination."""
+
+    body = Box([0.5, 0.5, 0.5], [2.2, 1.9, 2.4]) - Sphere([2.2, 1.9, 2.4], 0.8)
+    strut = Cylinder([3.0, 1.2, 1.5], [1, 1, 2], 0.3, length=1.6)
+    foil = Foil("2412", chord=1.2, span=1.0, origin=[2.4, 2.6, 0.3], alpha=10.0)
+    return (body | strut | foil) & Plane([0, 0, 2.0], [0, 0, 1])
+
+class TestPrimitives(unittest.TestCase):
+    """Tests the signed distances of the primitives at known points."""
+
+    def test_sphere(self):
+        s = Sphere([1, 2, 3], 0.5)
+        np.testing.assert_allclose(s.sdf(np.array([1, 1.5, 3]), 2, 3), [-0.5, 0.0, 1.5])
+
+    def test_box(self):
+        b = Box([0, 0, 0], [2, 4, 6])
+        self.assertAlmostEqual(b.sdf(1, 2, 3), -1.0)
+        self.assertAlmostEqual(b.sdf(3, 2, 3), 1.0)
+        self.assertAlmostEqual(b.sdf(5, 8, 3), 5.0)
+
+    def test_cylinder(self):
+        c = Cylinder([0, 0, 0], [0, 0, 2], 1.0, length=4.0)
+        self.assertAlmostEqual(c.sdf(0, 0, 0), -1.0)
+        self.assertAlmostEqual(c.sdf(3, 0, 0), 2.0)
+        self.assertAlmostEqual(c.sdf(0, 0, 3), 1.0)
+        self.assertAlmostEqual(Cylinder([0, 0, 0], [1, 0, 0], 1.0).sdf(1e6, 0, 0.5), -0.5)
+
+        lo, hi = Cylinder([0, 0, 0], [1, 1, 0], 1.0, length=2.0).bounding_box()
+        np.testing.assert_allclose(hi, [np.sqrt(0.5) * 2, np.sqrt(0.5) * 2, 1.0])
+        np.testing.assert_allclose(lo, -hi)
+
+    def test_plane(self):
+        p = Plane([0, 0, 1], [0, 0, 2])
+        self.assertAlmostEqual(p.sdf(5, 5, 3), 2.0)
+        self.assertAlmostEqual(p.sdf(5, 5, -1), -2.0)
+        np.testing.assert_array_equal(p.bounding_box()[1], [np.inf, np.inf, 1])
+
+    def test_foil(self):
+        section = geometry.naca4("0012")
+        self.assertAlmostEqual(section[:, 1].max() - section[:, 1].min(), 0.12, places=3)
+
+        f = Foil("0012", chord=10.0, span=20.0)
+        self.assertLess(f.sdf(3.0, 0.0, 10.0), -0.5)
+        self.assertGreater(f.sdf(3.0, 0.7, 10.0), 0.0)
+        self.assertAlmostEqual(f.sdf(3.0, 0.0, 21.0), 1.0)
+        np.testing.assert_allclose(f.bounding_box()[0], [0, -0.6, 0], atol=1e-3)
+        np.testing.assert_allclose(f.bounding_box()[1], [10, 0.6, 20], atol=1e-3)
+
+    def test_polygon(self):
+        square = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=float)
+        d = geometry.polygon_sdf(square, np.array([0.5, 2.0, 0.25]), np.array([0.5, 0.5, 0.5]))
+        np.testing.assert_allclose(d, [-0.5, 1.0, -0.25])
+
+class TestCSG(unittest.TestCase):
+    """Tests combining shapes."""
+
+    def test_combinations(self):
+        a = Sphere([0, 0, 0], 1.0)
+        b = Sphere([1, 0, 0], 1.0)
+
+        self.assertLess((a | b).sdf(1.5, 0, 0), 0)
+        self.assertGreater((a & b).sdf(-0.5, 0, 0), 0)
+        self.assertLess((a & b).sdf(0.5, 0, 0), 0)
+        self.assertGreater((a - b).sdf(0.5, 0, 0), 0)
+        self.assertLess((a - b).sdf(-0.5, 0, 0), 0)
+
+    def test_abstract(self):
+        # A shape without a bounding box cannot be created
+
+        class Ball(geometry.Shape):
+            def sdf(self, x, y, z):
+                return np.sqrt(x**2 + y**2 + z**2) - 1.0
+
+        with self.assertRaises(TypeError):
+            Ball()
+
+    def test_clip(self):
+        a = Sphere([0, 0, 0], 1.0)
+        b = Sphere([5, 0, 0], 1.0)
+
+        self.assertIs((a | b).clip([4, -1, -1], [6, 1, 1]), b)
+        self.assertIsNone((a & b).clip([4, -1, -1], [6, 1, 1]))
+        self.assertIs((a - b).clip([-1, -1, -1], [1, 1, 1]), a)
+
+class TestEmbed(unittest.TestCase):
+    """Compares the block-wise mask against evaluating every point."""
+
+    def test_scene(self):
+        ref = embed_reference(scene(), MESH_N, MESH_L)
+        self.assertTrue(np.any(ref == 0))
+
+        for block in [1, 4, 7, 64]:
+            with self.subTest(block=block):
+                ibm = geometry.embed(scene(), MESH_N, MESH_L, block=block)
+                np.testing.assert_array_equal(ibm, ref)
+
+    def test_block(self):
+        ref = embed_reference(scene(), MESH_N, MESH_L)
+
+        start = [3, 5, 7]
+        ibm = np.ones([15, 12, 20])
+        geometry.embed_into(ibm, scene(), MESH_N, MESH_L, start=start, block=4)
+
+        np.testing.assert_array_equal(ibm, ref[3:18, 5:17, 7:27])
+
+    def test_dtype(self):
+        ref = embed_reference(scene(), MESH_N, MESH_L)
+
+        for dtype in [np.uint8, "packed"]:
+            with self.subTest(dtype=dtype):
+                ibm = geometry.embed(scene(), MESH_N, MESH_L, dtype=dtype, block=5)
+                np.testing.assert_array_equal(np.asarray(ibm, dtype=np.float64), ref)
+
+    def test_outside(self):
+        ibm = geometry.embed(Sphere([10, 10, 10], 1.0), MESH_N, MESH_L)
+        self.assertTrue(np.all(ibm == 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+""" tests/test_grid.py
+"""
+
+import unittest
+
+import numpy as np
+
+from src import grid
+
+class TestStretching(unittest.TestCase):
+    """Tests the x3d2 stretching of the grid lines."""
+
+    def test_uniform(self):
+
+        self.assertTrue(np.allclose(grid.stretching(11, 2.0, 1.0, istret=0),
+                                    np.linspace(0, 2.0, 11)))
+        self.assertTrue(np.allclose(grid.stretching(10, 2.0, 1.0, istret=0, periodic=True),
+                                    np.arange(10) * 0.2))
+        # the mesh becomes uniform as beta grows
+        self.assertTrue(np.allclose(grid.stretching(11, 2.0, 1e6), np.linspace(0, 2.0, 11),
+                                    atol=1e-4))
+
+    def test_refinement(self):
+
+        for istret, finest in [(1, "centre"), (2, "ends"), (3, "start")]:
+            with self.subTest(istret=istret):
+                y = grid.stretching(65, 4.0, 0.3, istret)
+                dy = np.diff(y)
+
+                self.assertEqual(y[0], 0.0)
+                self.assertAlmostEqual(y[-1], 4.0, places=12)
+                self.assertTrue(np.all(dy > 0))
+
+                smallest = np.argmin(dy)
+                if finest == "centre":
+                    self.assertIn(smallest, (31, 32))
+                elif finest == "ends":
+                    self.assertIn(smallest, (0, 63))
+                    self.assertAlmostEqual(dy[0], dy[-1])
+                else:
+                    self.assertEqual(smallest, 0)
+                    self.assertGreater(dy[-1], dy[0])
+
+    def test_periodic(self):
+
+        y = grid.stretching(64, 4.0, 0.3, periodic=True)
+        self.assertEqual(len(y), 64)
+        self.assertEqual(y[0], 0.0)
+        self.assertLess(y[-1], 4.0)
+        self.assertTrue(np.all(np.diff(y) > 0))
+
+    def test_invalid(self):
+
+        with self.assertRaises(ValueError):
+            grid.stretching(11, 1.0, 0.3, istret=4)
+        with self.assertRaises(ValueError):
+            grid.stretching(11, 1.0, 0.0)
+
+class TestGrid(unittest.TestCase):
+    """Tests the mesh description shared by the embedders."""
+
+    def test_coordinates(self):
+
+        mesh = grid.Grid.stretched([5, 9, 3], [1.0, 2.0, 3.0], 0.5)
+        self.assertEqual(mesh.n, [5, 9, 3])
+        self.assertTrue(np.allclose(mesh.l, [1.0, 2.0, 3.0]))
+        self.assertTrue(np.allclose(grid.centre(mesh), [0.5, 1.0, 1.5]))
+        self.assertIs(grid.coordinates([5, 9, 3], mesh), mesh.coords)
+
+        spacing = grid.spacing([5, 9, 3], mesh)
+        self.assertAlmostEqual(spacing[0], 0.25)
+        self.assertLess(spacing[1], 0.25)
+        self.assertEqual(list(grid.spacing([5, 9, 3], [1.0, 2.0, 3.0])), [0.25, 0.25, 1.5])
+
+        with self.assertRaises(ValueError):
+            grid.coordinates([5, 9, 4], mesh)
+        with self.assertRaises(ValueError):
+            grid.Grid([0, 1], [0, 1, 1], [0])
+
+    def test_box_range(self):
+
+        coords = [np.array([0.0, 0.1, 0.3, 0.7, 1.0])] * 3
+        n0, nn = grid.box_range([0.1, 0.2, -1.0], [0.7, 0.65, 2.0], coords)
+        self.assertEqual(list(n0), [1, 2, 0])
+        self.assertEqual(list(nn), [4, 3, 5])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+""" tests/test_incremental.py
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import distance
+from src import incremental
+from src import mask
+from src import writer
+from src.scene import embed_scene
+from tests.helpers import ellipsoid, rotation_z
+
+class TestReembed(unittest.TestCase):
+    """Tests updating a mask when an object moves."""
+
+    def setUp(self):
+
+        self.vox = ellipsoid([6, 8, 16], [4.0, 4.0, 4.0], [0.0, 0.0, 0.0])
+        self.mesh_n = [81, 21, 13]
+        self.mesh_l = [20.0, 5.0, 3.0]
+        self.old = [(self.vox, [2.0, 2.0, 1.5]), (self.vox, [5.0, 2.6, 1.5])]
+
+    def check(self, new, nblocks):
+
+        ibm = embed_scene(self.old, self.mesh_n, self.mesh_l, dtype=np.uint8)
+        blocks = incremental.reembed(self.old, new, self.mesh_n, self.mesh_l)
+        incremental.apply(ibm, blocks)
+
+        self.assertEqual(len(blocks), nblocks)
+        self.assertTrue(np.array_equal(ibm, embed_scene(new, self.mesh_n, self.mesh_l)))
+
+        return blocks
+
+    def test_overlap(self):
+
+        # The moved object overlaps the fixed one before and after the move
+        self.check([self.old[0], (self.vox, [3.4, 2.4, 1.5])], 1)
+
+    def test_far(self):
+
+        blocks = self.check([self.old[0], (self.vox, [15.0, 2.6, 1.5], rotation_z(0.3))], 2)
+        self.assertLess(sum(b.size for _, b in blocks), np.prod(self.mesh_n) // 2)
+
+    def test_unchanged(self):
+
+        new = [(self.vox, [2.0, 2.0, 1.5]), (self.vox, np.array([5.0, 2.6, 1.5]))]
+        self.assertEqual(incremental.changed_ranges(self.old, new, self.mesh_n, self.mesh_l), [])
+
+    def test_scaled(self):
+
+        # Only the scale of the second object changes
+        self.check([self.old[0], (self.vox, [5.0, 2.6, 1.5], None, 1.3)], 1)
+
+    def test_removed(self):
+
+        self.check(self.old[:1], 1)
+
+@unittest.skipUnless(writer.adios2_new_api, "reading back requires the ADIOS2 Stream API")
+class TestFiles(unittest.TestCase):
+    """Tests writing deltas and patching mask files."""
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, "ibm.bp")
+
+        vox = ellipsoid([6, 8, 16], [4.0, 4.0, 4.0], [0.0, 0.0, 0.0])
+        self.mesh_n = [41, 21, 13]
+        self.mesh_l = [10.0, 5.0, 3.0]
+        self.old = [(vox, [2.0, 2.0, 1.5]), (vox, [5.0, 2.6, 1.5])]
+        self.new = [(vox, [2.0, 2.0, 1.5]), (vox, [7.5, 2.2, 1.6])]
+
+        self.ibm = embed_scene(self.old, self.mesh_n, self.mesh_l, dtype=np.uint8)
+        self.ref = embed_scene(self.new, self.mesh_n, self.mesh_l)
+        self.blocks = incremental.reembed(self.old, self.new, self.mesh_n, self.mesh_l,
+                                          dtype="packed")
+
+    def tearDown(self):
+
+        self.tmp.cleanup()
+
+    def test_delta(self):
+
+        for encoding in writer.ENCODINGS:
+            with self.subTest(encoding=encoding):
+                incremental.write_delta(self.filename, self.blocks, self.ibm.shape, encoding)
+
+                ibm = incremental.apply_delta(self.ibm.copy(), self.filename)
+                self.assertTrue(np.array_equal(ibm, self.ref))
+
+    def test_patch(self):
+
+        writer.write_mask(self.filename, mask.chunks(self.ibm), self.ibm.shape, iibm=2)
+        incremental.patch_file(self.filename, self.blocks, nk=4)
+
+        self.assertTrue(np.array_equal(writer.read_mask(self.filename), self.ref))
+        self.assertEqual(writer.read_mask(self.filename, "iibm"), 2)
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["ibm.bp"])
+
+    def test_patch_failed(self):
+        # A failed rewrite leaves the original file in place and no partial patched file
+
+        writer.write_mask(self.filename, mask.chunks(self.ibm), self.ibm.shape)
+        with mock.patch.object(writer.MaskWriter, "write_block", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                incremental.patch_file(self.filename, self.blocks, nk=4)
+
+        self.assertTrue(np.array_equal(writer.read_mask(self.filename), self.ibm))
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["ibm.bp"])
+
+    def test_patch_fields(self):
+
+        band = distance.narrow_band(self.ibm, self.mesh_n, self.mesh_l)
+        writer.write_mask(self.filename, mask.chunks(self.ibm), self.ibm.shape,
+                          fields=band.chunks())
+
+        with self.assertRaises(ValueError):
+            incremental.patch_file(self.filename, self.blocks)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+""" tests/test_inspect_mask.py
+"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src import cli
+from src import inspect_mask
+from src import mask
+from src import writer
+from tests.helpers import bodies, flood_fill
+
+@unittest.skipUnless(writer.adios2_new_api, "reading back requires the ADIOS2 Stream API")
+class TestInspect(unittest.TestCase):
+    """Tests summarising and comparing mask files read in z-chunks."""
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ibm = bodies()
+
+    def tearDown(self):
+
+        self.tmp.cleanup()
+
+    def write(self, name, ibm):
+
+        filename = os.path.join(self.tmp.name, name)
+        writer.write_mask(filename, mask.chunks(ibm, nk=5), ibm.shape)
+
+        return filename
+
+    def test_inspect(self):
+
+        filename = self.write("ibm.bp", self.ibm)
+        for nk in [None, 1, 4]:
+            with self.subTest(nk=nk):
+                summary = inspect_mask.inspect(filename, nk=nk)
+                self.assertEqual(summary["shape"], [12, 10, 16])
+                self.assertEqual(summary["solid"], np.count_nonzero(self.ibm == 0))
+                self.assertAlmostEqual(summary["fraction"], np.mean(self.ibm == 0))
+                self.assertEqual(summary["invalid"], 0)
+                self.assertEqual(summary["bodies"], flood_fill(self.ibm == 0))
+
+    def test_invalid(self):
+
+        ibm = self.ibm.copy()
+        ibm[7, 2, 3] = 0.5
+        ibm[9, 0, 0] = 2.0
+        ibm[10, 0, 0] = np.nan
+
+        summary = inspect_mask.inspect(self.write("ibm.bp", ibm), nk=3, bodies=False)
+        self.assertEqual(summary["invalid"], 3)
+        self.assertEqual(summary["first"], [7, 2, 3])
+        self.assertEqual(summary["values"][:2], [0.5, 2.0])
+        self.assertTrue(np.isnan(summary["values"][2]))
+        self.assertNotIn("bodies", summary)
+
+    def test_sparse(self):
+
+        filename = os.path.join(self.tmp.name, "sparse.bp")
+        blocks = [([1, 1, 1], self.ibm[1:9, 1:6, 1:6]), ([2, 7, 8], self.ibm[2:10, 7:8, 8:14])]
+        for encoding in writer.ENCODINGS:
+            with self.subTest(encoding=encoding):
+                writer.write_sparse_mask(filename, blocks, self.ibm.shape, encoding=encoding)
+                chunks = list(inspect_mask.iter_chunks(filename, nk=5))
+                self.assertEqual([k0 for k0, _ in chunks], [0, 5, 10])
+                self.assertTrue(np.array_equal(np.concatenate([c for _, c in chunks]), self.ibm))
+
+    def test_diff(self):
+
+        other = self.ibm.copy()
+        other[0, 0, 0:4] = 0
+        other[2, 7, 10] = 0
+        other[11, 9, 15] = 0.999
+
+        a, b = self.write("a.bp", self.ibm), self.write("b.bp", other)
+        result = inspect_mask.diff(a, b, nk=4)
+        self.assertEqual(result["different"], 6)
+        self.assertEqual(result["solid_a"], 0)
+        self.assertEqual(result["solid_b"], 5)
+        self.assertEqual(result["regions"], [([0, 0, 0], [1, 1, 4], 4),
+                                             ([2, 7, 10], [3, 8, 11], 1),
+                                             ([11, 9, 15], [12, 10, 16], 1)])
+
+        self.assertEqual(inspect_mask.diff(a, b, atol=0.01)["different"], 5)
+        self.assertEqual(inspect_mask.diff(a, a)["different"], 0)
+
+        with self.assertRaises(ValueError):
+            inspect_mask.diff(a, self.write("c.bp", self.ibm[:, :, :8]))
+
+    def test_cli(self):
+
+        a = self.write("a.bp", self.ibm)
+        other = self.ibm.copy()
+        other[3, 3, 3] = 0.5
+        b = self.write("b.bp", other)
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(cli.main(["inspect", a, "--json"]), 0)
+        self.assertEqual(len(json.loads(out.getvalue())["bodies"]), 2)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(cli.main(["inspect", b, "--chunk", "2"]), 1)
+            self.assertEqual(cli.main(["diff", a, a]), 0)
+            self.assertEqual(cli.main(["diff", a, b, "--max-regions", "1"]), 1)
+
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit) as cm:
+                cli.main(["inspect", os.path.join(self.tmp.name, "missing.bp")])
+            self.assertEqual(cm.exception.code, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+""" tests/test_instrument.py
+"""
+
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from src import embed_stl
+from src import instrument
+from src import scene
+from src import writer
+from tests.helpers import ellipsoid
+
+class TestStages(unittest.TestCase):
+    """Tests recording the stages of a run."""
+
+    def test_inactive(self):
+
+        self.assertIsNone(instrument.active())
+        with instrument.stage("embed", points=10) as s:
+            s.add_points(5)
+
+    def test_nested(self):
+
+        with instrument.Report() as report:
+            self.assertIs(instrument.active(), report)
+            for _ in range(2):
+                with instrument.stage("outer", points=3):
+                    with instrument.stage("inner") as s:
+                        time.sleep(0.02)
+                        s.add_points(4)
+        self.assertIsNone(instrument.active())
+
+        outer = report.stages["outer"]
+        inner = report.stages["inner"]
+        self.assertEqual((outer.calls, outer.points), (2, 6))
+        self.assertEqual((inner.calls, inner.points), (2, 8))
+
+        # The time of the inner stage is excluded from the outer stage
+        self.assertGreaterEqual(inner.wall, 0.04)
+        self.assertLess(outer.wall, 0.02)
+        self.assertLessEqual(inner.wall + outer.wall, report.wall)
+
+    def test_rss(self):
+
+        with instrument.Report() as report:
+            with instrument.stage("outer"):
+                with instrument.stage("allocate"):
+                    data = np.ones(64 * 1024**2 // 8)
+                with instrument.stage("inner"):
+                    pass
+            del data
+
+        # The increase is measured from each stage's entry, not the peak of the process
+        self.assertGreater(report.stages["allocate"].rss_increase, 60)
+        self.assertGreater(report.stages["outer"].rss_increase, 60)
+        self.assertLess(report.stages["inner"].rss_increase, 30)
+        self.assertGreater(report.rss_increase, 60)
+        self.assertGreater(instrument.current_rss(), 0)
+
+    def test_scene(self):
+
+        vox = ellipsoid([8, 8, 8], [4.0, 4.0, 4.0], [-1.0, -1.0, -1.0])
+        mesh_n = [21, 17, 13]
+        mesh_l = [5.0, 4.0, 3.0]
+        placements = [(vox, [1.5, 2.0, 1.5]), (vox, [3.5, 2.0, 1.5])]
+
+        with instrument.Report(mesh_n=mesh_n) as report:
+            chunks = scene.iter_scene(placements, mesh_n, mesh_l, nk=4, dtype=np.uint8)
+            if writer.adios2_new_api:
+                with tempfile.TemporaryDirectory() as tmp:
+                    writer.write_mask(os.path.join(tmp, "ibm.bp"), chunks, np.flip(mesh_n))
+            else:
+                list(chunks)
+
+        self.assertEqual(report.stages["embed body 0"].calls, 4)
+        n0, nn = embed_stl.working_range(vox, mesh_n, mesh_l, placements[0][1])
+        self.assertEqual(report.stages["embed body 0"].points, np.prod(nn - n0))
+        self.assertIn("embed body 1", report.stages)
+        if writer.adios2_new_api:
+            self.assertEqual(report.stages["write"].points, np.prod(mesh_n))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, "report.json")
+            report.write(filename)
+            with open(filename) as fh:
+                data = json.load(fh)
+
+        self.assertEqual(data["meta"], {"mesh_n": mesh_n})
+        names = [s["name"] for s in data["stages"]]
+        self.assertIn("embed body 0", names)
+        self.assertIn("bounds", names)
+
+class TestProgress(unittest.TestCase):
+
+    def test_progress(self):
+
+        out = io.StringIO()
+        with instrument.Report():
+            progress = instrument.Progress(4, "Chunks", interval=0, stream=out)
+            for _ in range(4):
+                progress.update()
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[-1].startswith("Chunks: 4/4 (100.0%)"))
+
+    def test_quiet(self):
+
+        out = io.StringIO()
+        progress = instrument.Progress(4, "Chunks", interval=0, stream=out)
+        progress.update()
+
+        with instrument.Report(progress=False):
+            progress = instrument.Progress(4, "Chunks", interval=0, stream=out)
+            progress.update()
+
+        self.assertEqual(out.getvalue(), "")
+
+if __name__ == "__main__":
+    unittest.main()
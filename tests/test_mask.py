@@ -0,0 +1,75 @@
+""" tests/test_mask.py
+"""
+
+import unittest
+
+import numpy as np
+
+from src import embed_stl
+from src import mask
+from src.mask import PackedMask
+from src.scene import embed_scene
+from tests.helpers import ellipsoid
+
+class TestPackedMask(unittest.TestCase):
+    """Tests that the bit-packed mask behaves like a dense array."""
+
+    def test_index(self):
+
+        rng = np.random.default_rng(1)
+        dense = np.ones([5, 7, 13], dtype=np.uint8)
+        packed = mask.ones([13, 7, 5], dtype="packed")
+
+        self.assertEqual(packed.shape, dense.shape)
+        self.assertEqual(packed.bits.shape, (5, 7, 2))
+
+        for _ in range(20):
+            k = rng.integers(0, 5)
+            j0, j1 = np.sort(rng.integers(0, 8, 2))
+            i0, i1 = np.sort(rng.integers(0, 14, 2))
+            value = rng.integers(0, 2, [j1 - j0, i1 - i0])
+
+            dense[k, j0:j1, i0:i1] = value
+            packed[k, j0:j1, i0:i1] = value
+
+            self.assertTrue(np.array_equal(packed[k], dense[k]))
+
+        self.assertTrue(np.array_equal(np.asarray(packed), dense))
+        self.assertTrue(np.array_equal(packed[1:3, 2], dense[1:3, 2]))
+
+class TestDtype(unittest.TestCase):
+    """Tests embedding into compact masks."""
+
+    def setUp(self):
+
+        self.vox = ellipsoid([12, 9, 15], [7.5, 4.5, 6.0], [0.3, -1.0, 2.0])
+        self.mesh_n = [23, 19, 17]
+        self.mesh_l = [4.0, 3.0, 5.0]
+        self.shift = [2.1, 1.3, 2.4]
+        self.ref = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, self.shift)
+
+    def test_embed(self):
+
+        for dtype in [np.uint8, np.bool_, "packed"]:
+            ibm = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, self.shift, dtype=dtype)
+            self.assertTrue(np.array_equal(np.asarray(ibm, dtype=np.float64), self.ref))
+
+    def test_workers(self):
+
+        for dtype in [np.uint8, "packed"]:
+            ibm = embed_scene([(self.vox, self.shift)], self.mesh_n, self.mesh_l, workers=2,
+                              dtype=dtype)
+            self.assertTrue(np.array_equal(np.asarray(ibm, dtype=np.float64), self.ref))
+
+    def test_chunks(self):
+
+        ibm = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, self.shift, dtype="packed")
+
+        k = 0
+        for k0, chunk in mask.chunks(ibm, 4):
+            self.assertEqual(k0, k)
+            self.assertEqual(chunk.dtype, np.float64)
+            self.assertTrue(chunk.flags.c_contiguous)
+            self.assertTrue(np.array_equal(chunk, self.ref[k0:k0 + 4]))
+            k += chunk.shape[0]
+        self.assertEqual(k, self.ref.shape[0])
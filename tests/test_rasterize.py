@@ -0,0 +1,129 @@
+""" tests/test_rasterize.py
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src import convert_stl
+from src import embed_stl
+from src import rasterize
+from tests.helpers import box_triangles, write_stl
+
+def octahedron(r):
+    """Returns the 8 triangles of the octahedron |x| + |y| + |z| = r."""
+
+    tris = []
+    for sx in (-1, 1):
+        for sy in (-1, 1):
+            for sz in (-1, 1):
+                tris.append([[sx * r, 0, 0], [0, sy * r, 0], [0, 0, sz * r]])
+
+    return np.array(tris, dtype=float)
+
+def grid(mesh_n, mesh_l):
+    """Returns the [z,y,x] ordered coordinate arrays of the mesh points."""
+
+    x, y, z = [np.arange(n) * l / (n - 1) for n, l in zip(mesh_n, mesh_l)]
+    return np.meshgrid(z, y, x, indexing="ij")[::-1]
+
+def rasterize_mesh(surface, mesh_n, mesh_l, shift, rotation=None, nk=None):
+    ibm = np.ones(np.flip(mesh_n))
+    rasterize.embed_into(ibm, surface, mesh_n, mesh_l, shift, rotation, nk=nk)
+    return ibm
+
+class TestRasterize(unittest.TestCase):
+    """Compares the rasterized masks against analytic inside tests."""
+
+    def test_box(self):
+        mesh_n = [21, 31, 41]
+        mesh_l = [4.0, 6.0, 8.0]
+        shift = [2.03, 3.07, 4.11]
+        surface = rasterize.Surface(box_triangles([0, 0, 0], [1, 2, 3]))
+
+        ibm = rasterize_mesh(surface, mesh_n, mesh_l, shift)
+
+        x, y, z = grid(mesh_n, mesh_l)
+        inside = ((abs(x - shift[0]) < 0.5) & (abs(y - shift[1]) < 1.0)
+                  & (abs(z - shift[2]) < 1.5))
+        np.testing.assert_array_equal(ibm, np.where(inside, 0.0, 1.0))
+
+    def test_grid_aligned(self):
+        # The vertices and edges of the octahedron lie on grid lines so that rows pass exactly
+        # through shared edges and vertices, each must be counted once to keep the parity right.
+        mesh_n = [17, 17, 17]
+        mesh_l = [4.0, 4.0, 4.0]
+        shift = [2.0, 2.0, 2.0]
+        surface = rasterize.Surface(octahedron(1.5))
+
+        ibm = rasterize_mesh(surface, mesh_n, mesh_l, shift, nk=3)
+
+        x, y, z = grid(mesh_n, mesh_l)
+        dist = abs(x - 2.0) + abs(y - 2.0) + abs(z - 2.0)
+        off_surface = abs(dist - 1.5) > 1e-9
+        self.assertTrue(np.all(ibm[off_surface & (dist < 1.5)] == 0))
+        self.assertTrue(np.all(ibm[off_surface & (dist > 1.5)] == 1))
+
+    def test_rotation(self):
+        mesh_n = [33, 33, 33]
+        mesh_l = [4.0, 4.0, 4.0]
+        shift = [2.01, 1.97, 2.03]
+        a = np.pi / 5
+        rotation = np.array([[np.cos(a), -np.sin(a), 0.0],
+                             [np.sin(a), np.cos(a), 0.0],
+                             [0.0, 0.0, 1.0]])
+        surface = rasterize.Surface(box_triangles([0, 0, 0], [2.0, 1.0, 1.5]))
+
+        ibm = rasterize_mesh(surface, mesh_n, mesh_l, shift, rotation)
+
+        x, y, z = grid(mesh_n, mesh_l)
+        rel = np.stack([x - shift[0], y - shift[1], z - shift[2]], axis=-1) @ rotation
+        inside = ((abs(rel[..., 0]) < 1.0) & (abs(rel[..., 1]) < 0.5)
+                  & (abs(rel[..., 2]) < 0.75))
+        np.testing.assert_array_equal(ibm, np.where(inside, 0.0, 1.0))
+
+    def test_block(self):
+        mesh_n = [17, 17, 17]
+        mesh_l = [4.0, 4.0, 4.0]
+        shift = [2.0, 2.0, 2.0]
+        surface = rasterize.Surface(octahedron(1.5))
+
+        full = rasterize_mesh(surface, mesh_n, mesh_l, shift)
+
+        start = [5, 3, 8]
+        count = [9, 10, 7]
+        block = np.ones(count)
+        rasterize.embed_into(block, surface, mesh_n, mesh_l, shift, start=start)
+
+        np.testing.assert_array_equal(block, full[5:14, 3:13, 8:15])
+
+class TestRasterEngine(unittest.TestCase):
+    """Tests selecting the raster engine through convert and embed."""
+
+    def test_convert(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            stl_file = os.path.join(tmp, "box.stl")
+            write_stl(stl_file, box_triangles([1, 2, 3], [2, 4, 6]))
+
+            surface = convert_stl.convert(stl_file, engine="raster")
+
+        self.assertIsInstance(surface, rasterize.Surface)
+        np.testing.assert_allclose(surface.bounding_box(), [[1, 2, 3], [2, 4, 6]])
+
+        with self.assertRaises(ValueError):
+            convert_stl.convert(stl_file, engine="unknown")
+
+    def test_embed(self):
+        mesh_n = [21, 31, 41]
+        mesh_l = [4.0, 6.0, 8.0]
+        shift = [2.03, 3.07, 4.11]
+        surface = rasterize.Surface(box_triangles([0, 0, 0], [1, 2, 3]))
+
+        ibm = embed_stl.embed(surface, mesh_n, mesh_l, shift)
+
+        np.testing.assert_array_equal(ibm, rasterize_mesh(surface, mesh_n, mesh_l, shift))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+""" tests/test_regions.py
+"""
+
+import unittest
+
+import numpy as np
+
+from src import regions
+from tests.helpers import bodies, flood_fill
+
+class TestRegions(unittest.TestCase):
+    """Tests the connected components found chunk by chunk against a flood fill."""
+
+    def check(self, solid):
+
+        ref = flood_fill(solid)
+        for nk in [1, 2, 5, len(solid)]:
+            with self.subTest(nk=nk):
+                found = regions.Regions()
+                for k0 in range(0, len(solid), nk):
+                    found.add(k0, solid[k0:k0 + nk])
+                self.assertEqual(found.regions(), ref)
+
+    def test_bodies(self):
+
+        solid = bodies() == 0
+        self.check(solid)
+        self.assertEqual(len(flood_fill(solid)), 2)
+
+    def test_random(self):
+
+        rng = np.random.default_rng(3)
+        for _ in range(10):
+            self.check(rng.random(rng.integers(1, 10, 3)) < 0.4)
+
+if __name__ == "__main__":
+    unittest.main()
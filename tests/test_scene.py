@@ -0,0 +1,197 @@
+""" tests/test_scene.py
+"""
+
+import unittest
+
+import numpy as np
+
+from src import embed_stl
+from src import rasterize
+from src.scene import Placement, embed_blocks, embed_scene
+from tests.helpers import box_triangles, ellipsoid, rotation_z
+
+def embed_rotated_reference(voxels, mesh_n, mesh_l, shift, rotation):
+    """Point-by-point embedding of a rotated, and possibly scaled, object over the whole mesh."""
+
+    nx, ny, nz = mesh_n
+    dxyz = np.array([l / (n - 1) for n, l in zip(mesh_n, mesh_l)])
+
+    bbox_min, bbox_max = voxels.bounding_box()
+    centre = (bbox_min + bbox_max) / 2.0
+
+    ibm = np.ones([nz, ny, nx], dtype=np.float64)
+    for k in range(nz):
+        for j in range(ny):
+            for i in range(nx):
+                x_rel = np.array([i, j, k]) * dxyz - shift
+                if np.allclose(rotation @ rotation.T, np.eye(3)):
+                    x_local = rotation.T @ x_rel + centre
+                else:
+                    x_local = np.linalg.solve(rotation, x_rel) + centre
+                try:
+                    solid = voxels.query(x_local) > 0
+                except IndexError:
+                    # The scalar query indexes past the voxel array, these points are outside
+                    solid = False
+                if solid:
+                    ibm[k, j, i] = 0.0
+
+    return ibm
+
+class TestScene(unittest.TestCase):
+    """Tests embedding several placed objects into one mask."""
+
+    def setUp(self):
+
+        self.vox = ellipsoid([6, 8, 16], [4.0, 4.0, 4.0], [0.0, 0.0, 0.0])
+        self.mesh_n = [25, 21, 13]
+        self.mesh_l = [6.0, 5.0, 3.0]
+
+    def test_and(self):
+
+        shifts = [[2.0, 2.0, 1.5], [3.5, 2.6, 1.5]]
+
+        ibm = embed_scene([(self.vox, s) for s in shifts], self.mesh_n, self.mesh_l)
+        ibm1 = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, shifts[0])
+        ibm2 = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, shifts[1])
+
+        self.assertTrue(np.array_equal(ibm, ibm1 * ibm2))
+
+    def test_identity(self):
+
+        shift = [3.0, 2.5, 1.5]
+
+        ibm = embed_scene([Placement(self.vox, shift, np.eye(3))], self.mesh_n, self.mesh_l)
+        ref = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, shift)
+
+        self.assertTrue(np.array_equal(ibm, ref))
+
+    def test_rotation(self):
+
+        shift = np.array([3.1, 2.45, 1.4])
+        rotation = rotation_z(np.pi / 3)
+
+        ibm = embed_scene([(self.vox, shift, rotation)], self.mesh_n, self.mesh_l)
+        ref = embed_rotated_reference(self.vox, self.mesh_n, self.mesh_l, shift, rotation)
+
+        self.assertTrue(np.array_equal(ibm, ref))
+        self.assertTrue(np.any(ibm == 0.0))
+
+    def test_workers(self):
+
+        placements = [(self.vox, [2.0, 2.0, 1.5]), (self.vox, [3.5, 2.6, 1.5], rotation_z(0.4))]
+
+        serial = embed_scene(placements, self.mesh_n, self.mesh_l)
+        ibm = embed_scene(placements, self.mesh_n, self.mesh_l, workers=2)
+
+        self.assertEqual(ibm.tobytes(), serial.tobytes())
+
+class TestAffine(unittest.TestCase):
+    """Tests placing objects with Euler angles and scaling."""
+
+    def setUp(self):
+
+        self.vox = ellipsoid([6, 8, 16], [4.0, 4.0, 4.0], [0.0, 0.0, 0.0])
+        self.mesh_n = [25, 21, 13]
+        self.mesh_l = [6.0, 5.0, 3.0]
+
+    def test_euler(self):
+
+        self.assertTrue(np.allclose(embed_stl.euler([0, 0, 30]), rotation_z(np.pi / 6)))
+        self.assertTrue(np.allclose(embed_stl.euler([90, 0, 0]) @ [0, 1, 0], [0, 0, 1]))
+        self.assertTrue(np.allclose(embed_stl.euler([0, 90, 0]) @ [0, 0, 1], [1, 0, 0]))
+
+        # The rotations are applied in turn about the fixed axes
+        r = embed_stl.euler([90, 90, 0])
+        self.assertTrue(np.allclose(r, embed_stl.euler([0, 90, 0]) @ embed_stl.euler([90, 0, 0])))
+        self.assertTrue(np.allclose(embed_stl.euler([0.5, 0, 0], degrees=False),
+                                    embed_stl.euler([np.degrees(0.5), 0, 0])))
+
+    def test_angles(self):
+
+        shift = [3.1, 2.45, 1.4]
+        ibm = embed_scene([(self.vox, shift, [0, 0, 60])], self.mesh_n, self.mesh_l)
+        ref = embed_scene([(self.vox, shift, rotation_z(np.pi / 3))], self.mesh_n, self.mesh_l)
+
+        self.assertTrue(np.array_equal(ibm, ref))
+
+    def test_scale(self):
+
+        shift = np.array([3.1, 2.45, 1.4])
+        scale = [1.5, 0.7, 1.2]
+        transform = embed_stl.transform(rotation_z(np.pi / 5), scale)
+
+        ibm = embed_scene([Placement(self.vox, shift, rotation_z(np.pi / 5), scale)],
+                          self.mesh_n, self.mesh_l)
+        ref = embed_rotated_reference(self.vox, self.mesh_n, self.mesh_l, shift, transform)
+
+        self.assertTrue(np.array_equal(ibm, ref))
+        self.assertTrue(np.any(ibm == 0.0))
+
+    def test_uniform(self):
+
+        # Doubling a box of triangles gives the box of twice the size
+        surface = rasterize.Surface(box_triangles([0, 0, 0], [1.2, 0.9, 0.5]))
+        large = rasterize.Surface(box_triangles([0, 0, 0], [2.4, 1.8, 1.0]))
+        shift = [3.05, 2.45, 1.45]
+
+        ibm = embed_stl.embed(surface, self.mesh_n, self.mesh_l, shift, scale=2)
+        ref = embed_stl.embed(large, self.mesh_n, self.mesh_l, shift)
+
+        self.assertTrue(np.array_equal(ibm, ref))
+        self.assertEqual(embed_stl.working_range(surface, self.mesh_n, self.mesh_l, shift,
+                                                 embed_stl.transform(None, 2))[0].tolist(),
+                         embed_stl.working_range(large, self.mesh_n, self.mesh_l, shift)[0].tolist())
+
+    def test_invalid(self):
+
+        with self.assertRaises(ValueError):
+            embed_stl.transform(np.eye(3), [1, 0, 1])
+        with self.assertRaises(ValueError):
+            embed_stl.transform([0, 90])
+
+def expand(blocks, shape):
+    """Expands a list of ([z,y,x] start, block) pairs into a full mask."""
+
+    ibm = np.ones(shape)
+    for start, block in blocks:
+        region = tuple(slice(s, s + n) for s, n in zip(start, block.shape))
+        ibm[region] = np.asarray(block)
+
+    return ibm
+
+class TestBlocks(unittest.TestCase):
+    """Tests embedding objects into the sub-blocks of the mesh which they cover."""
+
+    def setUp(self):
+
+        self.vox = ellipsoid([6, 8, 16], [4.0, 4.0, 4.0], [0.0, 0.0, 0.0])
+        self.mesh_n = [41, 21, 13]
+        self.mesh_l = [10.0, 5.0, 3.0]
+
+    def test_disjoint(self):
+
+        placements = [(self.vox, [2.0, 2.0, 1.5]), (self.vox, [7.5, 2.6, 1.5], rotation_z(0.4))]
+
+        blocks = embed_blocks(placements, self.mesh_n, self.mesh_l, dtype=np.uint8)
+        ref = embed_scene(placements, self.mesh_n, self.mesh_l)
+
+        self.assertEqual(len(blocks), 2)
+        self.assertLess(sum(b.size for _, b in blocks), ref.size // 2)
+        self.assertTrue(np.array_equal(expand(blocks, ref.shape), ref))
+
+    def test_merge(self):
+
+        placements = [(self.vox, [2.0, 2.0, 1.5]), (self.vox, [3.5, 2.6, 1.5]),
+                      (self.vox, [5.0, 2.2, 1.5])]
+
+        blocks = embed_blocks(placements, self.mesh_n, self.mesh_l, dtype="packed")
+        ref = embed_scene(placements, self.mesh_n, self.mesh_l)
+
+        self.assertEqual(len(blocks), 1)
+        self.assertTrue(np.array_equal(expand(blocks, ref.shape), ref))
+
+    def test_outside(self):
+
+        blocks = embed_blocks([(self.vox, [50.0, 2.0, 1.5])], self.mesh_n, self.mesh_l)
+        self.assertEqual(blocks, [])
@@ -0,0 +1,127 @@
+""" tests/test_sweep.py
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src import convert_stl
+from src import scene
+from src import sweep
+from src import writer
+from tests.helpers import CONFIG, box_triangles, write_stl
+
+class TestLoad(unittest.TestCase):
+    """Tests reading the cases of a sweep from a file."""
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+
+        self.tmp.cleanup()
+
+    def test_toml(self):
+
+        filename = os.path.join(self.tmp.name, "sweep.toml")
+        with open(filename, "w") as fh:
+            fh.write(CONFIG)
+
+        cases, settings = sweep.load(filename)
+        self.assertEqual(settings, {"workers": 2, "output_dir": "out"})
+        self.assertEqual([c.name for c in cases], ["coarse", "fine"])
+        self.assertEqual(cases[0].mesh_n, [20, 10, 5])
+        self.assertTrue(np.array_equal(cases[0].relative_offset, sweep.RELATIVE_OFFSET))
+        self.assertTrue(np.array_equal(cases[1].relative_offset, [3.0, 0.0, 0.0]))
+
+    def test_json(self):
+
+        filename = os.path.join(self.tmp.name, "sweep.json")
+        with open(filename, "w") as fh:
+            json.dump({"case": [{"name": "a", "mesh_n": [11, 11, 11], "mesh_l": [1, 1, 1]}]}, fh)
+
+        cases, settings = sweep.load(filename)
+        self.assertEqual(settings, {})
+        self.assertEqual(cases[0].mesh_n, [11, 11, 11])
+
+    def test_duplicate(self):
+
+        filename = os.path.join(self.tmp.name, "sweep.json")
+        case = {"name": "a", "mesh_n": [11, 11, 11], "mesh_l": [1, 1, 1]}
+        with open(filename, "w") as fh:
+            json.dump({"case": [case, case]}, fh)
+
+        with self.assertRaises(ValueError):
+            sweep.load(filename)
+
+class TestPlacements(unittest.TestCase):
+
+    def test_centres(self):
+
+        placements = sweep.placements(None, [8.0, 4.0, 2.0], [2.0, -1.0, 0.0])
+        self.assertTrue(np.allclose(placements[0].translation, [3.0, 2.5, 1.0]))
+        self.assertTrue(np.allclose(placements[1].translation, [5.0, 1.5, 1.0]))
+
+class TestSweep(unittest.TestCase):
+    """Tests generating the masks of a sweep against generating each case on its own."""
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stl_file = os.path.join(self.tmp.name, "box.stl")
+        write_stl(self.stl_file, box_triangles([0.0, 0.0, 0.0], [1.0, 1.0, 1.0]))
+
+        self.env = mock.patch.dict(os.environ,
+                                   {"PY4X3D2_CACHE_DIR": os.path.join(self.tmp.name, "cache")})
+        self.env.start()
+
+        self.cases = [sweep.Case("a", [41, 21, 11], [8.0, 4.0, 2.0], [3.0, 0.0, 0.0],
+                                 stl=self.stl_file),
+                      sweep.Case("b", [41, 21, 11], [8.0, 4.0, 2.0], [3.0, 0.0, 0.0], ratio=2,
+                                 stl=self.stl_file),
+                      sweep.Case("c", [33, 17, 9], [8.0, 4.0, 2.0], [4.0, 1.0, 0.0],
+                                 stl=self.stl_file),
+                      sweep.Case("d", [41, 21, 11], [8.0, 4.0, 2.0], [3.0, 0.0, 0.0],
+                                 stl=self.stl_file, rotation=[0, 0, 30], scale=0.8)]
+
+    def tearDown(self):
+
+        self.env.stop()
+        self.tmp.cleanup()
+
+    def test_single_conversion(self):
+
+        output_dir = os.path.join(self.tmp.name, "out")
+        with mock.patch.object(convert_stl, "convert", wraps=convert_stl.convert) as convert, \
+             mock.patch.object(convert_stl, "load_mesh", wraps=convert_stl.load_mesh) as load:
+            files = sweep.sweep(self.cases, output_dir, workers=2, cache=False)
+            convert.assert_called_once()
+            load.assert_called_once()
+
+        self.assertEqual(files, [os.path.join(output_dir, f"{c}.bp") for c in "abcd"])
+        self.assertTrue(all(os.path.exists(f) for f in files))
+
+    @unittest.skipUnless(writer.adios2_new_api, "reading back requires the ADIOS2 Stream API")
+    def test_masks(self):
+
+        output_dir = os.path.join(self.tmp.name, "out")
+        files = sweep.sweep(self.cases, output_dir, workers=2)
+        voxels = sweep.geometries(self.cases)[self.stl_file]
+
+        for case, filename in zip(self.cases, files):
+            expected = scene.embed_scene(sweep.placements(voxels, case.mesh_l,
+                                                          case.relative_offset, case.rotation,
+                                                          case.scale),
+                                         case.mesh_n, case.mesh_l, dtype=np.uint8)
+            ep1 = writer.read_mask(filename)
+            self.assertEqual(ep1.shape, tuple(np.flip(case.mesh_n)))
+            self.assertTrue(np.array_equal(ep1, expected))
+            self.assertGreater(np.count_nonzero(ep1 == 0), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,7 +5,9 @@ import unittest
 
 import numpy as np
     
-from src.voxel import Voxels
+from src import embed_stl
+from src.voxel import BrickVoxels, Voxels
+from tests.helpers import ellipsoid, rotation_z
 
 class TestVoxels(unittest.TestCase):
     """Tests the basic setup of the Voxels class."""
@@ -184,3 +186,162 @@ class TestQuery(unittest.TestCase):
         z = self.oz + self.lz
         q = self.vox.query([x, y, z])
         self.assertTrue(q == 1)
+
+class TestQueryMany(unittest.TestCase):
+    """Tests the batched query against the scalar query."""
+
+    def setUp(self):
+
+        self.lx = 1.0
+        self.ly = 2.0
+        self.lz = 4.0
+
+        self.nx = 10
+        self.ny = 5
+        self.nz = 20
+
+        self.sx = self.nx / self.lx
+        self.sy = self.ny / self.ly
+        self.sz = self.nz / self.lz
+
+        self.ox = 0.75
+        self.oy = -3.0
+        self.oz = 2.0
+
+        rng = np.random.default_rng(42)
+
+        # STL-to-Voxels is zyx ordered
+        self.vox = Voxels(rng.integers(0, 2, [self.nz, self.ny, self.nx], dtype=np.int8),
+                          np.array([self.sx, self.sy, self.sz]),
+                          np.array([self.ox, self.oy, self.oz]))
+
+        # Points on the voxel faces, including the lower and upper faces of the volume, and points
+        # just outside of the volume
+        x = self.ox + np.arange(-2, self.nx + 3) / self.sx
+        y = self.oy + np.arange(-2, self.ny + 3) / self.sy
+        z = self.oz + np.arange(-2, self.nz + 3) / self.sz
+        x = np.concatenate([x, [self.ox + self.lx], self.ox + rng.uniform(-0.2, 1.2, 8) * self.lx])
+        y = np.concatenate([y, [self.oy + self.ly], self.oy + rng.uniform(-0.2, 1.2, 8) * self.ly])
+        z = np.concatenate([z, [self.oz + self.lz], self.oz + rng.uniform(-0.2, 1.2, 8) * self.lz])
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def scalar(self, xyz):
+        try:
+            return self.vox.query(xyz)
+        except IndexError:
+            # The scalar query indexes past the voxel array, these points are outside
+            return 0
+
+    def test_points(self):
+
+        pts = np.stack(np.meshgrid(self.x, self.y, self.z, indexing="ij"), axis=-1).reshape(-1, 3)
+        q = self.vox.query_many(pts)
+
+        self.assertEqual(q.shape, (pts.shape[0],))
+        for p, v in zip(pts, q):
+            self.assertEqual(v, self.scalar(p))
+
+    def test_broadcast(self):
+
+        q = self.vox.query_many(self.x[np.newaxis, np.newaxis, :],
+                                self.y[np.newaxis, :, np.newaxis],
+                                self.z[:, np.newaxis, np.newaxis])
+
+        self.assertEqual(q.shape, (len(self.z), len(self.y), len(self.x)))
+        for k, z in enumerate(self.z):
+            for j, y in enumerate(self.y):
+                for i, x in enumerate(self.x):
+                    self.assertEqual(q[k, j, i], self.scalar(np.array([x, y, z])))
+
+    def test_cornerN(self):
+
+        q = self.vox.query_many([[self.ox + self.lx, self.oy + self.ly, self.oz + self.lz]])
+        self.assertEqual(q[0], self.vox.vol[-1, -1, -1])
+
+class TestBricks(TestQueryMany):
+    """Tests the brick storage against the dense voxels."""
+
+    def setUp(self):
+
+        super().setUp()
+
+        # Solid and empty regions with a noisy layer between them, which does not fill the last
+        # bricks along each axis
+        k, j, i = np.indices([self.nz, self.ny, self.nx])
+        vol = (k < 9).astype(np.int8)
+        vol[8:11] = self.vox.vol[8:11]
+        self.dense = Voxels(vol, self.vox.scale, self.vox.shift)
+        self.vox = BrickVoxels.from_voxels(self.dense, brick=4)
+
+    def scalar(self, xyz):
+        try:
+            return self.dense.query(xyz)
+        except IndexError:
+            return 0
+
+    def test_storage(self):
+
+        self.assertTrue(np.array_equal(self.vox.dense(), self.dense.vol))
+        self.assertEqual(self.vox.index.shape, (5, 2, 3))
+        self.assertTrue(np.all(self.vox.index[[0, 1, 3, 4]] < 0))
+        self.assertTrue(np.all(self.vox.fill[:2] == 1))
+        self.assertTrue(np.all(self.vox.fill[3:] == 0))
+        self.assertTrue(np.all(self.vox.index[2] >= 0))
+        self.assertTrue(np.array_equal(self.vox.count(), self.dense.count()))
+        self.assertTrue(np.array_equal(self.vox.bounding_box(), self.dense.bounding_box()))
+
+    def test_cornerN(self):
+
+        q = self.vox.query_many([[self.ox + self.lx, self.oy + self.ly, self.oz + self.lz]])
+        self.assertEqual(q[0], self.dense.vol[-1, -1, -1])
+
+class TestBrickEmbed(unittest.TestCase):
+    """Tests embedding brick voxels against the dense voxels."""
+
+    def setUp(self):
+
+        self.dense = ellipsoid([24, 20, 40], [8.0, 8.0, 8.0], [0.0, 0.0, 0.0])
+        self.mesh_n = [41, 31, 23]
+        self.mesh_l = [8.0, 6.0, 4.0]
+
+    def test_translated(self):
+
+        for brick in [4, 7, 64]:
+            bricks = BrickVoxels.from_voxels(self.dense, brick)
+            for shift in [[4.1, 3.0, 2.2], [0.5, 0.2, 3.9]]:
+                for dtype in [np.float64, "packed"]:
+                    with self.subTest(brick=brick, shift=shift, dtype=dtype):
+                        ibm = embed_stl.embed(bricks, self.mesh_n, self.mesh_l, shift, dtype=dtype)
+                        ref = embed_stl.embed(self.dense, self.mesh_n, self.mesh_l, shift,
+                                              dtype=dtype)
+                        self.assertTrue(np.array_equal(np.asarray(ibm), np.asarray(ref)))
+
+    def test_rotated(self):
+
+        bricks = BrickVoxels.from_voxels(self.dense, 8)
+        args = (self.mesh_n, self.mesh_l, [4.1, 3.0, 2.2], rotation_z(0.5))
+
+        ibm = embed_stl.embed(bricks, *args)
+        self.assertTrue(np.array_equal(ibm, embed_stl.embed(self.dense, *args)))
+        self.assertTrue(np.any(ibm == 0))
+
+    def test_skipped(self):
+
+        # Only the mixed bricks are looked up
+        bricks = BrickVoxels.from_voxels(self.dense, 4)
+        calls = []
+        original = bricks.bricks
+        class Recorder:
+            def __getitem__(self, index):
+                calls.append(index)
+                return original[index]
+
+        bricks.bricks = Recorder()
+        embed_stl.embed(bricks, self.mesh_n, self.mesh_l, [4.1, 3.0, 2.2])
+
+        self.assertGreater(len(calls), 0)
+        self.assertLessEqual(len(set(calls)), np.count_nonzero(bricks.index >= 0))
+        self.assertGreater(np.count_nonzero(bricks.fill[bricks.index < 0]), 0)
+
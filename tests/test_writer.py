@@ -0,0 +1,172 @@
+""" tests/test_writer.py
+"""
+
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import numpy as np
+
+from src import embed_stl
+from src import mask
+from src import writer
+from src.scene import embed_blocks, embed_scene, iter_scene
+from tests.helpers import ellipsoid, read_field
+
+@unittest.skipUnless(writer.adios2_new_api, "reading back requires the ADIOS2 Stream API")
+class TestWriter(unittest.TestCase):
+    """Tests writing masks in z-chunks."""
+
+    def setUp(self):
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, "ibm.bp")
+
+        self.vox = ellipsoid([12, 9, 15], [7.5, 4.5, 6.0], [0.3, -1.0, 2.0])
+        self.mesh_n = [23, 19, 17]
+        self.mesh_l = [4.0, 3.0, 5.0]
+        self.shifts = [[2.1, 1.3, 2.4], [2.6, 1.7, 2.9]]
+
+    def tearDown(self):
+
+        self.tmp.cleanup()
+
+    def test_chunks(self):
+
+        ibm = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, self.shifts[0], dtype="packed")
+        writer.write_mask(self.filename, mask.chunks(ibm, 5), ibm.shape)
+
+        ep1 = read_field(self.filename, "ep1")
+        self.assertEqual(ep1.dtype, np.float64)
+        self.assertTrue(np.array_equal(ep1, np.asarray(ibm, dtype=np.float64)))
+
+    def test_stream(self):
+
+        placements = [(self.vox, s) for s in self.shifts]
+        ref = np.ones([17, 19, 23])
+        for s in self.shifts:
+            ref *= embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, s)
+
+        chunks = iter_scene(placements, self.mesh_n, self.mesh_l, nk=4, dtype=np.uint8)
+        writer.write_mask(self.filename, chunks, ref.shape)
+
+        self.assertTrue(np.array_equal(read_field(self.filename, "ep1"), ref))
+        self.assertEqual(read_field(self.filename, "iibm"), 1)
+
+    def test_sparse(self):
+
+        placements = [(self.vox, s) for s in [[1.0, 0.9, 1.2], [3.0, 2.1, 3.8]]]
+        blocks = embed_blocks(placements, self.mesh_n, self.mesh_l, dtype=np.uint8)
+        ref = embed_scene(placements, self.mesh_n, self.mesh_l)
+        self.assertEqual(len(blocks), 2)
+
+        for encoding in writer.ENCODINGS:
+            with self.subTest(encoding=encoding):
+                writer.write_sparse_mask(self.filename, blocks, ref.shape, encoding=encoding)
+
+                self.assertTrue(np.array_equal(writer.read_mask(self.filename), ref))
+                self.assertEqual(read_field(self.filename, "iibm"), 1)
+
+    def test_sparse_plain_read(self):
+        # A plain read, as x3d2 does, finds no ep1 rather than unwritten points reading as solid
+
+        ibm = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, self.shifts[0], dtype=np.uint8)
+        writer.write_mask(self.filename, mask.chunks(ibm), ibm.shape)
+        self.assertTrue(np.array_equal(read_field(self.filename, "ep1"), ibm))
+
+        blocks = embed_blocks([(self.vox, self.shifts[0])], self.mesh_n, self.mesh_l)
+        for encoding in writer.ENCODINGS:
+            with self.subTest(encoding=encoding):
+                writer.write_sparse_mask(self.filename, blocks, ibm.shape, encoding=encoding)
+                with writer.Stream(self.filename, "r") as s:
+                    for _ in s.steps():
+                        self.assertNotIn("ep1", s.available_variables())
+                self.assertTrue(np.array_equal(writer.read_mask(self.filename), ibm))
+
+    def test_sparse_empty(self):
+
+        writer.write_sparse_mask(self.filename, [], [17, 19, 23], encoding="rle")
+        self.assertTrue(np.all(writer.read_mask(self.filename) == 1))
+
+    def test_dense(self):
+
+        ibm = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, self.shifts[0])
+        writer.write_mask(self.filename, mask.chunks(ibm), ibm.shape)
+
+        self.assertTrue(np.array_equal(writer.read_mask(self.filename), ibm))
+
+    def test_compression(self):
+
+        ibm = embed_stl.embed(self.vox, self.mesh_n, self.mesh_l, self.shifts[0], dtype=np.uint8)
+
+        # Unavailable operators fall back to writing uncompressed, the lossless operators are
+        # tested when the ADIOS2 build provides them
+        for compression in [["unknown"], "blosc", "bzip2"]:
+            with self.subTest(compression=compression):
+                with redirect_stdout(io.StringIO()):
+                    writer.write_mask(self.filename, mask.chunks(ibm, 5), ibm.shape,
+                                      compression=compression)
+
+                self.assertTrue(np.array_equal(read_field(self.filename, "ep1"), ibm))
+
+class TestOperations(unittest.TestCase):
+    """Tests choosing the ADIOS2 compression operator."""
+
+    def test_none(self):
+
+        self.assertIsNone(writer.operations(None))
+        with redirect_stdout(io.StringIO()) as out:
+            self.assertIsNone(writer.operations(["unknown"]))
+        self.assertIn("writing uncompressed", out.getvalue())
+
+    def test_preference(self):
+
+        with mock.patch.object(writer, "operator_available", side_effect=lambda n: n == "bzip2"):
+            self.assertEqual(writer.operations(["blosc", "bzip2"]),
+                             [("bzip2", writer.OPERATORS["bzip2"])])
+            with redirect_stdout(io.StringIO()):
+                self.assertIsNone(writer.operations("blosc"))
+
+    def test_parameters(self):
+
+        with mock.patch.object(writer, "operator_available", return_value=True):
+            self.assertEqual(writer.operations(("zfp", {"rate": 8})), [("zfp", {"rate": "8"})])
+
+    def test_lossy(self):
+        # Lossy operators only compress the fields other than the masks
+
+        self.assertTrue(writer.is_mask("ep1"))
+        self.assertTrue(writer.is_mask(writer.sparse_name("ep1")))
+        self.assertFalse(writer.is_mask("dist"))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ["zfp", "blosc"]:
+                ops = [(name, {})]
+                with mock.patch.object(writer, "operations", return_value=ops), \
+                     redirect_stdout(io.StringIO()) as out, \
+                     writer.MaskWriter(os.path.join(tmp, f"{name}.bp"), [2, 2, 2]) as w:
+                    self.assertEqual(w.operations, ops)
+
+                lossy = name in writer.LOSSY
+                self.assertEqual(w.mask_operations, None if lossy else ops)
+                self.assertEqual("lossy" in out.getvalue(), lossy)
+
+class TestEncoding(unittest.TestCase):
+    """Tests the run-length and bitmask encodings of sparse blocks."""
+
+    def test_roundtrip(self):
+
+        rng = np.random.default_rng(3)
+        for block in [rng.integers(0, 2, [5, 6, 7]), np.zeros([2, 3, 4]), np.ones([3, 1, 9])]:
+            block = block.astype(np.uint8)
+            self.assertTrue(np.array_equal(writer._unrle(writer._rle(block), block.shape), block))
+            self.assertTrue(np.array_equal(writer._unbitmask(writer._bitmask(block), block.shape),
+                                           block))
+
+    def test_runs(self):
+
+        block = np.array([0, 0, 1, 1, 1, 0]).reshape(1, 1, 6)
+        self.assertEqual(list(writer._rle(block)), [0, 2, 3, 1])